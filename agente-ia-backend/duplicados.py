@@ -0,0 +1,30 @@
+"""Reporte de alumnos duplicados en los datos ya cargados.
+
+Agrupa los alumnos que comparten email o teléfono (normalizados: sin
+mayúsculas, solo los dígitos del teléfono) o nombre + apellido + sede. Solo
+lee, así que puede correr con el servidor levantado:
+
+    PYTHONPATH=. python duplicados.py
+    PYTHONPATH=. python duplicados.py --campos email,telefono --json
+"""
+import argparse
+import json
+
+from src.agent.agent.unicidad import ETIQUETAS, NORMALIZADORES, reporte_duplicados
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Informa los alumnos duplicados.")
+    parser.add_argument("--campos", default=",".join(NORMALIZADORES), help="campos a comparar (email, telefono, nombre)")
+    parser.add_argument("--json", action="store_true", help="imprimir el reporte completo en JSON")
+    args = parser.parse_args()
+
+    reporte = reporte_duplicados([c.strip() for c in args.campos.split(",") if c.strip()])
+    if args.json:
+        print(json.dumps(reporte, indent=2, ensure_ascii=False))
+    else:
+        for grupo in reporte["grupos"]:
+            print(f"{ETIQUETAS[grupo['campo']]} {grupo['valor']!r}:")
+            for alumno in grupo["alumnos"]:
+                print(f"  {alumno['id']}  {alumno.get('nombre', '')} {alumno.get('apellido', '')}  "
+                      f"{alumno.get('email', '')}  {alumno.get('telefono', '')}  {alumno.get('sede', '')}")
+        print(f"{len(reporte['grupos'])} grupos de duplicados, {reporte['alumnos_afectados']} alumnos afectados.")
@@ -0,0 +1,29 @@
+"""Facturación del mes: genera el pago 'Pendiente' de cada alumno activo.
+
+Escribe directo en los archivos de src/agent/data (con los mismos locks que el
+backend, así que puede correr con el servidor levantado, p. ej. desde cron):
+
+    PYTHONPATH=. python facturar.py                # mes actual
+    PYTHONPATH=. python facturar.py 2025 6 --simular
+
+Correrlo de nuevo para el mismo mes no duplica cuotas.
+"""
+import argparse
+import datetime
+
+from src.agent.agent.facturacion import CUOTA_DEFAULT, facturar
+
+if __name__ == "__main__":
+    hoy = datetime.date.today()
+    parser = argparse.ArgumentParser(description="Genera las cuotas pendientes del mes.")
+    parser.add_argument("anio", type=int, nargs="?", default=hoy.year, metavar="año")
+    parser.add_argument("mes", type=int, nargs="?", default=hoy.month)
+    parser.add_argument("--monto", type=float, help=f"monto para todos (por defecto precio_mensual o {CUOTA_DEFAULT})")
+    parser.add_argument("--simular", action="store_true", help="solo informar, sin escribir")
+    args = parser.parse_args()
+
+    resumen = facturar(args.mes, args.anio, args.monto, args.simular)
+    print(f"{resumen['mes']:02d}/{resumen['año']}: {resumen['alumnos_activos']} alumnos activos, "
+          f"{resumen['pagos_generados']} cuotas generadas (${resumen['monto_total']}), {resumen['ya_facturados']} ya estaban")
+    print(f"estado_pago: {resumen['estado_pago']} ({resumen['estados_actualizados']} cambiados)")
+    print("Simulación: no se escribió nada." if args.simular else "Facturación terminada.")
@@ -0,0 +1,35 @@
+"""Importación masiva de alumnos, pagos, notas o asistencias desde CSV o NDJSON.
+
+Escribe directo en los archivos de src/agent/data (con los mismos locks que el
+backend, así que puede correr con el servidor levantado):
+
+    PYTHONPATH=. python importar.py alumnos nuevos_alumnos.csv
+    PYTHONPATH=. python importar.py pagos historico_pagos.ndjson.gz --simular
+
+Los pagos, notas y asistencias referencian al alumno con 'alumno_id' o por
+nombre completo ('alumno', o 'alumno_nombre' + 'alumno_apellido').
+"""
+import argparse
+import sys
+
+from src.agent.agent.importacion import ESQUEMAS, FORMATOS, TAMANO_LOTE, importar
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importa filas CSV/NDJSON a una colección.")
+    parser.add_argument("coleccion", choices=sorted(ESQUEMAS))
+    parser.add_argument("archivo")
+    parser.add_argument("--formato", choices=FORMATOS, help="por defecto se deduce de la extensión")
+    parser.add_argument("--simular", action="store_true", help="solo validar, sin escribir")
+    parser.add_argument("--lote", type=int, default=TAMANO_LOTE, help="registros por escritura")
+    args = parser.parse_args()
+
+    formato = args.formato or ("ndjson" if ".ndjson" in args.archivo or ".jsonl" in args.archivo else "csv")
+    with open(args.archivo, "rb") as archivo:
+        for paso in importar(args.coleccion, archivo, formato, args.simular, args.lote):
+            print(f"procesadas {paso['procesadas']}, importadas {paso['importadas']}, errores {paso['errores']}")
+    for error in paso["detalle_errores"]:
+        print(f"  fila {error['fila']}: {error['error']}")
+    if paso["errores"] > len(paso["detalle_errores"]):
+        print(f"  ... y {paso['errores'] - len(paso['detalle_errores'])} errores más")
+    print("Simulación: no se escribió nada." if args.simular else "Importación terminada.")
+    sys.exit(1 if paso["errores"] else 0)
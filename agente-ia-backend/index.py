@@ -1,17 +1,22 @@
+import time
+_INICIO_IMPORT = time.perf_counter()
+
+from contextlib import aclosing, asynccontextmanager, suppress
 from fastapi import FastAPI, Request
-from typing import Dict, Any, List
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from typing import Dict, Any, List, Awaitable, Callable
+import asyncio
+import datetime
+import importlib.util
+import inspect
+import json
 import os
+import tempfile
+import threading
 
-# Importar Google ADK
-try:
-    from google.adk.agents import Agent
-    from google.adk.runners import Runner
-    from google.adk.sessions import InMemorySessionService
-    from google.genai import types
-    google_adk_available = True
-except ImportError:
-    google_adk_available = False
-    Agent = None
+# Google ADK se importa recién cuando se usa el agente (ver inicializar_agente):
+# importarlo cuesta más de un segundo y los endpoints CRUD no lo necesitan.
+google_adk_available = importlib.util.find_spec("google.adk") is not None
 
 # Importamos nuestras funciones del agente (ajustado para import absoluto)
 from src.agent.agent.agent import (
@@ -25,70 +30,283 @@ from src.agent.agent.agent import (
     saludo_alerta,
     get_sudo_users
 )
+from src.agent.agent.busqueda import buscar_notas, indice_notas
+from src.agent.agent.citas import crud_citas
+from src.agent.agent.facturacion import facturar_mes, numero_mes
+from src.agent.agent.ocupacion import ocupacion_por_turno, tendencia_ocupacion
+from src.agent.agent.tareas import estado_trabajo, iniciar_trabajo
+from src.agent.agent.unicidad import duplicados_alumnos
+from src.agent.agent.agent_async import (
+    crud_alumnos_async,
+    crud_pagos_async,
+    crud_notas_async,
+    crud_asistencias_async,
+    crud_citas_async,
+    resumen_alumno_async,
+    listar_nombres_alumnos_async,
+    ultimo_pago_alumno_async,
+    buscar_notas_async,
+    checkin_async,
+    duplicados_alumnos_async,
+    ocupacion_por_turno_async,
+    tendencia_ocupacion_async,
+    facturar_mes_async,
+    saludo_alerta_async,
+    get_sudo_users_async,
+    un_solo_vuelo
+)
+from src.agent.agent import store
+from src.agent.agent import checkin
+from src.agent.agent import ocupacion
+from src.agent.agent import permisos
+from src.agent.agent import exportar
+from src.agent.agent import importacion
+from src.agent.agent import salida
+from src.agent.agent import atajos
+from src.agent.agent import despacho
+from src.agent.agent import tareas
+
+# Tiempos de arranque en milisegundos, expuestos en /health para detectar regresiones.
+# Para el detalle módulo por módulo: PYTHONPATH=. python -X importtime -c "import index"
+TIEMPOS_ARRANQUE: Dict[str, Any] = {"import_ms": None, "agente_ms": None, "precarga_ms": None}
+
+# AGENTE_PRECALENTAR=0 deja la construcción del agente para el primer /agente_ia/
+PRECALENTAR_AGENTE = os.environ.get("AGENTE_PRECALENTAR", "1") != "0"
+# AGENTE_ATAJOS=0 manda todos los mensajes de /agente_ia/ al modelo (sin atajos.py)
+USAR_ATAJOS = os.environ.get("AGENTE_ATAJOS", "1") != "0"
+# AGENTE_TRABAJOS_PROGRAMADOS="" desactiva los trabajos programados (ver tareas.py)
+# AGENTE_VIGILAR=0 desactiva el vigilante de src/agent/data (se vuelve a hacer stat en cada lectura)
+VIGILAR_DATOS = os.environ.get("AGENTE_VIGILAR", "1") != "0"
+
+async def _precalentar():
+    """Precarga los datos y (opcionalmente) el agente sin bloquear el arranque del servidor."""
+    inicio = time.perf_counter()
+    cantidades = await asyncio.to_thread(store.precargar)
+    TIEMPOS_ARRANQUE["precarga_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+    print(f"Datos precargados en {TIEMPOS_ARRANQUE['precarga_ms']} ms: {cantidades}")
+    await asyncio.to_thread(permisos.tabla_permisos)
+    await asyncio.to_thread(indice_notas)
+    await asyncio.to_thread(ocupacion.rollup.sincronizar)
+    if VIGILAR_DATOS:
+        await asyncio.to_thread(store.iniciar_vigilancia)
+    if PRECALENTAR_AGENTE and google_adk_available:
+        await asyncio.to_thread(inicializar_agente)
+
+# Long-poll de /changes: un Event por "generación" de cambios. Cuando llega un
+# cambio se setea el actual (despierta a todos los que esperan) y se crea otro.
+_hay_cambios: asyncio.Event = None
+_loop: asyncio.AbstractEventLoop = None
+
+def _avisar_cambios():
+    global _hay_cambios
+    evento, _hay_cambios = _hay_cambios, asyncio.Event()
+    evento.set()
+
+def _avisar_cambios_threadsafe():
+    # Lo llama el thread que escribió (o el vigilante): el Event es del event loop
+    if _loop is not None and not _loop.is_closed():
+        _loop.call_soon_threadsafe(_avisar_cambios)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _hay_cambios, _loop
+    _hay_cambios, _loop = asyncio.Event(), asyncio.get_running_loop()
+    store.registro_cambios.oyentes.append(_avisar_cambios_threadsafe)
+    tarea = asyncio.create_task(_precalentar())
+    tareas.iniciar()
+    yield
+    tareas.detener()
+    await asyncio.to_thread(checkin.agrupador.detener)
+    store.registro_cambios.oyentes.remove(_avisar_cambios_threadsafe)
+    tarea.cancel()
+    store.detener_vigilancia()
+    store.cerrar_remoto()
+    despacho.detener()
 
 # Creamos una instancia de FastAPI
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
-# Inicializar el agente de Google ADK si está disponible
+@app.middleware("http")
+async def usuario_sudo(request: Request, call_next):
+    # El usuario SUDO del header queda en un contextvar: lo ven las tools (también
+    # las que llama el agente) y requiere_permiso lo chequea contra los permisos compilados
+    token = permisos.usuario_actual.set(request.headers.get("x-sudo-user"))
+    try:
+        return await call_next(request)
+    finally:
+        permisos.usuario_actual.reset(token)
+
+@app.middleware("http")
+async def instantanea_por_request(request: Request, call_next):
+    # Todo lo que lee un request (también las tools en threads y las respuestas en
+    # streaming) ve las colecciones de un mismo momento, sin tomar locks
+    with store.instantanea():
+        return await call_next(request)
+
+# El agente de Google ADK se construye la primera vez que se lo necesita
 root_agent = None
 session_service = None
 runner = None
+types = None
+agente_error = None
+_agente_lock = threading.Lock()
 APP_NAME = "gimnasia_app"
 USER_ID = "usuario1"
 SESSION_ID = "sesion1"
-if google_adk_available:
-    try:
-        print("Iniciando configuración del agente Google ADK...")
-        tools = [
-            crud_alumnos,
-            crud_pagos,
-            crud_notas,
-            crud_asistencias,
-            resumen_alumno,
-            listar_nombres_alumnos,
-            ultimo_pago_alumno,
-            saludo_alerta,
-            get_sudo_users
-        ]
-        print(f"Tools configuradas: {len(tools)}")
-        root_agent = Agent(
-            name="GymManagementAgent",
-            description="Agente para gestión de gimnasio con funciones CRUD para alumnos, pagos, notas y asistencias",
-            tools=tools
-        )
-        session_service = InMemorySessionService()
-        session_service.create_session(app_name=APP_NAME, user_id=USER_ID, session_id=SESSION_ID)
-        runner = Runner(agent=root_agent, app_name=APP_NAME, session_service=session_service)
-        print("Agente inicializado exitosamente")
-    except Exception as e:
-        print(f"Error detallado inicializando Google ADK Agent: {e}")
-        import traceback
-        traceback.print_exc()
-        root_agent = None
-        session_service = None
-        runner = None
-else:
-    print("Google ADK no está disponible")
+# AGENTE_LLM=stub reemplaza a Gemini por el modelo local de stub_llm.py (pruebas de carga)
+USAR_STUB_LLM = os.environ.get("AGENTE_LLM", "").lower() == "stub"
+stub_llm = None
+sesiones_creadas = set()
+# Dónde guardar las conversaciones: "memoria" (por proceso) o "sqlite" (archivo local
+# compartido por todos los workers). En modo multiproceso el default es sqlite, si no
+# cada worker tendría su propia historia y las conversaciones se perderían entre requests.
+BACKEND_SESIONES = os.environ.get("AGENTE_SESIONES", "sqlite" if store.MULTIPROCESO else "memoria").lower()
+SESIONES_DB_PATH = os.environ.get("AGENTE_SESIONES_DB", os.path.join(store.BASE_DATA_PATH, "sesiones.db"))
+
+def crear_session_service():
+    """Arma el session service de ADK según AGENTE_SESIONES."""
+    if BACKEND_SESIONES == "sqlite":
+        try:
+            from google.adk.sessions.sqlite_session_service import SqliteSessionService
+            print(f"Sesiones persistidas en SQLite: {SESIONES_DB_PATH}")
+            return SqliteSessionService(db_path=SESIONES_DB_PATH)
+        except ImportError:
+            # Versiones de ADK sin SqliteSessionService: mismo archivo vía SQLAlchemy
+            from google.adk.sessions import DatabaseSessionService
+            print(f"Sesiones persistidas en SQLite (DatabaseSessionService): {SESIONES_DB_PATH}")
+            return DatabaseSessionService(db_url=f"sqlite+aiosqlite:///{SESIONES_DB_PATH}")
+    if BACKEND_SESIONES != "memoria":
+        print(f"AGENTE_SESIONES={BACKEND_SESIONES} no reconocido, uso sesiones en memoria")
+    from google.adk.sessions import InMemorySessionService
+    return InMemorySessionService()
+
+def inicializar_agente():
+    """Importa Google ADK y arma Agent, session service y Runner (una sola vez)."""
+    global root_agent, session_service, runner, types, stub_llm, agente_error
+    if runner is not None or agente_error is not None or not google_adk_available:
+        return
+    with _agente_lock:
+        if runner is not None or agente_error is not None:
+            return
+        inicio = time.perf_counter()
+        try:
+            print("Iniciando configuración del agente Google ADK...")
+            from google.adk.agents import Agent
+            from google.adk.runners import Runner
+            from google.genai import types as genai_types
+            # Las respuestas que ve el modelo se recortan a un presupuesto de tokens por tool (ver salida.py)
+            # y las lecturas pedidas en un mismo turno corren en paralelo (ver despacho.py)
+            tools = [despacho.despachar(salida.acotar(tool), LECTURAS_CITAS if tool is crud_citas else LECTURAS_CRUD,
+                                        escribe=tool in (facturar_mes, iniciar_trabajo)) for tool in [
+                crud_alumnos,
+                crud_pagos,
+                crud_notas,
+                crud_asistencias,
+                crud_citas,
+                resumen_alumno,
+                listar_nombres_alumnos,
+                ultimo_pago_alumno,
+                buscar_notas,
+                duplicados_alumnos,
+                ocupacion_por_turno,
+                tendencia_ocupacion,
+                facturar_mes,
+                iniciar_trabajo,
+                estado_trabajo,
+                saludo_alerta,
+                get_sudo_users
+            ]]
+            print(f"Tools configuradas: {len(tools)}")
+            agent_kwargs = {}
+            if USAR_STUB_LLM:
+                from src.agent.agent.stub_llm import StubLlm
+                stub_llm = StubLlm()
+                agent_kwargs["model"] = stub_llm
+                print("Usando modelo stub local (AGENTE_LLM=stub)")
+            agente = Agent(
+                name="GymManagementAgent",
+                description="Agente para gestión de gimnasio con funciones CRUD para alumnos, pagos, notas y asistencias",
+                tools=tools,
+                **agent_kwargs
+            )
+            session_service = crear_session_service()
+            types = genai_types
+            root_agent = agente
+            # runner se asigna al final: es lo que marca que el agente está listo
+            runner = Runner(agent=root_agent, app_name=APP_NAME, session_service=session_service)
+            print("Agente inicializado exitosamente")
+        except Exception as e:
+            print(f"Error detallado inicializando Google ADK Agent: {e}")
+            import traceback
+            traceback.print_exc()
+            agente_error = str(e)
+            root_agent = None
+            session_service = None
+            runner = None
+        TIEMPOS_ARRANQUE["agente_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+        print(f"Construcción del agente: {TIEMPOS_ARRANQUE['agente_ms']} ms")
+
+async def asegurar_sesion(session_id: str):
+    """Crea la sesión en el session service la primera vez que se usa."""
+    if session_id in sesiones_creadas:
+        return
+    # Según la versión de ADK estos métodos son síncronos o corutinas
+    sesion = session_service.get_session(app_name=APP_NAME, user_id=USER_ID, session_id=session_id)
+    if inspect.isawaitable(sesion):
+        sesion = await sesion
+    if sesion is None:
+        try:
+            creada = session_service.create_session(app_name=APP_NAME, user_id=USER_ID, session_id=session_id)
+            if inspect.isawaitable(creada):
+                await creada
+        except Exception:
+            # Con sesiones compartidas otro worker pudo haberla creado recién
+            sesion = session_service.get_session(app_name=APP_NAME, user_id=USER_ID, session_id=session_id)
+            if inspect.isawaitable(sesion):
+                sesion = await sesion
+            if sesion is None:
+                raise
+    sesiones_creadas.add(session_id)
 
 # Y en el endpoint, mejorar el manejo de errores:
 @app.post("/agente_ia/")
 async def run_agent(request: Request):
     print(f"Recibida solicitud en /agente_ia/. ADK disponible: {google_adk_available}, Agente: {root_agent is not None}")
+    try:
+        data = await request.json()
+    except ValueError as e:
+        return {"status": "error", "message": f"Error procesando solicitud: {str(e)}",
+                "response": "Lo siento, ocurrió un error procesando tu solicitud."}
+    message = data.get("message", "") if isinstance(data, dict) else None
+    if not isinstance(message, str):
+        return JSONResponse({"status": "error", "message": "'message' debe ser un texto.",
+                             "response": "Lo siento, no entendí el mensaje."}, status_code=422)
+    if USAR_ATAJOS:
+        # Pedidos de fórmula: se responden con las tools directamente, sin el modelo
+        atajo = await atajos.responder(message)
+        if atajo is not None:
+            print(f"Respondido con el atajo {atajo[0]}")
+            return {"status": "success", "response": atajo[1], "message": "Procesado exitosamente", "atajo": atajo[0]}
     if not google_adk_available:
         return {"status": "error", "message": "Google ADK no está instalado. Instálalo con 'pip install google-adk'"}
+    if runner is None:
+        # Primer uso (o precalentamiento todavía en curso): construir fuera del event loop
+        await asyncio.to_thread(inicializar_agente)
     if not root_agent or not runner or not session_service:
         return {"status": "error", "message": "El agente no pudo ser inicializado"}
     try:
-        data = await request.json()
-        message = data.get("message", "")
+        # Cada cliente puede mantener su propia conversación; por defecto se comparte SESSION_ID
+        session_id = data.get("session_id") or SESSION_ID
         print(f"Procesando mensaje: {message}")
+        await asegurar_sesion(session_id)
         content = types.Content(role="user", parts=[types.Part(text=message)])
-        events = runner.run(user_id=USER_ID, session_id=SESSION_ID, new_message=content)
+        # run_async no bloquea el event loop mientras el modelo responde
         respuesta = None
-        for event in events:
-            if event.is_final_response():
-                respuesta = event.content.parts[0].text if event.content and event.content.parts else None
-                break
+        async with aclosing(runner.run_async(user_id=USER_ID, session_id=session_id, new_message=content)) as events:
+            async for event in events:
+                if event.is_final_response():
+                    respuesta = event.content.parts[0].text if event.content and event.content.parts else None
+                    break
         print(f"Respuesta del agente: {respuesta}")
         return {
             "status": "success",
@@ -105,64 +323,301 @@ async def run_agent(request: Request):
             "response": "Lo siento, ocurrió un error procesando tu solicitud."
         }
 
+@app.get("/agente_ia/stub_stats")
+async def stub_stats():
+    """Cantidad de llamadas a cada tool pedidas por el modelo stub (solo con AGENTE_LLM=stub)."""
+    if not stub_llm:
+        return {"status": "error", "message": "El modelo stub no está activo (AGENTE_LLM=stub)", "data": None}
+    return {"status": "success", "message": "Llamadas a tools del modelo stub.", "data": stub_llm.estadisticas()}
+
 # Definimos los endpoints de la API que corresponden a nuestras herramientas
 # Cada endpoint recibirá los datos necesarios en el body de la solicitud POST
 
+# Acciones de solo lectura de cada tool crud_* (las únicas que llevan ETag)
+LECTURAS_CRUD = ('read',)
+LECTURAS_CITAS = ('read', 'disponibilidad', 'huecos', 'calendario')
+
+async def respuesta_condicional(request: Request, colecciones: List[str], body: Any, calcular: Callable[[], Awaitable[Any]]):
+    """Responde una lectura con ETag y devuelve 304 si el cliente ya tiene esa versión.
+
+    El ETag depende de las versiones de las colecciones que usa la respuesta,
+    del body y del usuario SUDO (los permisos cambian el resultado), así que
+    un poll sin cambios no lee ni serializa nada. Sale de la misma instantánea
+    de la que se lee la respuesta: calcularlo fija esas versiones para el resto
+    del request (y el single-flight solo junta lecturas con las mismas versiones).
+    """
+    etiquetar = lambda: store.etag(colecciones + [store.SUDO_USERS_PATH], body, permisos.usuario_actual.get())
+    with store.instantanea():
+        valor = etiquetar()
+        cabeceras = {"ETag": valor, "Cache-Control": "no-cache"}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and (if_none_match.strip() == "*" or valor in [e.strip() for e in if_none_match.split(",")]):
+            return Response(status_code=304, headers=cabeceras)
+        datos = await calcular()
+        if etiquetar() != valor:
+            # Algo que la instantánea no fija (p. ej. una colección remota) cambió mientras se leía:
+            # sin ETag, así el cliente no guarda esta respuesta con una versión que puede no ser la suya
+            del cabeceras["ETag"]
+    return JSONResponse(datos, headers=cabeceras)
+
 @app.post("/crud_alumnos/")
-async def handle_crud_alumnos(data: Dict[str, Any]):
+async def handle_crud_alumnos(data: Dict[str, Any], request: Request):
     action = data.get("action")
     tool_data = data.get("data", {})
-    return crud_alumnos(action=action, data=tool_data)
+    if action in LECTURAS_CRUD:
+        return await respuesta_condicional(request, [store.ALUMNOS_PATH], data, lambda: crud_alumnos_async(action=action, data=tool_data))
+    return await crud_alumnos_async(action=action, data=tool_data)
 
 @app.post("/crud_pagos/")
-async def handle_crud_pagos(data: Dict[str, Any]):
+async def handle_crud_pagos(data: Dict[str, Any], request: Request):
     action = data.get("action")
     tool_data = data.get("data", {})
-    return crud_pagos(action=action, data=tool_data)
+    if action in LECTURAS_CRUD:
+        return await respuesta_condicional(request, [store.PAGOS_PATH], data, lambda: crud_pagos_async(action=action, data=tool_data))
+    return await crud_pagos_async(action=action, data=tool_data)
 
 @app.post("/crud_notas/")
-async def handle_crud_notas(data: Dict[str, Any]):
+async def handle_crud_notas(data: Dict[str, Any], request: Request):
     action = data.get("action")
     tool_data = data.get("data", {})
-    return crud_notas(action=action, data=tool_data)
+    if action in LECTURAS_CRUD:
+        return await respuesta_condicional(request, [store.NOTAS_PATH], data, lambda: crud_notas_async(action=action, data=tool_data))
+    return await crud_notas_async(action=action, data=tool_data)
 
 @app.post("/crud_asistencias/")
-async def handle_crud_asistencias(data: Dict[str, Any]):
+async def handle_crud_asistencias(data: Dict[str, Any], request: Request):
+    action = data.get("action")
+    tool_data = data.get("data", {})
+    if action in LECTURAS_CRUD:
+        return await respuesta_condicional(request, [store.ASISTENCIAS_PATH], data, lambda: crud_asistencias_async(action=action, data=tool_data))
+    return await crud_asistencias_async(action=action, data=tool_data)
+
+@app.post("/crud_citas/")
+async def handle_crud_citas(data: Dict[str, Any], request: Request):
     action = data.get("action")
     tool_data = data.get("data", {})
-    return crud_asistencias(action=action, data=tool_data)
+    if action in LECTURAS_CITAS:
+        return await respuesta_condicional(request, [store.CITAS_PATH], data, lambda: crud_citas_async(action=action, data=tool_data))
+    return await crud_citas_async(action=action, data=tool_data)
 
 @app.post("/resumen_alumno/")
-async def handle_resumen_alumno(data: Dict[str, Any]):
+async def handle_resumen_alumno(data: Dict[str, Any], request: Request):
     alumno_id = data.get("alumno_id")
     if not alumno_id:
         return {"status": "error", "message": "Falta el alumno_id", "resumen": None}
-    return resumen_alumno(alumno_id=alumno_id)
+    colecciones = [store.ALUMNOS_PATH, store.PAGOS_PATH, store.NOTAS_PATH, store.ASISTENCIAS_PATH]
+    return await respuesta_condicional(request, colecciones, data, lambda: resumen_alumno_async(alumno_id=alumno_id))
 
 @app.post("/listar_nombres_alumnos/")
-async def handle_listar_nombres_alumnos():
-    return listar_nombres_alumnos()
+async def handle_listar_nombres_alumnos(request: Request):
+    return await respuesta_condicional(request, [store.ALUMNOS_PATH], None, listar_nombres_alumnos_async)
 
 @app.post("/ultimo_pago_alumno/")
-async def handle_ultimo_pago_alumno(data: Dict[str, Any]):
+async def handle_ultimo_pago_alumno(data: Dict[str, Any], request: Request):
     nombre = data.get("nombre")
     apellido = data.get("apellido")
     if not nombre or not apellido:
          return {"status": "error", "message": "Faltan nombre o apellido", "data": None}
-    return ultimo_pago_alumno(nombre=nombre, apellido=apellido)
+    return await respuesta_condicional(request, [store.ALUMNOS_PATH, store.PAGOS_PATH], data,
+                                       lambda: ultimo_pago_alumno_async(nombre=nombre, apellido=apellido))
+
+@app.post("/buscar_notas/")
+async def handle_buscar_notas(data: Dict[str, Any], request: Request):
+    consulta = data.get("consulta")
+    if not consulta:
+        return {"status": "error", "message": "Falta la consulta", "data": None}
+    return await respuesta_condicional(request, [store.NOTAS_PATH, store.ALUMNOS_PATH], data,
+                                       lambda: buscar_notas_async(consulta=consulta, tipo=data.get("tipo"),
+                                                                  visible_en_reporte=data.get("visible_en_reporte"),
+                                                                  limite=data.get("limite") or 20))
+
+@app.post("/checkin/")
+async def handle_checkin(data: Dict[str, Any]):
+    # Un check-in ({"alumno_id", "fecha"?, "hora"?, "sede"?}) o varios juntos en "checkins" (p. ej. desde un molinete)
+    if isinstance(data.get("checkins"), list):
+        resultados = await asyncio.gather(*(checkin_async(d if isinstance(d, dict) else {}) for d in data["checkins"]))
+        errores = sum(r["status"] != "success" for r in resultados)
+        return {"status": "success" if not errores else "error",
+                "message": f"{len(resultados) - errores} check-ins registrados, {errores} con error.", "data": resultados}
+    return await checkin_async(data)
+
+@app.post("/duplicados_alumnos/")
+async def handle_duplicados_alumnos(request: Request):
+    return await respuesta_condicional(request, [store.ALUMNOS_PATH], None, duplicados_alumnos_async)
+
+@app.post("/ocupacion_por_turno/")
+async def handle_ocupacion_por_turno(data: Dict[str, Any], request: Request):
+    # {"desde"?, "hasta"?, "sede"?, "shift_id"?}: asistencias por sede/turno y día de la semana
+    try:
+        ocupacion.rango_mapa(data.get("desde"), data.get("hasta"))
+    except ValueError as e:
+        return JSONResponse({"status": "error", "message": str(e), "data": None}, status_code=400)
+    return await respuesta_condicional(request, [store.ASISTENCIAS_PATH, store.ALUMNOS_PATH], data,
+                                       lambda: ocupacion_por_turno_async(desde=data.get("desde"), hasta=data.get("hasta"),
+                                                                         sede=data.get("sede"), shift_id=data.get("shift_id")))
+
+@app.post("/tendencia_ocupacion/")
+async def handle_tendencia_ocupacion(data: Dict[str, Any], request: Request):
+    # {"desde"?, "hasta"?, "agrupar"?: dia|semana|mes, "sede"?, "shift_id"?}; sin hasta el rango termina hoy
+    if (data.get("agrupar") or 'semana') not in ocupacion.AGRUPACIONES:
+        return JSONResponse({"status": "error", "message": f"agrupar tiene que ser uno de: {', '.join(ocupacion.AGRUPACIONES)}",
+                             "data": None}, status_code=400)
+    try:
+        ocupacion.rango_tendencia(data.get("desde"), data.get("hasta"))
+    except ValueError as e:
+        return JSONResponse({"status": "error", "message": str(e), "data": None}, status_code=400)
+    return await respuesta_condicional(request, [store.ASISTENCIAS_PATH, store.ALUMNOS_PATH], [data, datetime.date.today().isoformat()],
+                                       lambda: tendencia_ocupacion_async(desde=data.get("desde"), hasta=data.get("hasta"),
+                                                                         agrupar=data.get("agrupar") or 'semana',
+                                                                         sede=data.get("sede"), shift_id=data.get("shift_id")))
+
+@app.post("/facturar_mes/")
+async def handle_facturar_mes(data: Dict[str, Any]):
+    mes = data.get("mes")
+    anio = data.get("año", data.get("anio"))
+    if not mes or not anio:
+        return {"status": "error", "message": "Faltan mes o año", "data": None}
+    try:
+        # El mes puede venir como número o por nombre ("junio")
+        mes, anio = numero_mes(mes), int(anio)
+    except (TypeError, ValueError):
+        return JSONResponse({"status": "error", "message": f"Mes o año inválido: {mes}/{anio}", "data": None}, status_code=400)
+    return await facturar_mes_async(mes=mes, anio=anio, simular=bool(data.get("simular")))
 
 @app.post("/saludo_alerta/")
-async def handle_saludo_alerta():
-    return saludo_alerta()
+async def handle_saludo_alerta(request: Request):
+    # La alerta cambia cuando termina un trabajo 'alertas' nuevo
+    ultimas = await asyncio.to_thread(tareas.ultimo_terminado, 'alertas')
+    return await respuesta_condicional(request, [], ultimas and ultimas['id'], saludo_alerta_async)
 
 @app.post("/get_sudo_users/")
-async def handle_get_sudo_users():
-    return get_sudo_users()
+async def handle_get_sudo_users(request: Request):
+    return await respuesta_condicional(request, [], None, get_sudo_users_async)
+
+@app.post("/trabajos/")
+async def handle_lanzar_trabajo(data: Dict[str, Any]):
+    """Lanza un trabajo en segundo plano ({"tipo": ..., "parametros": {...}}) y responde enseguida con su id."""
+    try:
+        trabajo = tareas.lanzar(data.get("tipo"), data.get("parametros") or {})
+    except ValueError as e:
+        return JSONResponse({"status": "error", "message": str(e), "data": None}, status_code=400)
+    except PermissionError as e:
+        return JSONResponse({"status": "error", "message": f"Permiso denegado: {e}", "data": None}, status_code=403)
+    return JSONResponse({"status": "success", "message": f"Trabajo {trabajo['tipo']} lanzado.", "data": trabajo},
+                        status_code=202, headers={"Location": f"/trabajos/{trabajo['id']}"})
+
+@app.get("/trabajos/")
+async def handle_listar_trabajos(limite: int = 50):
+    """Trabajos recientes (sin resultado), tipos disponibles y trabajos programados."""
+    trabajos = await asyncio.to_thread(tareas.listar, max(1, min(limite, 500)))
+    return {"status": "success", "message": f"{len(trabajos)} trabajos.",
+            "data": {"trabajos": trabajos,
+                     "tipos": {nombre: tipo.descripcion for nombre, tipo in tareas.TIPOS.items()},
+                     "programados": {nombre: cron.expresion for nombre, cron in tareas.programador.entradas}}}
+
+@app.get("/trabajos/{trabajo_id}")
+async def handle_estado_trabajo(trabajo_id: str):
+    """Estado de un trabajo; cuando termina trae también el resultado."""
+    resultado = await asyncio.to_thread(estado_trabajo, trabajo_id)
+    if resultado["status"] == "error":
+        return JSONResponse(resultado, status_code=403 if resultado["message"].startswith("Permiso") else 404)
+    return resultado
+
+@app.get("/trabajos/{trabajo_id}/resultado")
+async def handle_resultado_trabajo(trabajo_id: str):
+    """Solo el resultado: 409 si el trabajo sigue en curso o terminó con error."""
+    resultado = await asyncio.to_thread(estado_trabajo, trabajo_id)
+    if resultado["status"] == "error":
+        return JSONResponse(resultado, status_code=403 if resultado["message"].startswith("Permiso") else 404)
+    trabajo = resultado["data"]
+    if trabajo["estado"] != tareas.TERMINADO:
+        mensaje = trabajo["error"] if trabajo["estado"] == tareas.ERROR else f"El trabajo está {trabajo['estado']}."
+        return JSONResponse({"status": "error", "message": mensaje, "data": None}, status_code=409)
+    return {"status": "success", "message": f"Resultado de {trabajo['tipo']}.", "data": trabajo["resultado"]}
+
+# Máximo que se mantiene abierto un long-poll de /changes
+ESPERA_MAXIMA_CAMBIOS = 30.0
+
+@app.get("/changes")
+async def handle_changes(since: int = 0, timeout: float = 0, limite: int = 1000):
+    """Cambios (insert/update/delete) de las colecciones con seq mayor a `since`.
+
+    Con timeout > 0 es un long-poll: si no hay nada nuevo espera hasta que llegue
+    un cambio o se cumpla el timeout. El cliente guarda `cursor` y lo manda como
+    `since` en el próximo pedido; con reset=True tiene que releer todo.
+    Solo se devuelven cambios de colecciones que el usuario SUDO puede leer.
+    """
+    limite = max(1, min(limite, 5000))
+    vence = time.monotonic() + max(0.0, min(timeout, ESPERA_MAXIMA_CAMBIOS))
+    while True:
+        evento = _hay_cambios
+        resultado = await asyncio.to_thread(store.registro_cambios.desde, since, limite)
+        visibles = {}
+        resultado["cambios"] = [c for c in resultado["cambios"]
+                                if visibles.setdefault(c["coleccion"], permisos.verificar_permiso(c["coleccion"], permisos.LEER) is None)]
+        restante = vence - time.monotonic()
+        if resultado["cambios"] or resultado["reset"] or restante <= 0 or evento is None:
+            return {"status": "success", "message": f"{len(resultado['cambios'])} cambios.", "data": resultado}
+        since = resultado["cursor"]
+        # También se revisa cada segundo por si el aviso de otro worker no llega (sin vigilante)
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(evento.wait(), min(restante, 1.0))
+
+@app.get("/export/{coleccion}")
+async def handle_export(coleccion: str, formato: str = "ndjson", sede: str = None, desde: str = None, hasta: str = None, gzip: bool = False):
+    """Exporta una colección completa por streaming (NDJSON o CSV), con filtros opcionales.
+
+    desde/hasta (YYYY-MM-DD) filtran por la fecha propia de cada colección
+    (fecha_pago en pagos, fecha en asistencias y notas, date en citas).
+    Con gzip=true se descarga comprimido (.gz).
+    """
+    if coleccion not in store.COLECCIONES:
+        return JSONResponse({"status": "error", "message": f"Colección desconocida: {coleccion}", "data": None}, status_code=404)
+    if formato not in exportar.FORMATOS:
+        return JSONResponse({"status": "error", "message": f"Formato no soportado: {formato} (ndjson o csv)", "data": None}, status_code=400)
+    motivo = permisos.verificar_permiso(coleccion, permisos.LEER)
+    if motivo is not None:
+        return JSONResponse({"status": "error", "message": f"Permiso denegado: {motivo}", "data": None}, status_code=403)
+    tipo = "text/csv; charset=utf-8" if formato == "csv" else "application/x-ndjson"
+    nombre = f"{coleccion}.{formato}"
+    if gzip:
+        tipo, nombre = "application/gzip", nombre + ".gz"
+    # El generador es síncrono y perezoso: Starlette lo recorre en el thread pool, incluida la carga de la colección
+    return StreamingResponse(exportar.exportar(coleccion, formato, sede, desde, hasta, comprimir=gzip), media_type=tipo,
+                             headers={"Content-Disposition": f'attachment; filename="{nombre}"'})
+
+@app.post("/import/{coleccion}")
+async def handle_import(coleccion: str, request: Request, formato: str = "csv", simular: bool = False):
+    """Importa filas CSV o NDJSON (el body crudo, opcionalmente gzip) a una colección.
+
+    Responde con NDJSON de progreso: una línea por lote guardado y una final con
+    'fin': true y el detalle de las filas rechazadas. Con simular=true solo valida.
+    """
+    if coleccion not in importacion.ESQUEMAS:
+        return JSONResponse({"status": "error", "message": f"No se puede importar a {coleccion}", "data": None}, status_code=404)
+    if formato not in importacion.FORMATOS:
+        return JSONResponse({"status": "error", "message": f"Formato no soportado: {formato} (csv o ndjson)", "data": None}, status_code=400)
+    motivo = permisos.verificar_permiso(coleccion, permisos.CREAR)
+    if motivo is not None:
+        return JSONResponse({"status": "error", "message": f"Permiso denegado: {motivo}", "data": None}, status_code=403)
+    # El body se va guardando a medida que llega (pasa a disco si es grande) y se procesa en el thread pool
+    archivo = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    async for bloque in request.stream():
+        archivo.write(bloque)
+    archivo.seek(0)
+
+    def progreso():
+        try:
+            for paso in importacion.importar(coleccion, archivo, formato, simular):
+                yield json.dumps(paso, ensure_ascii=False) + "\n"
+        finally:
+            archivo.close()
+    return StreamingResponse(progreso(), media_type="application/x-ndjson")
 
 # Ruta raíz para verificar que FastAPI está funcionando
 @app.get("/")
 async def read_root():
-    status = "con Google ADK" if google_adk_available and root_agent else "sin Google ADK"
+    status = "con Google ADK" if google_adk_available else "sin Google ADK"
     return {"message": f"FastAPI running with agent tools exposed as endpoints ({status})"}
 
 # Endpoint de salud para Railway
@@ -171,5 +626,20 @@ async def health_check():
     return {
         "status": "healthy",
         "google_adk_available": google_adk_available,
-        "agent_initialized": root_agent is not None
-    }
\ No newline at end of file
+        "agent_initialized": root_agent is not None,
+        "multiproceso": store.MULTIPROCESO,
+        "almacen": {"tipo": store.ALMACEN, "remotas": store.COLECCIONES_REMOTAS,
+                    "cliente": store.cliente_remoto.estadisticas() if store.cliente_remoto else None},
+        "sesiones": BACKEND_SESIONES,
+        "vigilancia_datos": store.vigilante.modo if store.vigilancia_activa else None,
+        "lecturas_compartidas": un_solo_vuelo.estadisticas(),
+        "salidas_recortadas": salida.estadisticas(),
+        "atajos": atajos.estadisticas(),
+        "trabajos_en_curso": tareas.en_curso(),
+        "checkin": checkin.agrupador.estadisticas(),
+        "ocupacion": ocupacion.rollup.estadisticas(),
+        "arranque": TIEMPOS_ARRANQUE
+    }
+
+TIEMPOS_ARRANQUE["import_ms"] = round((time.perf_counter() - _INICIO_IMPORT) * 1000, 1)
+print(f"index importado en {TIEMPOS_ARRANQUE['import_ms']} ms")
\ No newline at end of file
@@ -0,0 +1,147 @@
+"""Driver de carga para /agente_ia/.
+
+Pensado para correr contra el backend levantado con el modelo stub, sin llamar a Gemini:
+
+    AGENTE_LLM=stub PYTHONPATH=. python -m uvicorn index:app --port 8000
+    python loadtest.py --url http://localhost:8000 --concurrencia 16 --requests 500
+
+Los requests van con el header X-Sudo-User (--usuario, por defecto 'profesor', que
+solo lee): sin usuario el backend rechaza las tools salvo con AGENTE_EXIGIR_USUARIO=0.
+
+Con los atajos activos (atajos.py) casi todas estas consultas se responden sin
+pasar por el modelo; para medir el camino del agente, levantar con AGENTE_ATAJOS=0.
+
+Reporta requests/seg, latencias (p50/p90/p99/máx), errores y cuántas veces se
+llamó a cada tool durante la corrida (leído de /agente_ia/stub_stats).
+"""
+import argparse
+import math
+import random
+import statistics
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import requests
+
+# Mezcla de consultas típicas, con su peso relativo
+PROMPTS = [
+    ("Hola, ¿hay alertas?", 1),
+    ("Listar alumnos", 3),
+    ("¿Cuál es el último pago de Juan Perez?", 3),
+    ("Último pago de Maria Gonzalez", 2),
+    ("Dame el resumen de Carlos Lopez", 2),
+    ("Resumen de Juan Perez", 2),
+    ("Pagos de Juan Perez", 1),
+    ("Asistencias de Carlos Lopez", 1),
+    ("Notas de Maria Gonzalez", 1),
+    ("Historial de Juan Perez", 1),
+    ("¿Qué día es hoy?", 1),
+]
+
+def percentil(valores: List[float], p: float) -> float:
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not valores:
+        return 0.0
+    k = max(0, min(len(valores) - 1, math.ceil(p / 100 * len(valores)) - 1))
+    return valores[k]
+
+def stub_stats(session: requests.Session, url: str) -> Optional[Dict[str, int]]:
+    try:
+        r = session.get(f"{url}/agente_ia/stub_stats", timeout=10)
+        body = r.json()
+    except (requests.RequestException, ValueError):
+        return None
+    return body.get("data") if body.get("status") == "success" else None
+
+def correr(url: str, concurrencia: int, total: int, sesiones: int, semilla: int, usuario: str = "profesor") -> Dict[str, Any]:
+    rnd = random.Random(semilla)
+    textos = [t for t, _ in PROMPTS]
+    pesos = [w for _, w in PROMPTS]
+    plan = rnd.choices(textos, weights=pesos, k=total)
+    # Cada "usuario virtual" usa su propia sesión para no inflar una única conversación
+    ids_sesion = [f"carga-{uuid.uuid4().hex[:8]}" for _ in range(max(1, sesiones))]
+
+    local = threading.local()
+    latencias: List[float] = []
+    errores: Counter = Counter()
+    lock = threading.Lock()
+
+    def una(i: int):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+            local.session.headers["X-Sudo-User"] = usuario
+        payload = {"message": plan[i], "session_id": ids_sesion[i % len(ids_sesion)]}
+        inicio = time.perf_counter()
+        try:
+            r = local.session.post(f"{url}/agente_ia/", json=payload, timeout=60)
+            ok = r.status_code == 200 and r.json().get("status") == "success"
+            motivo = None if ok else f"HTTP {r.status_code}: {r.text[:80]}"
+        except requests.RequestException as e:
+            motivo = type(e).__name__
+        duracion = time.perf_counter() - inicio
+        with lock:
+            latencias.append(duracion)
+            if motivo:
+                errores[motivo] += 1
+
+    control = requests.Session()
+    antes = stub_stats(control, url)
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        list(pool.map(una, range(total)))
+    transcurrido = time.perf_counter() - inicio
+    despues = stub_stats(control, url)
+
+    llamadas = None
+    if antes is not None and despues is not None:
+        llamadas = {k: despues.get(k, 0) - antes.get(k, 0) for k in despues if despues.get(k, 0) - antes.get(k, 0)}
+
+    latencias.sort()
+    return {
+        "requests": total,
+        "concurrencia": concurrencia,
+        "segundos": transcurrido,
+        "rps": total / transcurrido if transcurrido else 0.0,
+        "latencia_ms": {
+            "media": statistics.fmean(latencias) * 1000 if latencias else 0.0,
+            "p50": percentil(latencias, 50) * 1000,
+            "p90": percentil(latencias, 90) * 1000,
+            "p99": percentil(latencias, 99) * 1000,
+            "max": latencias[-1] * 1000 if latencias else 0.0,
+        },
+        "errores": dict(errores),
+        "llamadas_por_tool": llamadas,
+    }
+
+def imprimir(reporte: Dict[str, Any]):
+    print(f"Requests: {reporte['requests']}  concurrencia: {reporte['concurrencia']}  tiempo: {reporte['segundos']:.2f}s")
+    print(f"Throughput: {reporte['rps']:.1f} req/s")
+    lat = reporte["latencia_ms"]
+    print(f"Latencia (ms): media {lat['media']:.1f}  p50 {lat['p50']:.1f}  p90 {lat['p90']:.1f}  p99 {lat['p99']:.1f}  máx {lat['max']:.1f}")
+    if reporte["errores"]:
+        print("Errores:")
+        for motivo, cantidad in reporte["errores"].items():
+            print(f"  {cantidad:5d}  {motivo}")
+    else:
+        print("Errores: 0")
+    if reporte["llamadas_por_tool"] is None:
+        print("Llamadas por tool: no disponible (¿el backend corre con AGENTE_LLM=stub?)")
+    else:
+        print("Llamadas por tool:")
+        for tool, cantidad in sorted(reporte["llamadas_por_tool"].items(), key=lambda kv: -kv[1]):
+            print(f"  {cantidad:5d}  {tool}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prueba de carga de /agente_ia/ con consultas mixtas.")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrencia", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--sesiones", type=int, default=32, help="cantidad de sesiones distintas a repartir")
+    parser.add_argument("--semilla", type=int, default=1234, help="semilla para que la mezcla sea reproducible")
+    parser.add_argument("--usuario", default="profesor", help="usuario SUDO que se manda en X-Sudo-User")
+    args = parser.parse_args()
+    imprimir(correr(args.url.rstrip("/"), args.concurrencia, args.requests, args.sesiones, args.semilla, args.usuario))
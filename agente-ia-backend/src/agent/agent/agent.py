@@ -1,36 +1,30 @@
-import json
-import os
 import uuid
-# from google.adk.agents import Agent  # Eliminado porque no existe y rompe el deploy
 from typing import Dict, Any, List, Optional, Union
-from fastapi import FastAPI, Request
-
-# Rutas a los archivos JSON de datos (relativas a este archivo)
-BASE_DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
-ALUMNOS_PATH = os.path.join(BASE_DATA_PATH, 'alumnos.json')
-PAGOS_PATH = os.path.join(BASE_DATA_PATH, 'pagos.json')
-NOTAS_PATH = os.path.join(BASE_DATA_PATH, 'notas.json')
-ASISTENCIAS_PATH = os.path.join(BASE_DATA_PATH, 'asistencias.json') # Asegurarse de crear este archivo
-SUDO_USERS_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'sudo-users.json') # Corregido para apuntar a la raíz
-
-# --- Helpers para leer y escribir JSON ---
-
-def read_json_file(filepath: str) -> List[Dict[str, Any]]:
-    """Lee datos de un archivo JSON."""
-    if not os.path.exists(filepath):
-        return []
-    with open(filepath, 'r', encoding='utf-8') as f:
-        try:
-            return json.load(f)
-        except json.JSONDecodeError:
-            return [] # Retorna lista vacía si el JSON está vacío o mal formado
-
-def write_json_file(filepath: str, data: List[Dict[str, Any]]):
-    """Escribe datos a un archivo JSON."""
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+
+# Las rutas de datos y los helpers de lectura/escritura viven en store.py
+from .store import (
+    ALUMNOS_PATH,
+    PAGOS_PATH,
+    NOTAS_PATH,
+    ASISTENCIAS_PATH,
+    SUDO_USERS_PATH,
+    PARTICIONADAS,
+    read_json_file,
+    buscar,
+    buscar_por_id,
+    buscar_por_alumno,
+    ultimo_por_alumno,
+    agregar_registros,
+    actualizar_registro,
+    eliminar_registro,
+    serializar_escrituras,
+)
+from .permisos import requiere_permiso
+from .tareas import ultimo_resultado
+from .unicidad import DUPLICADOS, ETIQUETAS, alumno_duplicado, es_reintento
 
 # Nueva función para listar solo nombres de alumnos
+@requiere_permiso('alumnos', accion='read')
 def listar_nombres_alumnos() -> Dict[str, Any]:
     """Obtiene y lista solo los nombres completos de todos los alumnos."""
     print("Ejecutando tool: listar_nombres_alumnos")
@@ -56,29 +50,33 @@ def listar_nombres_alumnos() -> Dict[str, Any]:
 # Helper para obtener usuarios SUDO
 def get_sudo_users() -> List[Dict[str, Any]]:
     """Obtiene la lista de usuarios SUDO desde el archivo JSON."""
-    # Corregir la ruta para apuntar a la raíz del proyecto
-    sudo_path_corrected = os.path.join(os.path.dirname(__file__), '..', '..', 'sudo-users.json')
-    print(f"Intentando leer usuarios SUDO desde: {sudo_path_corrected}") # Log para depuración
-    return read_json_file(sudo_path_corrected)
+    # Sale de la caché de store.py; los permisos compilados viven en permisos.py
+    return read_json_file(SUDO_USERS_PATH)
 
 # Ejemplo: Función de alerta al saludar
+@requiere_permiso('alertas', accion='read')
 def saludo_alerta() -> Dict[str, str]:
     """Genera una alerta básica al saludar."""
-    # En una implementación real, aquí se chequearían condiciones para generar alertas reales
+    # Las alertas las recalcula el trabajo programado 'alertas' (tareas.py); hasta la primera corrida se usa el texto fijo
     print("Ejecutando tool: saludo_alerta")
+    alertas = ultimo_resultado('alertas')
+    texto = alertas['texto'] if alertas else "Aquí hay algunas alertas pendientes: 3 personas no asistieron recientemente y una debe el pago del mes."
     return {
         "status": "success",
-        "alerta": "¡Hola! Aquí hay algunas alertas pendientes: 3 personas no asistieron recientemente y una debe el pago del mes.",
+        "alerta": f"¡Hola! {texto}",
         "mensaje": "¿En qué puedo ayudarte hoy?"
     }
 
 # Funciones CRUD para Alumnos
 
+@requiere_permiso('alumnos')
+@serializar_escrituras(ALUMNOS_PATH)
 def crud_alumnos(action: str, data: Dict[str, Any]) -> Dict[str, Any]:
     """Realiza operaciones CRUD en los datos de alumnos.
 
     Puede 'create', 'read', 'update', o 'delete' alumnos.
     Para 'create', se requiere data con 'nombre' y 'apellido'. Genera un ID automáticamente.
+    Si ya existe un alumno con el mismo email o teléfono no se crea otro: se devuelve el existente.
     Para 'read', se puede buscar por 'id' o por 'nombre' y 'apellido'. Si no se especifica nada, lee todos los alumnos.
     Para 'update', se requiere data con el 'id' del alumno y los campos a actualizar.
     Para 'delete', se requiere data con el 'id' del alumno a eliminar.
@@ -90,7 +88,6 @@ def crud_alumnos(action: str, data: Dict[str, Any]) -> Dict[str, Any]:
     - Para obtener ID: llamar con action='read', data={'nombre': 'Nombre', 'apellido': 'Apellido'}
     """
     print(f"Ejecutando tool: crud_alumnos con acción {action} y data {data}")
-    alumnos = read_json_file(ALUMNOS_PATH)
     result = {
         "status": "error",
         "message": "Acción no reconocida o faltan datos.",
@@ -101,14 +98,29 @@ def crud_alumnos(action: str, data: Dict[str, Any]) -> Dict[str, Any]:
         if not data or 'nombre' not in data or 'apellido' not in data:
              result['message'] = 'Faltan nombre o apellido para crear el alumno.'
              return result
+        # Índices únicos (unicidad.py): un reintento del agente no duplica al alumno
+        duplicado = alumno_duplicado(data)
+        if duplicado is not None:
+            campo, existente = duplicado
+            if es_reintento(data, existente):
+                result['status'] = 'success'
+                result['message'] = 'El alumno ya estaba registrado.'
+                result['data'] = existente
+            elif DUPLICADOS == 'unir':
+                result['status'] = 'success'
+                result['message'] = f'Ya existía un alumno con ese {ETIQUETAS[campo]}: se actualizaron sus datos.'
+                result['data'] = actualizar_registro(ALUMNOS_PATH, existente['id'], {k: v for k, v in data.items() if k != 'id'})
+            else:
+                result['message'] = f"Ya existe un alumno con ese {ETIQUETAS[campo]} (id {existente['id']})."
+                result['data'] = existente
+            return result
         data['id'] = str(uuid.uuid4()) # Generar ID único
-        alumnos.append(data)
-        write_json_file(ALUMNOS_PATH, alumnos)
+        agregar_registros(ALUMNOS_PATH, [data])
         result['status'] = 'success'
         result['message'] = 'Alumno creado con éxito.'
         result['data'] = data
     elif action == 'read' and isinstance(data, dict) and data.get('id'):
-        alumno = next((a for a in alumnos if a['id'] == data['id']), None)
+        alumno = buscar_por_id(ALUMNOS_PATH, data['id'])
         if alumno:
             result['status'] = 'success'
             result['message'] = 'Alumno encontrado.'
@@ -117,7 +129,7 @@ def crud_alumnos(action: str, data: Dict[str, Any]) -> Dict[str, Any]:
             result['message'] = 'Alumno no encontrado.'
     elif action == 'read' and isinstance(data, dict) and data.get('nombre') and data.get('apellido'):
         # Buscar por nombre y apellido
-         alumno = next((a for a in alumnos if a['nombre'].lower() == data['nombre'].lower() and a['apellido'].lower() == data['apellido'].lower()), None)
+         alumno = buscar(ALUMNOS_PATH, lambda a: a['nombre'].lower() == data['nombre'].lower() and a['apellido'].lower() == data['apellido'].lower())
          if alumno:
             result['status'] = 'success'
             result['message'] = 'Alumno encontrado por nombre.'
@@ -127,22 +139,23 @@ def crud_alumnos(action: str, data: Dict[str, Any]) -> Dict[str, Any]:
     elif action == 'read' and (data is None or (isinstance(data, dict) and not data)): # Leer todos si data es None o diccionario vacío
         result['status'] = 'success'
         result['message'] = 'Listado de alumnos.'
-        result['data'] = alumnos
+        result['data'] = read_json_file(ALUMNOS_PATH)
     elif action == 'update' and isinstance(data, dict) and data.get('id'):
-        alumno_index = next((i for i, a in enumerate(alumnos) if a['id'] == data['id']), -1)
-        if alumno_index != -1:
-            alumnos[alumno_index].update(data) # Actualizar campos
-            write_json_file(ALUMNOS_PATH, alumnos)
+        actual = buscar_por_id(ALUMNOS_PATH, data['id'])
+        duplicado = alumno_duplicado({**actual, **data}, excluir=data['id'], anterior=actual) if actual else None
+        if duplicado is not None:
+            campo, existente = duplicado
+            result['message'] = f"Ya existe otro alumno con ese {ETIQUETAS[campo]} (id {existente['id']})."
+            return result
+        alumno = actualizar_registro(ALUMNOS_PATH, data['id'], data) # Actualizar campos
+        if alumno:
             result['status'] = 'success'
             result['message'] = 'Alumno actualizado con éxito.'
-            result['data'] = alumnos[alumno_index]
+            result['data'] = alumno
         else:
             result['message'] = 'Alumno a actualizar no encontrado.'
     elif action == 'delete' and isinstance(data, dict) and data.get('id'):
-        original_count = len(alumnos)
-        alumnos = [a for a in alumnos if a['id'] != data['id']]
-        if len(alumnos) < original_count:
-            write_json_file(ALUMNOS_PATH, alumnos)
+        if eliminar_registro(ALUMNOS_PATH, data['id']):
             result['status'] = 'success'
             result['message'] = 'Alumno eliminado con éxito.'
         else:
@@ -151,6 +164,8 @@ def crud_alumnos(action: str, data: Dict[str, Any]) -> Dict[str, Any]:
     return result
 
 # Funciones CRUD para Pagos
+@requiere_permiso('pagos')
+@serializar_escrituras(PAGOS_PATH)
 def crud_pagos(action: str, data: Dict[str, Any]) -> Dict[str, Any]:
     """Realiza operaciones CRUD sobre los datos de pagos.
 
@@ -167,8 +182,6 @@ def crud_pagos(action: str, data: Dict[str, Any]) -> Dict[str, Any]:
     - Para leer pagos de un alumno: llamar con action='read', data={'alumno_id': '...'}
     - Para leer un pago específico: llamar con action='read', data={'id': '...'}
     """
-    pagos = read_json_file(PAGOS_PATH)
-
     if action == 'create' and isinstance(data, dict):
         if not data or 'alumno_id' not in data or 'fecha' not in data or 'monto' not in data:
             return {"status": "error", "message": "Faltan datos requeridos ('alumno_id', 'fecha', 'monto') para crear el pago.", "data": None}
@@ -178,23 +191,22 @@ def crud_pagos(action: str, data: Dict[str, Any]) -> Dict[str, Any]:
             'fecha': data['fecha'],
             'monto': data['monto']
         }
-        pagos.append(new_pago)
-        write_json_file(PAGOS_PATH, pagos)
+        agregar_registros(PAGOS_PATH, [new_pago])
         return {"status": "success", "message": "Pago creado.", "data": new_pago}
 
     elif action == 'read':
         if isinstance(data, dict) and data.get('id'): # Leer un pago específico por ID
-            pago_encontrado = next((p for p in pagos if isinstance(p, dict) and p.get('id') == data['id']), None)
+            pago_encontrado = buscar_por_id(PAGOS_PATH, data['id'])
             if pago_encontrado:
                 return {"status": "success", "message": "Pago encontrado.", "data": pago_encontrado}
             else:
                 return {"status": "error", "message": "Pago no encontrado.", "data": None}
         elif data is None or (isinstance(data, dict) and 'alumno_id' not in data):
-             return {"status": "success", "message": "Lista de todos los pagos.", "data": pagos}
+             return {"status": "success", "message": "Lista de todos los pagos.", "data": read_json_file(PAGOS_PATH)}
         elif isinstance(data, dict) and data.get('alumno_id'): # Leer todos los pagos de un alumno por alumno_id
             alumno_id_a_buscar = data['alumno_id']
             # Modificación: Asegurar que 'alumno_id' existe antes de comparar
-            pagos_alumno = [p for p in pagos if isinstance(p, dict) and 'alumno_id' in p and p['alumno_id'] == alumno_id_a_buscar]
+            pagos_alumno = buscar_por_alumno(PAGOS_PATH, alumno_id_a_buscar)
             # Opcional: ordenar por fecha si existe el campo 'fecha' y es comparable
             try:
                 # Aseguramos que 'fecha' existe antes de intentar acceder a ella para ordenar
@@ -212,37 +224,31 @@ def crud_pagos(action: str, data: Dict[str, Any]) -> Dict[str, Any]:
     elif action == 'update':
         if not data or 'id' not in data:
             return {"status": "error", "message": "Se requiere el ID del pago para actualizar.", "data": None}
-        pago_id = data['id']
-        pago_encontrado = next((p for p in pagos if isinstance(p, dict) and p.get('id') == pago_id), None)
-        if not pago_encontrado:
-            return {"status": "error", "message": "Pago no encontrado para actualizar.", "data": None}
-
         # Actualizar campos permitidos (ej: fecha, monto)
-        if 'fecha' in data: pago_encontrado['fecha'] = data['fecha']
-        if 'monto' in data: pago_encontrado['monto'] = data['monto']
         # No permitir actualizar 'id' o 'alumno_id' directamente con esta acción
-
-        write_json_file(PAGOS_PATH, pagos)
+        cambios = {campo: data[campo] for campo in ('fecha', 'monto') if campo in data}
+        pago_encontrado = actualizar_registro(PAGOS_PATH, data['id'], cambios)
+        if not pago_encontrado:
+            return {"status": "error", "message": "Pago no encontrado para actualizar.", "data": None}
         return {"status": "success", "message": "Pago actualizado.", "data": pago_encontrado}
 
     elif action == 'delete':
         if not data or 'id' not in data:
             return {"status": "error", "message": "Se requiere el ID del pago para eliminar.", "data": None}
         pago_id = data['id']
-        pagos_actualizados = [p for p in pagos if isinstance(p, dict) and p.get('id') != pago_id]
-        if len(pagos_actualizados) == len(pagos):
+        if not eliminar_registro(PAGOS_PATH, pago_id):
             return {"status": "error", "message": "Pago no encontrado para eliminar.", "data": None}
-        write_json_file(PAGOS_PATH, pagos_actualizados)
         return {"status": "success", "message": "Pago eliminado.", "data": {"id": pago_id}}
 
     else:
         return {"status": "error", "message": "Acción no reconocida para pagos.", "data": None}
 
 # Funciones CRUD para Notas
+@requiere_permiso('notas')
+@serializar_escrituras(NOTAS_PATH)
 def crud_notas(action: str, data: Dict[str, Any]) -> Dict[str, Any]:
     """Realiza operaciones CRUD en los datos de notas."""
     print(f"Ejecutando tool: crud_notas con acción {action} y data {data}")
-    notas = read_json_file(NOTAS_PATH)
     result = {
         "status": "error",
         "message": "Acción no reconocida o faltan datos.",
@@ -254,13 +260,12 @@ def crud_notas(action: str, data: Dict[str, Any]) -> Dict[str, Any]:
              result['message'] = "Faltan datos requeridos ('alumno_id', 'fecha', 'contenido') para crear la nota."
              return result
         data['id'] = str(uuid.uuid4()) # Generar ID único
-        notas.append(data)
-        write_json_file(NOTAS_PATH, notas)
+        agregar_registros(NOTAS_PATH, [data])
         result['status'] = 'success';
         result['message'] = 'Nota creada con éxito.';
         result['data'] = data
     elif action == 'read' and isinstance(data, dict) and data.get('id'):
-        nota = next((n for n in notas if isinstance(n, dict) and n.get('id') == data['id']), None)
+        nota = buscar_por_id(NOTAS_PATH, data['id'])
         if nota:
             result['status'] = 'success';
             result['message'] = 'Nota encontrada.';
@@ -269,34 +274,28 @@ def crud_notas(action: str, data: Dict[str, Any]) -> Dict[str, Any]:
             result['message'] = 'Nota no encontrada.';
     elif action == 'read' and isinstance(data, dict) and data.get('alumno_id'):
         alumno_id_a_buscar = data['alumno_id']
-        notas_alumno = [n for n in notas if isinstance(n, dict) and 'alumno_id' in n and n['alumno_id'] == alumno_id_a_buscar]
+        notas_alumno = buscar_por_alumno(NOTAS_PATH, alumno_id_a_buscar)
         result['status'] = 'success';
         result['message'] = f'Notas encontradas para el alumno {alumno_id_a_buscar}.';
         result['data'] = notas_alumno
     elif action == 'read' and (data is None or (isinstance(data, dict) and not data)): # Leer todas si data es None o diccionario vacío
         result['status'] = 'success';
         result['message'] = 'Lista de todas las notas.';
-        result['data'] = notas
+        result['data'] = read_json_file(NOTAS_PATH)
     elif action == 'update' and isinstance(data, dict) and data.get('id'):
-        nota_id = data['id']
-        nota_encontrada = next((n for n in notas if isinstance(n, dict) and n.get('id') == nota_id), None)
+        cambios = {campo: data[campo] for campo in ('fecha', 'contenido') if campo in data}
+        nota_encontrada = actualizar_registro(NOTAS_PATH, data['id'], cambios)
         if not nota_encontrada:
             result['message'] = 'Nota no encontrada para actualizar.';
             return result
-        if 'fecha' in data: nota_encontrada['fecha'] = data['fecha']
-        if 'contenido' in data: nota_encontrada['contenido'] = data['contenido']
-        write_json_file(NOTAS_PATH, notas)
         result['status'] = 'success';
         result['message'] = 'Nota actualizada con éxito.';
         result['data'] = nota_encontrada
     elif action == 'delete' and isinstance(data, dict) and data.get('id'):
         nota_id = data['id']
-        original_count = len(notas)
-        notas_actualizadas = [n for n in notas if isinstance(n, dict) and n.get('id') != nota_id]
-        if len(notas_actualizadas) == original_count:
+        if not eliminar_registro(NOTAS_PATH, nota_id):
             result['message'] = 'Nota no encontrada para eliminar.';
             return result
-        write_json_file(NOTAS_PATH, notas_actualizadas)
         result['status'] = 'success';
         result['message'] = 'Nota eliminada con éxito.';
         result['data'] = {'id': nota_id}
@@ -305,10 +304,11 @@ def crud_notas(action: str, data: Dict[str, Any]) -> Dict[str, Any]:
     return result
 
 # Funciones CRUD para Asistencias
+@requiere_permiso('asistencias')
+@serializar_escrituras(ASISTENCIAS_PATH)
 def crud_asistencias(action: str, data: Dict[str, Any]) -> Dict[str, Any]:
     """Realiza operaciones CRUD en los datos de asistencias."""
     print(f"Ejecutando tool: crud_asistencias con acción {action} y data {data}")
-    asistencias = read_json_file(ASISTENCIAS_PATH)
     result = {
         "status": "error",
         "message": "Acción no reconocida o faltan datos.",
@@ -320,13 +320,12 @@ def crud_asistencias(action: str, data: Dict[str, Any]) -> Dict[str, Any]:
              result['message'] = "Faltan datos requeridos ('alumno_id', 'fecha', 'estado') para registrar la asistencia."
              return result
          data['id'] = str(uuid.uuid4())
-         asistencias.append(data)
-         write_json_file(ASISTENCIAS_PATH, asistencias)
+         agregar_registros(ASISTENCIAS_PATH, [data])
          result['status'] = 'success';
          result['message'] = 'Asistencia registrada con éxito.';
          result['data'] = data
     elif action == 'read' and isinstance(data, dict) and data.get('id'):
-        asistencia = next((a for a in asistencias if isinstance(a, dict) and a.get('id') == data['id']), None)
+        asistencia = buscar_por_id(ASISTENCIAS_PATH, data['id'])
         if asistencia:
             result['status'] = 'success';
             result['message'] = 'Asistencia encontrada.';
@@ -335,34 +334,28 @@ def crud_asistencias(action: str, data: Dict[str, Any]) -> Dict[str, Any]:
             result['message'] = 'Asistencia no encontrada.';
     elif action == 'read' and isinstance(data, dict) and data.get('alumno_id'):
         alumno_id_a_buscar = data['alumno_id']
-        asistencias_alumno = [a for a in asistencias if isinstance(a, dict) and 'alumno_id' in a and a['alumno_id'] == alumno_id_a_buscar]
+        asistencias_alumno = buscar_por_alumno(ASISTENCIAS_PATH, alumno_id_a_buscar)
         result['status'] = 'success';
         result['message'] = f'Asistencias encontradas para el alumno {alumno_id_a_buscar}.';
         result['data'] = asistencias_alumno
     elif action == 'read' and (data is None or (isinstance(data, dict) and not data)): # Leer todas si data es None o diccionario vacío
         result['status'] = 'success';
         result['message'] = 'Lista de todas las asistencias.';
-        result['data'] = asistencias
+        result['data'] = read_json_file(ASISTENCIAS_PATH)
     elif action == 'update' and isinstance(data, dict) and data.get('id'):
-        asistencia_id = data['id']
-        asistencia_encontrada = next((a for a in asistencias if isinstance(a, dict) and a.get('id') == asistencia_id), None)
+        cambios = {campo: data[campo] for campo in ('fecha', 'estado') if campo in data}
+        asistencia_encontrada = actualizar_registro(ASISTENCIAS_PATH, data['id'], cambios)
         if not asistencia_encontrada:
             result['message'] = 'Asistencia no encontrada para actualizar.';
             return result
-        if 'fecha' in data: asistencia_encontrada['fecha'] = data['fecha']
-        if 'estado' in data: asistencia_encontrada['estado'] = data['estado']
-        write_json_file(ASISTENCIAS_PATH, asistencias)
         result['status'] = 'success';
         result['message'] = 'Asistencia actualizada con éxito.';
         result['data'] = asistencia_encontrada
     elif action == 'delete' and isinstance(data, dict) and data.get('id'):
         asistencia_id = data['id']
-        original_count = len(asistencias)
-        asistencias_actualizadas = [a for a in asistencias if isinstance(a, dict) and a.get('id') != asistencia_id]
-        if len(asistencias_actualizadas) == original_count:
+        if not eliminar_registro(ASISTENCIAS_PATH, asistencia_id):
             result['message'] = 'Asistencia no encontrada para eliminar.';
             return result
-        write_json_file(ASISTENCIAS_PATH, asistencias_actualizadas)
         result['status'] = 'success';
         result['message'] = 'Asistencia eliminada con éxito.';
         result['data'] = {'id': asistencia_id}
@@ -370,14 +363,17 @@ def crud_asistencias(action: str, data: Dict[str, Any]) -> Dict[str, Any]:
         result['message'] = 'Acción no reconocida para asistencias.';
     return result
 
+# Registros por sección que muestra resumen_alumno (el resto se resume en cantidad y totales)
+ULTIMOS_EN_RESUMEN = 5
+
 # Función para resumen
+@requiere_permiso('resumen', accion='read')
 def resumen_alumno(alumno_id: str) -> Dict[str, Any]:
-    """Genera un resumen de pagos, notas y asistencias para un alumno."""
+    """Genera un resumen de pagos, notas y asistencias para un alumno (los más recientes de cada uno, con totales)."""
     print(f"Ejecutando tool: resumen_alumno para alumno {alumno_id}")
 
     # Obtener datos del alumno
-    alumnos = read_json_file(ALUMNOS_PATH)
-    alumno = next((a for a in alumnos if a['id'] == alumno_id), None)
+    alumno = buscar_por_id(ALUMNOS_PATH, alumno_id)
     if not alumno:
         return {
             "status": "error",
@@ -389,7 +385,31 @@ def resumen_alumno(alumno_id: str) -> Dict[str, Any]:
     pagos_alumno = crud_pagos(action='read', data={'alumno_id': alumno_id})['data']
     notas_alumno = crud_notas(action='read', data={'alumno_id': alumno_id})['data']
     asistencias_alumno = crud_asistencias(action='read', data={'alumno_id': alumno_id})['data']
+    return armar_resumen(alumno, pagos_alumno, notas_alumno, asistencias_alumno, ultimos=ULTIMOS_EN_RESUMEN)
+
+def _ultimos(registros: List[Dict[str, Any]], ultimos: Optional[int], campos: tuple = ('fecha',)) -> List[Dict[str, Any]]:
+    """Los `ultimos` registros más recientes (todos, en su orden, si ultimos es None o no hay más que eso)."""
+    if ultimos is None or len(registros) <= ultimos:
+        return registros
+    fecha = lambda r: str(next((r[c] for c in campos if r.get(c)), ''))
+    return sorted(registros, key=fecha, reverse=True)[:ultimos]
+
+def _encabezado(titulo: str, registros: List[Dict[str, Any]], mostrados: List[Dict[str, Any]], extra: str = '') -> str:
+    if len(mostrados) == len(registros):
+        return f"{titulo}:"
+    return f"{titulo} ({len(registros)} en total{extra}; se muestran los {len(mostrados)} más recientes):"
 
+def armar_resumen(alumno: Dict[str, Any], pagos_alumno: List[Dict[str, Any]], notas_alumno: List[Dict[str, Any]], asistencias_alumno: List[Dict[str, Any]],
+                  ultimos: Optional[int] = None) -> Dict[str, Any]:
+    """Arma el texto del resumen a partir de los datos ya leídos del alumno.
+
+    Con `ultimos`, cada sección lista solo los registros más recientes y dice cuántos hay en total.
+    """
+    todos_pagos, todas_notas, todas_asistencias = pagos_alumno, notas_alumno, asistencias_alumno
+    pagos_alumno = _ultimos(todos_pagos, ultimos, ('fecha_pago', 'fecha'))
+    notas_alumno = _ultimos(todas_notas, ultimos)
+    asistencias_alumno = _ultimos(todas_asistencias, ultimos)
+    total_pagado = sum(p['monto'] for p in todos_pagos if isinstance(p.get('monto'), (int, float)))
     # Construir la sección de Pagos del resumen
     pagos_resumen = f'No hay registros de pagos para {alumno.get("nombre", "")} {alumno.get("apellido", "")}.' if not pagos_alumno else '\n'.join([f'- Fecha: {p.get("fecha_pago", p.get("fecha", ""))}, Monto: ${p.get("monto", "")}, Estado: {p.get("estado", "")}' for p in pagos_alumno])
 
@@ -402,13 +422,13 @@ def resumen_alumno(alumno_id: str) -> Dict[str, Any]:
     # Unir todas las secciones en el texto final del resumen
     resumen_texto = f"""Resumen para {alumno.get("nombre", "")} {alumno.get("apellido", "")}:
 
-Pagos:
+{_encabezado("Pagos", todos_pagos, pagos_alumno, f", ${total_pagado}")}
 {pagos_resumen}
 
-Notas:
+{_encabezado("Notas", todas_notas, notas_alumno)}
 {notas_resumen}
 
-Asistencias:
+{_encabezado("Asistencias", todas_asistencias, asistencias_alumno)}
 {asistencias_resumen}
 """
     return {
@@ -417,11 +437,12 @@ Asistencias:
     }
 
 # Nueva función tool para encontrar el último pago de un alumno por nombre
+@requiere_permiso('pagos', accion='read')
 def ultimo_pago_alumno(nombre: str, apellido: str) -> Dict[str, Any]:
     """Obtiene la información del último pago registrado para un alumno específico.
 
     Primero usa `crud_alumnos` para encontrar el `alumno_id` basado en el nombre y apellido.
-    Luego usa `crud_pagos` para leer todos los pagos de ese `alumno_id` y encuentra el último.
+    Luego busca el último pago de ese `alumno_id` (solo en los meses que tienen pagos suyos).
     """
     print(f"Ejecutando tool: ultimo_pago_alumno para {nombre} {apellido}")
 
@@ -436,18 +457,9 @@ def ultimo_pago_alumno(nombre: str, apellido: str) -> Dict[str, Any]:
     if not alumno_id:
          return {"status": "error", "message": f"No se pudo obtener el ID del alumno {nombre} {apellido}.", "data": None}
 
-    # 2. Obtener todos los pagos de ese alumno_id usando crud_pagos
-    # Modificación: Llamar a crud_pagos con data={'alumno_id': alumno_id}
-    pagos_data_search = crud_pagos(action='read', data={'alumno_id': alumno_id})
-
-    if pagos_data_search['status'] != 'success' or not pagos_data_search['data']:
-        return {"status": "success", "message": f"No se encontraron pagos para el alumno {nombre} {apellido}.", "data": None} # Estado success pero sin datos si no hay pagos
-
-    pagos_alumno = pagos_data_search['data']
-
-    # 3. Encontrar el último pago (ordenado por fecha descendente en crud_pagos read by alumno_id)
-    if pagos_alumno:
-        ultimo_pago = pagos_alumno[0] # El primer elemento es el último pago por la modificación en crud_pagos read
+    # 2. Buscar el último pago: el índice de particiones dice en qué mes está el más reciente
+    ultimo_pago = ultimo_por_alumno(PAGOS_PATH, alumno_id, PARTICIONADAS['pagos'])
+    if ultimo_pago:
         return {"status": "success", "message": f"Último pago encontrado para {nombre} {apellido}.", "data": ultimo_pago}
     else:
         return {"status": "success", "message": f"No se encontraron pagos para el alumno {nombre} {apellido}.", "data": None} # Estado success pero sin datos si no hay pagos
@@ -475,41 +487,4 @@ def ultimo_pago_alumno(nombre: str, apellido: str) -> Dict[str, Any]:
 #     tools=[get_sudo_users, saludo_alerta, crud_alumnos, crud_pagos, crud_notas, crud_asistencias, resumen_alumno, listar_nombres_alumnos, ultimo_pago_alumno],
 # )
 # 
-# # NOTA: La definición de root_agent DEBE estar en este archivo y ser accesible. 
-
-# Intentar importar Google ADK, si falla, dejar comentario para instalar manualmente
-try:
-    from google.adk.agents import Agent
-except ImportError:
-    Agent = None  # Para evitar errores de importación si no está instalado
-
-# Leer la API key y config de Gemini desde el entorno
-GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
-GOOGLE_GENAI_USE_VERTEXAI = os.environ.get("GOOGLE_GENAI_USE_VERTEXAI", "FALSE")
-
-# Definir el agente principal solo si la librería está disponible
-if Agent:
-    root_agent = Agent(
-        name="gimnasia_agent",
-        model="gemini-1.5-flash-latest",  # Cambiar si querés otro modelo
-        description="Agente para gestionar registros de gimnasia y responder consultas.",
-        instruction="""Sos un agente amable y servicial para gestionar un gimnasio. Respondé consultas, resúmenes, alertas, etc.""",
-        tools=[],  # Agregá tools si querés
-        # Si el ADK requiere pasar la API key, hacelo acá o en la config global
-    )
-else:
-    root_agent = None
-
-app = FastAPI()
-
-@app.post("/agente_ia/")
-async def run_agent(request: Request):
-    if not root_agent:
-        return {"status": "error", "message": "Google ADK no está instalado. Instalalo con 'pip install google-adk'"}
-    data = await request.json()
-    response = root_agent.run(data)
-    return response
-
-@app.get("/")
-async def read_root():
-    return {"message": "Agente de gimnasia corriendo con Google ADK"} 
\ No newline at end of file
+# # NOTA: el agente real se construye de forma diferida en index.py (ver inicializar_agente).
@@ -0,0 +1,159 @@
+import asyncio
+import json
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+# Variantes async de las tools de agent.py para los handlers de FastAPI.
+# Las funciones síncronas hacen I/O de archivos; acá corren en el thread pool
+# por defecto para no bloquear el event loop, así un solo worker atiende
+# muchas llamadas CRUD concurrentes. Las escrituras siguen serializadas por
+# archivo gracias a serializar_escrituras (store.py); las lecturas idénticas que
+# llegan al mismo tiempo se atienden con una sola ejecución (UnSoloVuelo).
+from .agent import (
+    crud_alumnos,
+    crud_pagos,
+    crud_notas,
+    crud_asistencias,
+    listar_nombres_alumnos,
+    ultimo_pago_alumno,
+    saludo_alerta,
+    get_sudo_users,
+    armar_resumen,
+)
+from .busqueda import buscar_notas
+from .checkin import ErrorCheckin, agrupador, preparar
+from .citas import crud_citas
+from .facturacion import facturar_mes
+from .ocupacion import ocupacion_por_turno, tendencia_ocupacion
+from .unicidad import duplicados_alumnos
+from .permisos import CREAR, LEER, usuario_actual, verificar_permiso
+from . import store
+
+class UnSoloVuelo:
+    """Single-flight: lecturas idénticas concurrentes comparten una sola ejecución.
+
+    La primera llamada con una clave arranca la tarea; las que llegan mientras
+    sigue en curso esperan esa misma tarea y reciben el mismo resultado. Cuando
+    termina se olvida, así que una lectura posterior vuelve a calcularse. La
+    clave incluye las versiones de los datos (ver _clave): solo se juntan
+    lecturas que ven la misma instantánea.
+    """
+
+    def __init__(self):
+        self._en_vuelo: Dict[Hashable, asyncio.Future] = {}
+        self.ejecutadas = 0
+        self.compartidas = 0
+
+    async def hacer(self, clave: Hashable, fabrica: Callable[[], Awaitable[Any]]) -> Any:
+        tarea = self._en_vuelo.get(clave)
+        if tarea is None:
+            self.ejecutadas += 1
+            tarea = asyncio.ensure_future(fabrica())
+            self._en_vuelo[clave] = tarea
+            tarea.add_done_callback(lambda t: self._en_vuelo.pop(clave) if self._en_vuelo.get(clave) is t else None)
+        else:
+            self.compartidas += 1
+        # shield: si se cancela un request (cliente que corta), los demás siguen esperando la tarea
+        return await asyncio.shield(tarea)
+
+    def estadisticas(self) -> Dict[str, int]:
+        return {"ejecutadas": self.ejecutadas, "compartidas": self.compartidas, "en_vuelo": len(self._en_vuelo)}
+
+un_solo_vuelo = UnSoloVuelo()
+
+# Lo que puede leer una tool: sus versiones forman parte de la clave del single-flight
+_DATOS = list(store.COLECCIONES.values()) + [store.SUDO_USERS_PATH]
+
+def _clave(nombre: str, *args: Any) -> Tuple[Any, ...]:
+    # El usuario forma parte de la clave: dos usuarios con permisos distintos no comparten respuesta.
+    # Y las versiones de los datos que ve quien llama (su instantánea): una lectura
+    # posterior a una escritura nunca se suma a una que arrancó antes y no la ve.
+    return (nombre, usuario_actual.get(), store.etag(_DATOS), json.dumps(args, sort_keys=True, default=str))
+
+async def _leer(nombre: str, fn: Callable, /, *args: Any, **kwargs: Any) -> Any:
+    return await un_solo_vuelo.hacer(_clave(nombre, args, kwargs), lambda: asyncio.to_thread(fn, *args, **kwargs))
+
+async def _crud(nombre: str, fn: Callable, action: str, data: Dict[str, Any], lecturas: Tuple[str, ...] = ('read',)) -> Dict[str, Any]:
+    if action in lecturas:
+        return await _leer(nombre, fn, action=action, data=data)
+    return await asyncio.to_thread(fn, action=action, data=data)
+
+async def crud_alumnos_async(action: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    return await _crud('crud_alumnos', crud_alumnos, action, data)
+
+async def crud_pagos_async(action: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    return await _crud('crud_pagos', crud_pagos, action, data)
+
+async def crud_notas_async(action: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    return await _crud('crud_notas', crud_notas, action, data)
+
+async def crud_asistencias_async(action: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    return await _crud('crud_asistencias', crud_asistencias, action, data)
+
+async def crud_citas_async(action: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    return await _crud('crud_citas', crud_citas, action, data, lecturas=('read', 'disponibilidad', 'huecos', 'calendario'))
+
+async def listar_nombres_alumnos_async() -> Dict[str, Any]:
+    return await _leer('listar_nombres_alumnos', listar_nombres_alumnos)
+
+async def ultimo_pago_alumno_async(nombre: str, apellido: str) -> Dict[str, Any]:
+    return await _leer('ultimo_pago_alumno', ultimo_pago_alumno, nombre=nombre, apellido=apellido)
+
+async def buscar_notas_async(consulta: str, tipo: Optional[str] = None, visible_en_reporte: Optional[bool] = None,
+                             limite: int = 20) -> Dict[str, Any]:
+    return await _leer('buscar_notas', buscar_notas, consulta=consulta, tipo=tipo, visible_en_reporte=visible_en_reporte, limite=limite)
+
+async def duplicados_alumnos_async() -> Dict[str, Any]:
+    return await _leer('duplicados_alumnos', duplicados_alumnos)
+
+async def ocupacion_por_turno_async(desde: Optional[str] = None, hasta: Optional[str] = None, sede: Optional[str] = None,
+                                    shift_id: Optional[str] = None) -> Dict[str, Any]:
+    return await _leer('ocupacion_por_turno', ocupacion_por_turno, desde=desde, hasta=hasta, sede=sede, shift_id=shift_id)
+
+async def tendencia_ocupacion_async(desde: Optional[str] = None, hasta: Optional[str] = None, agrupar: str = 'semana',
+                                    sede: Optional[str] = None, shift_id: Optional[str] = None) -> Dict[str, Any]:
+    return await _leer('tendencia_ocupacion', tendencia_ocupacion, desde=desde, hasta=hasta, agrupar=agrupar, sede=sede, shift_id=shift_id)
+
+async def checkin_async(datos: Dict[str, Any]) -> Dict[str, Any]:
+    """Registra la asistencia de un check-in; responde cuando el lote en que se guardó está en disco (checkin.py)."""
+    motivo = verificar_permiso('asistencias', CREAR)
+    if motivo is not None:
+        return {"status": "error", "message": f"Permiso denegado: {motivo}", "data": None}
+    try:
+        registro = await asyncio.to_thread(preparar, datos)
+    except ErrorCheckin as e:
+        return {"status": "error", "message": str(e), "data": None}
+    asistencia, nueva = await asyncio.wrap_future(agrupador.encolar(registro))
+    return {"status": "success", "message": "Asistencia registrada." if nueva else "La asistencia de hoy ya estaba registrada.",
+            "data": asistencia}
+
+async def facturar_mes_async(mes: int, anio: int, simular: bool = False) -> Dict[str, Any]:
+    return await asyncio.to_thread(facturar_mes, mes=mes, anio=anio, simular=simular)
+
+async def saludo_alerta_async() -> Dict[str, str]:
+    return await _leer('saludo_alerta', saludo_alerta)
+
+async def get_sudo_users_async() -> List[Dict[str, Any]]:
+    return await _leer('get_sudo_users', get_sudo_users)
+
+async def resumen_alumno_async(alumno_id: str) -> Dict[str, Any]:
+    """Como resumen_alumno, pero leyendo alumno, pagos, notas y asistencias en paralelo."""
+    motivo = verificar_permiso('resumen', LEER)
+    if motivo is not None:
+        return {"status": "error", "message": f"Permiso denegado: {motivo}", "resumen": None}
+    return await un_solo_vuelo.hacer(_clave('resumen_alumno', alumno_id), lambda: _resumen_alumno(alumno_id))
+
+async def _resumen_alumno(alumno_id: str) -> Dict[str, Any]:
+    print(f"Ejecutando tool: resumen_alumno_async para alumno {alumno_id}")
+    alumno, pagos, notas, asistencias = await asyncio.gather(
+        crud_alumnos_async(action='read', data={'id': alumno_id}),
+        crud_pagos_async(action='read', data={'alumno_id': alumno_id}),
+        crud_notas_async(action='read', data={'alumno_id': alumno_id}),
+        crud_asistencias_async(action='read', data={'alumno_id': alumno_id}),
+    )
+    if alumno['status'] != 'success' or not alumno['data']:
+        return {
+            "status": "error",
+            "message": "Alumno no encontrado para el resumen.",
+            "resumen": None
+        }
+    return armar_resumen(alumno['data'], pagos['data'], notas['data'], asistencias['data'])
@@ -0,0 +1,140 @@
+import re
+import threading
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .agent_async import (
+    buscar_notas_async,
+    crud_alumnos_async,
+    crud_asistencias_async,
+    crud_notas_async,
+    crud_pagos_async,
+    listar_nombres_alumnos_async,
+    resumen_alumno_async,
+    ultimo_pago_alumno_async,
+)
+
+# Atajos de /agente_ia/: los pedidos de fórmula ("último pago de Juan Perez",
+# "listar alumnos", "resumen de X") se reconocen con expresiones regulares y se
+# responden llamando directo a las tools, sin pasar por el modelo. El mensaje
+# entero tiene que calzar con el patrón (salvo cortesías y signos), así una
+# pregunta más elaborada sigue yendo al agente. Estas respuestas no quedan en
+# el historial de la sesión del agente. Si el atajo no puede resolver el pedido
+# (p. ej. el "alumno" no existe: "resumen de la semana") también sigue al agente.
+
+# Cuántos registros se listan como máximo en una respuesta directa
+MAX_LINEAS = 10
+
+_NOMBRE = r"(?P<nombre>[A-Za-zÁÉÍÓÚÜáéíóúüÑñ]+)\s+(?P<apellido>[A-Za-zÁÉÍÓÚÜáéíóúüÑñ]+)"
+# Cortesías y verbos que se ignoran al principio del mensaje
+_PREFIJO = (r"\s*(?:por\s+favor,?\s+)?(?:(?:me\s+)?(?:dec[ií]s|dame|mostrame|pasame|quiero(?:\s+ver)?|necesito|"
+            r"cu[aá]l\s+(?:es|fue)|ver)\s+)?(?:el\s+|la\s+|los\s+|las\s+)?")
+_SUFIJO = r"(?:,?\s+por\s+favor)?\s*[?.!]*\s*"
+
+# Devuelve el texto para el usuario, o None si lo tiene que resolver el agente
+Manejador = Callable[[re.Match], Awaitable[Optional[str]]]
+
+def _patron(cuerpo: str) -> re.Pattern:
+    return re.compile(r"[¿¡]?" + _PREFIJO + cuerpo + _SUFIJO, re.I)
+
+def _lineas(registros: List[Dict[str, Any]], formato: Callable[[Dict[str, Any]], str]) -> str:
+    lineas = [f"- {formato(r)}" for r in registros[:MAX_LINEAS]]
+    if len(registros) > MAX_LINEAS:
+        lineas.append(f"... y {len(registros) - MAX_LINEAS} más.")
+    return '\n'.join(lineas)
+
+async def _alumno(m: re.Match) -> Optional[Dict[str, Any]]:
+    resultado = await crud_alumnos_async(action='read', data={'nombre': m.group('nombre'), 'apellido': m.group('apellido')})
+    return resultado['data'] if resultado.get('status') == 'success' and isinstance(resultado.get('data'), dict) else None
+
+async def _listar(m: re.Match) -> Optional[str]:
+    resultado = await listar_nombres_alumnos_async()
+    nombres = resultado.get('nombres') or []
+    if resultado.get('status') != 'success':
+        return resultado.get('message', 'No se pudo listar los alumnos.')
+    return (f"Hay {len(nombres)} alumnos: {', '.join(nombres)}." if nombres else "No hay alumnos registrados.")
+
+async def _ultimo_pago(m: re.Match) -> Optional[str]:
+    resultado = await ultimo_pago_alumno_async(nombre=m.group('nombre'), apellido=m.group('apellido'))
+    if resultado.get('status') != 'success':
+        return None
+    pago = resultado.get('data')
+    if not pago:
+        return resultado.get('message', 'No se encontraron pagos.')
+    fecha = pago.get('fecha_pago') or pago.get('fecha', '')
+    estado = f" ({pago['estado']})" if pago.get('estado') else ''
+    return f"El último pago de {m.group('nombre')} {m.group('apellido')} fue el {fecha} por ${pago.get('monto', '')}{estado}."
+
+async def _resumen(m: re.Match) -> Optional[str]:
+    alumno = await _alumno(m)
+    if alumno is None:
+        return None
+    resultado = await resumen_alumno_async(alumno_id=alumno['id'])
+    return resultado.get('resumen') or resultado.get('message', '')
+
+_FORMATOS = {
+    'pagos': lambda p: f"{p.get('fecha_pago') or p.get('fecha', '')}: ${p.get('monto', '')}" + (f" ({p['estado']})" if p.get('estado') else ''),
+    'notas': lambda n: f"{n.get('fecha', '')}: {n.get('contenido', '')}",
+    'asistencias': lambda a: f"{a.get('fecha', '')}" + (f", {a['sede']}" if a.get('sede') else ''),
+}
+_LECTURAS = {'pagos': crud_pagos_async, 'notas': crud_notas_async, 'asistencias': crud_asistencias_async}
+
+async def _registros(m: re.Match) -> Optional[str]:
+    coleccion = m.group('coleccion').lower()
+    alumno = await _alumno(m)
+    if alumno is None:
+        return None
+    resultado = await _LECTURAS[coleccion](action='read', data={'alumno_id': alumno['id']})
+    registros = resultado.get('data') if isinstance(resultado.get('data'), list) else []
+    if resultado.get('status') != 'success':
+        return resultado.get('message', '')
+    if not registros:
+        return f"{m.group('nombre')} {m.group('apellido')} no tiene {coleccion} registradas." if coleccion != 'pagos' \
+            else f"{m.group('nombre')} {m.group('apellido')} no tiene pagos registrados."
+    texto = f"{coleccion.capitalize()} de {m.group('nombre')} {m.group('apellido')} ({len(registros)}):\n"
+    return texto + _lineas(registros, _FORMATOS[coleccion])
+
+async def _buscar_notas(m: re.Match) -> Optional[str]:
+    resultado = await buscar_notas_async(consulta=m.group('consulta'))
+    notas = resultado.get('data') or []
+    if resultado.get('status') != 'success' or not notas:
+        return resultado.get('message', 'No se encontraron notas.')
+    texto = f"Notas sobre '{m.group('consulta')}' ({len(notas)}):\n"
+    return texto + _lineas(notas, lambda n: f"{n.get('alumno') or n.get('alumno_id', '')} ({n.get('fecha', '')}): {n.get('contenido', '')}")
+
+# (nombre del atajo, patrón, manejador); gana el primero que calza
+ATAJOS: List[Tuple[str, re.Pattern, Manejador]] = [
+    ('listar_alumnos', _patron(r"(?:list(?:ar|a|ado|ame)\s+(?:de\s+)?(?:los\s+|todos\s+los\s+)?alumnos|(?:todos\s+)?los\s+alumnos|alumnos)"), _listar),
+    ('ultimo_pago', _patron(r"[uú]ltimo\s+pago\s+de\s+" + _NOMBRE), _ultimo_pago),
+    ('resumen', _patron(r"resumen\s+de\s+" + _NOMBRE), _resumen),
+    ('registros', _patron(r"(?P<coleccion>pagos|notas|asistencias)\s+de\s+" + _NOMBRE), _registros),
+    ('buscar_notas', _patron(r"notas\s+(?:con|sobre)\s+(?P<consulta>[^?!.]+?)"), _buscar_notas),
+]
+
+_usos: Counter = Counter()
+_usos_lock = threading.Lock()
+
+def estadisticas() -> Dict[str, int]:
+    """Cuántos mensajes respondió cada atajo (y cuántos siguieron al agente) desde que arrancó el proceso."""
+    with _usos_lock:
+        return dict(_usos)
+
+def reconocer(mensaje: str) -> Optional[Tuple[str, re.Match, Manejador]]:
+    if not isinstance(mensaje, str):
+        # Lo que no es texto no es un pedido de fórmula
+        return None
+    for nombre, patron, manejador in ATAJOS:
+        m = patron.fullmatch(mensaje)
+        if m:
+            return nombre, m, manejador
+    return None
+
+async def responder(mensaje: str) -> Optional[Tuple[str, str]]:
+    """(atajo, texto) si el mensaje es un pedido de fórmula; None si hay que pasarlo al agente."""
+    reconocido = reconocer(mensaje)
+    respuesta = await reconocido[2](reconocido[1]) if reconocido else None
+    with _usos_lock:
+        _usos[reconocido[0] if respuesta is not None else 'agente'] += 1
+    if respuesta is None:
+        return None
+    return reconocido[0], respuesta
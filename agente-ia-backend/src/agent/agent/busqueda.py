@@ -0,0 +1,168 @@
+import functools
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from .cambios import Cambio, diferencias
+from .store import ALUMNOS_PATH, NOTAS_PATH, obtener_coleccion
+from .permisos import requiere_permiso
+
+# Búsqueda de texto libre en notas.contenido con un índice invertido
+# (raíz -> {nota_id: apariciones}) y ranking BM25. El texto se pasa a
+# minúsculas sin tildes y cada palabra se reduce a una raíz aproximada, así
+# "lesión", "lesiones" y "Lesion" caen en el mismo término. El índice se
+# mantiene por diferencias: cuando cambia la colección solo se reindexan las
+# notas que cambiaron.
+
+LIMITE_DEFAULT = 20
+# Parámetros de BM25
+K1 = 1.2
+B = 0.75
+
+STOPWORDS = frozenset("""
+a al ante bajo con contra de del desde durante e el ella ellas ellos en entre era es esta
+este esto estos estas fue ha hace hasta la las le les lo los mas me mi muy ni no nos o
+para pero por que se sin sobre su sus tambien te tiene todo tras tu un una uno unos unas y ya
+""".split())
+
+# Sufijos que se sacan para llegar a la raíz, de más largo a más corto
+SUFIJOS = (
+    'amientos', 'imientos', 'aciones', 'iciones', 'uciones', 'amiento', 'imiento', 'idades',
+    'adoras', 'adores', 'ancias', 'encias', 'ativos', 'ativas', 'acion', 'icion', 'ucion',
+    'adora', 'ancia', 'encia', 'ativo', 'ativa', 'mente', 'ables', 'ibles', 'istas', 'idad',
+    'ador', 'able', 'ible', 'ista', 'ando', 'iendo', 'ados', 'idos', 'adas', 'idas', 'osos',
+    'osas', 'ado', 'ido', 'ada', 'ida', 'oso', 'osa', 'es', 'os', 'as', 'ar', 'er', 'ir',
+    's', 'o', 'a', 'e',
+)
+LARGO_MINIMO_RAIZ = 3
+
+_PALABRA = re.compile(r"[a-z0-9ñ]+")
+
+def plegar(texto: Any) -> str:
+    """Minúsculas y sin tildes (la ñ se conserva)."""
+    texto = str(texto).lower().replace('ñ', '\0')
+    sin_tildes = unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode('ascii')
+    return sin_tildes.replace('\0', 'ñ')
+
+# El vocabulario es chico comparado con la cantidad de palabras: cada raíz se calcula una vez
+@functools.lru_cache(maxsize=65536)
+def raiz(palabra: str) -> str:
+    """Raíz aproximada de una palabra ya plegada ("lesiones" -> "lesion", "tobillo" -> "tobill")."""
+    for sufijo in SUFIJOS:
+        if palabra.endswith(sufijo) and len(palabra) - len(sufijo) >= LARGO_MINIMO_RAIZ:
+            return palabra[:-len(sufijo)]
+    return palabra
+
+def terminos(texto: Any) -> List[str]:
+    return [raiz(p) for p in _PALABRA.findall(plegar(texto)) if p not in STOPWORDS]
+
+class IndiceNotas:
+    """Índice invertido de notas.contenido, sincronizado con la versión vigente de la colección."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.coleccion = None # versión de la colección que refleja el índice
+        self.notas: Dict[Any, Dict[str, Any]] = {}
+        self._por_nota: Dict[Any, Counter] = {}
+        self._largos: Dict[Any, int] = {}
+        self._postings: Dict[str, Dict[Any, int]] = {}
+        self._largo_total = 0
+
+    def _sacar(self, nota_id: Any):
+        cuenta = self._por_nota.pop(nota_id, None)
+        self.notas.pop(nota_id, None)
+        if cuenta is None:
+            return
+        self._largo_total -= self._largos.pop(nota_id)
+        for termino in cuenta:
+            posting = self._postings[termino]
+            del posting[nota_id]
+            if not posting:
+                del self._postings[termino]
+
+    def _poner(self, nota: Dict[str, Any]):
+        cuenta = Counter(terminos(nota.get('contenido', '')))
+        self.notas[nota['id']] = nota
+        self._por_nota[nota['id']] = cuenta
+        self._largos[nota['id']] = sum(cuenta.values())
+        self._largo_total += self._largos[nota['id']]
+        for termino, veces in cuenta.items():
+            self._postings.setdefault(termino, {})[nota['id']] = veces
+
+    def aplicar(self, cambios: List[Cambio]):
+        for op, nota_id, nota, _ in cambios:
+            self._sacar(nota_id)
+            if op != 'delete':
+                self._poner(nota)
+
+    def sincronizar(self):
+        """Lleva el índice a la versión vigente de notas reindexando solo lo que cambió."""
+        coleccion = obtener_coleccion(NOTAS_PATH)
+        if coleccion is self.coleccion:
+            return
+        with self._lock:
+            if coleccion is not self.coleccion:
+                self.aplicar(diferencias(self.notas, coleccion.por_id))
+                self.coleccion = coleccion
+
+    def buscar(self, consulta: str, filtro=None, limite: int = LIMITE_DEFAULT) -> List[Tuple[float, Dict[str, Any]]]:
+        """(puntaje, nota) de las mejores `limite` notas que contienen algún término de la consulta."""
+        self.sincronizar()
+        with self._lock:
+            cantidad = len(self._por_nota)
+            if not cantidad:
+                return []
+            largo_medio = self._largo_total / cantidad or 1
+            puntajes: Dict[Any, float] = {}
+            for termino in set(terminos(consulta)):
+                posting = self._postings.get(termino)
+                if not posting:
+                    continue
+                idf = math.log(1 + (cantidad - len(posting) + 0.5) / (len(posting) + 0.5))
+                for nota_id, veces in posting.items():
+                    tf = veces * (K1 + 1) / (veces + K1 * (1 - B + B * self._largos[nota_id] / largo_medio))
+                    puntajes[nota_id] = puntajes.get(nota_id, 0.0) + idf * tf
+            candidatos = [(p, self.notas[i]) for i, p in puntajes.items() if filtro is None or filtro(self.notas[i])]
+        return heapq.nlargest(limite, candidatos, key=lambda c: (c[0], c[1].get('fecha', '')))
+
+_indice = IndiceNotas()
+
+def indice_notas() -> IndiceNotas:
+    _indice.sincronizar()
+    return _indice
+
+@requiere_permiso('notas', accion='read')
+def buscar_notas(consulta: str, tipo: Optional[str] = None, visible_en_reporte: Optional[bool] = None,
+                 limite: int = LIMITE_DEFAULT) -> Dict[str, Any]:
+    """Busca notas por texto libre en su contenido, ordenadas por relevancia.
+
+    Ignora mayúsculas, tildes y variaciones como plural/singular ("lesión" encuentra "lesiones").
+    Filtros opcionales: 'tipo' (p. ej. 'Lesión', 'General') y 'visible_en_reporte' (true/false).
+    Cada resultado trae el alumno (id y nombre), así no hace falta leer todas las notas.
+
+    Ejemplo: "¿qué alumnos tienen lesiones?" -> consulta='lesión'
+    """
+    print(f"Ejecutando tool: buscar_notas con consulta {consulta!r}")
+    if not terminos(consulta or ''):
+        return {"status": "error", "message": "La consulta no tiene palabras para buscar.", "data": None}
+    tipo_plegado = plegar(tipo).strip() if tipo else None
+
+    def filtro(nota: Dict[str, Any]) -> bool:
+        if tipo_plegado is not None and plegar(nota.get('tipo', '')).strip() != tipo_plegado:
+            return False
+        if visible_en_reporte is not None and bool(nota.get('visible_en_reporte')) != visible_en_reporte:
+            return False
+        return True
+
+    resultados = indice_notas().buscar(consulta, filtro, max(1, int(limite or LIMITE_DEFAULT)))
+    alumnos = obtener_coleccion(ALUMNOS_PATH).por_id
+    data = []
+    for puntaje, nota in resultados:
+        alumno = alumnos.get(nota.get('alumno_id'), {})
+        data.append({**nota, "alumno": f"{alumno.get('nombre', '')} {alumno.get('apellido', '')}".strip(),
+                     "puntaje": round(puntaje, 3)})
+    return {"status": "success", "message": f"{len(data)} notas encontradas para '{consulta}'.", "data": data}
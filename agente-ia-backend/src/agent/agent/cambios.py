@@ -0,0 +1,189 @@
+import contextlib
+import datetime
+import fcntl
+import json
+import os
+import tempfile
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Log de cambios de las colecciones (data/cambios.log, una línea JSON por cambio).
+# Cada insert/update/delete hecho con write_json_file recibe un número de
+# secuencia creciente, así un cliente puede pedir "lo que cambió después de N" en
+# lugar de volver a leer colecciones enteras. El archivo es compartido por todos
+# los workers: cada proceso lee solo lo que se agregó desde su última lectura.
+
+# Cuántos cambios se conservan; los más viejos se descartan al compactar y un
+# cliente que quedó más atrás recibe reset=True (tiene que releer todo).
+RETENER = int(os.environ.get("AGENTE_CAMBIOS_RETENER", "10000"))
+
+Cambio = Tuple[str, Any, Optional[Dict[str, Any]], Optional[Dict[str, Any]]] # (op, id, registro, anterior)
+
+def diferencias(anteriores: Dict[Any, Dict[str, Any]], nuevos: Dict[Any, Dict[str, Any]]) -> List[Cambio]:
+    """Compara dos índices por id y devuelve los inserts, updates y deletes."""
+    cambios: List[Cambio] = []
+    for registro_id, registro in nuevos.items():
+        anterior = anteriores.get(registro_id)
+        if anterior is None:
+            cambios.append(('insert', registro_id, registro, None))
+        elif anterior is not registro and anterior != registro:
+            cambios.append(('update', registro_id, registro, anterior))
+    for registro_id in anteriores.keys() - nuevos.keys():
+        cambios.append(('delete', registro_id, None, anteriores[registro_id]))
+    return cambios
+
+class RegistroCambios:
+    """Log de cambios append-only con secuencia global, compartido entre procesos."""
+
+    def __init__(self, path: str, multiproceso: bool = False):
+        self.path = path
+        self.multiproceso = multiproceso
+        self._lock = threading.RLock()
+        self._entradas: List[Dict[str, Any]] = []
+        self._base = 0 # seq anterior a la primera entrada en memoria
+        self._inodo: Optional[int] = None
+        self._offset = 0
+        self._lineas = 0 # líneas en el archivo según lo leído
+        # Se llaman (sin argumentos) cuando puede haber cambios nuevos
+        self.oyentes: List[Callable[[], None]] = []
+
+    @contextlib.contextmanager
+    def _bloqueo(self) -> Iterator[None]:
+        with self._lock:
+            if not self.multiproceso:
+                yield
+                return
+            with open(self.path + '.lock', 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @property
+    def ultimo_seq(self) -> int:
+        return self._entradas[-1]['seq'] if self._entradas else self._base
+
+    def actual(self) -> int:
+        """Último número de secuencia, incluyendo lo que escribieron otros workers."""
+        with self._lock:
+            self._actualizar()
+            return self.ultimo_seq
+
+    def _actualizar(self):
+        """Incorpora las líneas que se agregaron al archivo (de este u otro proceso)."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if st.st_ino != self._inodo or st.st_size < self._offset:
+            # Archivo nuevo o compactado por otro worker: releer desde el principio
+            self._entradas, self._base, self._offset, self._lineas = [], 0, 0, 0
+            self._inodo = st.st_ino
+        if st.st_size == self._offset:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            datos = f.read()
+        # Solo líneas completas: una escritura concurrente puede estar a la mitad
+        corte = datos.rfind(b'\n') + 1
+        for linea in datos[:corte].splitlines():
+            if not linea.strip():
+                continue
+            entrada = json.loads(linea)
+            if not self._entradas and not self._base:
+                self._base = entrada['seq'] - 1
+            self._entradas.append(entrada)
+            self._lineas += 1
+        self._offset += corte
+        if len(self._entradas) > 2 * RETENER:
+            descartadas = len(self._entradas) - RETENER
+            self._base = self._entradas[descartadas - 1]['seq']
+            del self._entradas[:descartadas]
+
+    def registrar(self, coleccion: str, cambios: List[Cambio]) -> int:
+        """Agrega los cambios de una escritura con números de secuencia consecutivos. Devuelve el último."""
+        if not cambios:
+            return self.ultimo_seq
+        with self._bloqueo():
+            self._actualizar()
+            seq = self.ultimo_seq
+            ts = datetime.datetime.now(datetime.timezone.utc).isoformat()
+            lineas = []
+            for op, registro_id, registro, _ in cambios:
+                seq += 1
+                lineas.append(json.dumps({"seq": seq, "ts": ts, "coleccion": coleccion, "op": op, "id": registro_id, "registro": registro},
+                                         ensure_ascii=False, default=str))
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write('\n'.join(lineas) + '\n')
+            self._actualizar()
+            if self._lineas > 2 * RETENER:
+                self._compactar()
+        self.notificar()
+        return seq
+
+    def notificar(self):
+        for oyente in self.oyentes:
+            try:
+                oyente()
+            except Exception as e:
+                print(f"Error avisando cambios nuevos: {e}")
+
+    def compactar(self) -> int:
+        """Descarta del archivo lo que excede RETENER (sin esperar a que se duplique). Devuelve cuántas líneas quedan."""
+        with self._bloqueo():
+            self._actualizar()
+            if self._lineas > RETENER:
+                self._compactar()
+            return self._lineas
+
+    def _compactar(self):
+        """Reescribe el archivo con las últimas RETENER entradas (con el bloqueo tomado)."""
+        conservar = self._entradas[-RETENER:]
+        directorio = os.path.dirname(self.path)
+        fd, tmp_path = tempfile.mkstemp(prefix='.cambios.', suffix='.tmp', dir=directorio)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                for entrada in conservar:
+                    f.write(json.dumps(entrada, ensure_ascii=False, default=str) + '\n')
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
+            raise
+        self._inodo = None # fuerza a releer el archivo compactado
+        self._actualizar()
+
+    def desde(self, seq: int, limite: int = 1000) -> Dict[str, Any]:
+        """Cambios con número de secuencia mayor a `seq` (a lo sumo `limite`).
+
+        Devuelve también el cursor para el próximo pedido y reset=True si `seq`
+        es más viejo que lo que se conserva (o de un log que ya no existe).
+        """
+        with self._lock:
+            self._actualizar()
+            ultimo = self.ultimo_seq
+            primero = self._entradas[0]['seq'] if self._entradas else ultimo + 1
+            if seq > ultimo or seq < primero - 1:
+                return {"cambios": [], "cursor": ultimo, "reset": True}
+            inicio = seq - primero + 1
+            entradas = self._entradas[inicio:inicio + limite]
+        cursor = entradas[-1]['seq'] if entradas else ultimo
+        return {"cambios": entradas, "cursor": cursor, "reset": False}
+
+    def aplicar_desde(self, seq: int, coleccion: str, aplicar: Callable[[Dict[str, Any]], None], limite: int = 5000) -> Optional[int]:
+        """Llama a `aplicar` con cada entrada de `coleccion` posterior a `seq`, en orden.
+
+        Devuelve el nuevo cursor, o None si el log ya no tiene esos cambios (hay
+        que volver a armar lo que se mantenía desde la colección).
+        """
+        while True:
+            pagina = self.desde(seq, limite)
+            if pagina['reset']:
+                return None
+            for entrada in pagina['cambios']:
+                if entrada['coleccion'] == coleccion:
+                    aplicar(entrada)
+            seq = pagina['cursor']
+            if len(pagina['cambios']) < limite:
+                return seq
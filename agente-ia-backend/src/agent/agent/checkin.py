@@ -0,0 +1,175 @@
+import datetime
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+from .store import (
+    ALUMNOS_PATH,
+    ASISTENCIAS_PATH,
+    agregar_registros,
+    bloqueo_escritura,
+    buscar_por_alumno,
+    buscar_por_id,
+    obtener_coleccion,
+    write_json_file,
+)
+
+# Check-in de asistencias con group commit. Al empezar una clase llegan
+# decenas de check-ins en pocos segundos; en lugar de una escritura por
+# asistencia (crud_asistencias create), cada check-in entra a una cola y un
+# solo thread los guarda en lotes: cuando pasan ESPERA_MS desde el primero o
+# se juntan LOTE. Cada lote es una escritura de asistencias (solo las
+# particiones de sus meses) más una de alumnos con fecha_ultima_asistencia,
+# las dos con fsync y publicadas juntas. El que hizo el check-in recibe la
+# respuesta recién cuando su lote está en disco.
+
+ESPERA_SEGUNDOS = float(os.environ.get("AGENTE_CHECKIN_ESPERA_MS", "20")) / 1000
+LOTE = int(os.environ.get("AGENTE_CHECKIN_LOTE", "100"))
+ESTADO_DEFAULT = 'presente'
+
+class ErrorCheckin(ValueError):
+    pass
+
+def preparar(datos: Dict[str, Any]) -> Dict[str, Any]:
+    """Asistencia lista para encolar a partir del body de un check-in; lanza ErrorCheckin si no es válido."""
+    alumno_id = datos.get('alumno_id')
+    if not alumno_id:
+        raise ErrorCheckin("Falta el alumno_id")
+    alumno = buscar_por_id(ALUMNOS_PATH, alumno_id)
+    if alumno is None:
+        raise ErrorCheckin(f"No existe el alumno {alumno_id}")
+    ahora = datetime.datetime.now()
+    fecha = str(datos.get('fecha') or ahora.date().isoformat())[:10]
+    try:
+        datetime.date.fromisoformat(fecha)
+    except ValueError:
+        raise ErrorCheckin(f"Fecha inválida: {datos.get('fecha')!r}")
+    registro = {
+        'id': str(uuid.uuid4()),
+        'alumno_id': alumno_id,
+        'fecha': fecha,
+        'hora': datos.get('hora') or ahora.strftime('%H:%M:%S'),
+        'estado': datos.get('estado') or ESTADO_DEFAULT,
+    }
+    sede = datos.get('sede') or alumno.get('sede')
+    if sede:
+        registro['sede'] = sede
+    if alumno.get('shift_id'):
+        registro['shift_id'] = alumno['shift_id']
+    return registro
+
+def guardar_lote(registros: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], bool]]:
+    """Guarda un lote de check-ins en una escritura. Devuelve (asistencia, si es nueva) por cada uno.
+
+    Un segundo check-in del mismo alumno el mismo día no crea otra asistencia:
+    devuelve la que ya estaba (del lote o de antes).
+    """
+    with bloqueo_escritura(ASISTENCIAS_PATH), bloqueo_escritura(ALUMNOS_PATH):
+        resultado: List[Tuple[Dict[str, Any], bool]] = []
+        del_dia: Dict[Tuple[Any, str], Dict[str, Any]] = {}
+        cargados = set()
+        nuevos = []
+        for registro in registros:
+            alumno_id = registro['alumno_id']
+            if alumno_id not in cargados:
+                # Todas las asistencias del alumno y no solo la última: el check-in puede ser de un día anterior
+                for asistencia in buscar_por_alumno(ASISTENCIAS_PATH, alumno_id):
+                    del_dia.setdefault((alumno_id, str(asistencia.get('fecha', ''))[:10]), asistencia)
+                cargados.add(alumno_id)
+            clave = (alumno_id, registro['fecha'])
+            existente = del_dia.get(clave)
+            if existente is not None:
+                resultado.append((existente, False))
+                continue
+            del_dia[clave] = registro
+            nuevos.append(registro)
+            resultado.append((registro, True))
+        if not nuevos:
+            return resultado
+        agregar_registros(ASISTENCIAS_PATH, nuevos, durable=True)
+        ultimas: Dict[Any, str] = {}
+        for registro in nuevos:
+            ultimas[registro['alumno_id']] = max(ultimas.get(registro['alumno_id'], ''), registro['fecha'])
+        alumnos = obtener_coleccion(ALUMNOS_PATH)
+        cambios = {alumno_id: fecha for alumno_id, fecha in ultimas.items()
+                   if alumno_id in alumnos.por_id and str(alumnos.por_id[alumno_id].get('fecha_ultima_asistencia') or '') < fecha}
+        if cambios:
+            write_json_file(ALUMNOS_PATH, [
+                {**a, 'fecha_ultima_asistencia': cambios[a['id']]} if isinstance(a, dict) and a.get('id') in cambios else a
+                for a in alumnos.registros], durable=True)
+        return resultado
+
+class AgrupadorCheckins:
+    """Cola de check-ins y el thread que los escribe por lotes (group commit)."""
+
+    def __init__(self, espera: float = ESPERA_SEGUNDOS, lote: int = LOTE):
+        self.espera = espera
+        self.lote = max(1, lote)
+        self._cola: "queue.Queue[Optional[Tuple[Dict[str, Any], Future]]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._hilo: Optional[threading.Thread] = None
+        self.checkins = 0
+        self.lotes = 0
+        self.mayor_lote = 0
+
+    def encolar(self, registro: Dict[str, Any]) -> Future:
+        """Suma un check-in al próximo lote. El Future se resuelve con (asistencia, si es nueva) cuando está en disco."""
+        futuro: Future = Future()
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._correr, name="checkin", daemon=True)
+                self._hilo.start()
+            self._cola.put((registro, futuro))
+        return futuro
+
+    def _correr(self):
+        seguir = True
+        while seguir:
+            primero = self._cola.get()
+            if primero is None:
+                break
+            pendientes = [primero]
+            limite = time.monotonic() + self.espera
+            while len(pendientes) < self.lote:
+                try:
+                    item = self._cola.get(timeout=max(0.0, limite - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    seguir = False
+                    break
+                pendientes.append(item)
+            self._escribir(pendientes)
+
+    def _escribir(self, pendientes: List[Tuple[Dict[str, Any], Future]]):
+        try:
+            resultados = guardar_lote([registro for registro, _ in pendientes])
+        except Exception as e:
+            print(f"Error guardando un lote de {len(pendientes)} check-ins: {e}")
+            for _, futuro in pendientes:
+                futuro.set_exception(e)
+            return
+        self.checkins += len(pendientes)
+        self.lotes += 1
+        self.mayor_lote = max(self.mayor_lote, len(pendientes))
+        for (_, futuro), resultado in zip(pendientes, resultados):
+            futuro.set_result(resultado)
+
+    def detener(self):
+        """Escribe lo que quedó en la cola y termina el thread (al apagar el servidor)."""
+        with self._lock:
+            hilo, self._hilo = self._hilo, None
+            if hilo is not None:
+                self._cola.put(None)
+        if hilo is not None:
+            hilo.join()
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {"checkins": self.checkins, "lotes": self.lotes, "mayor_lote": self.mayor_lote,
+                "promedio_lote": round(self.checkins / self.lotes, 1) if self.lotes else 0, "en_cola": self._cola.qsize()}
+
+agrupador = AgrupadorCheckins()
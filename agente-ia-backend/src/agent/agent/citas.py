@@ -0,0 +1,443 @@
+import bisect
+import calendar
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from .store import (
+    CITAS_PATH,
+    obtener_coleccion,
+    read_json_file,
+    write_json_file,
+    buscar_por_id,
+    serializar_escrituras,
+)
+from .permisos import requiere_permiso
+from .recurrencia import a_fecha, es_recurrente, instancia, ocurrencias, ocurre_en
+
+# Citas (turnos con el profe) con el mismo esquema que la tabla `citas` de Supabase:
+# date (YYYY-MM-DD), time (HH:MM), duration y buffertime en minutos, maxcapacity
+# para las clases grupales. Los choques se resuelven con un árbol de intervalos
+# por día, así disponibilidad y huecos libres cuestan O(log n + k).
+
+DURACION_DEFAULT = 60
+BUFFER_DEFAULT = 15
+# Franja en la que se buscan huecos si no se indica otra
+APERTURA_DEFAULT = "08:00"
+CIERRE_DEFAULT = "22:00"
+ESTADOS_INACTIVOS = {'cancelled'}
+# Hasta cuántos días hacia adelante se validan choques al crear una serie sin recurringend
+HORIZONTE_RECURRENCIA_DIAS = 180
+# Ventanas de calendario expandidas que se guardan por versión de la colección
+VENTANAS_EN_CACHE = 32
+# Días máximos que abarca un pedido de calendario (cada día expande todas las series)
+MAX_DIAS_CALENDARIO = int(os.environ.get("AGENTE_CITAS_MAX_DIAS_CALENDARIO", "366"))
+
+# --- Árbol de intervalos ---
+
+Intervalo = Tuple[int, int, Dict[str, Any]]
+
+class ArbolIntervalos:
+    """Árbol de intervalos centrado y estático sobre intervalos semiabiertos [inicio, fin).
+
+    Cada nodo guarda los intervalos que contienen su centro ordenados por inicio
+    y por fin; los que terminan antes van a la izquierda y los que empiezan
+    después a la derecha.
+    """
+
+    __slots__ = ('centro', 'por_inicio', 'por_fin', 'izquierda', 'derecha')
+
+    def __init__(self, intervalos: List[Intervalo]):
+        inicios = sorted(iv[0] for iv in intervalos)
+        self.centro = inicios[len(inicios) // 2] if inicios else 0
+        aca, izq, der = [], [], []
+        # Los intervalos vacíos (fin == inicio) no se superponen con nada; si
+        # quedaran, uno que empieza en el centro bajaría a la izquierda para siempre
+        for iv in (iv for iv in intervalos if iv[1] > iv[0]):
+            if iv[1] <= self.centro:
+                izq.append(iv)
+            elif iv[0] > self.centro:
+                der.append(iv)
+            else:
+                aca.append(iv)
+        self.por_inicio = sorted(aca, key=lambda iv: iv[0])
+        self.por_fin = sorted(aca, key=lambda iv: iv[1], reverse=True)
+        self.izquierda = ArbolIntervalos(izq) if izq else None
+        self.derecha = ArbolIntervalos(der) if der else None
+
+    def solapados(self, desde: int, hasta: int) -> List[Intervalo]:
+        """Intervalos que se superponen con [desde, hasta)."""
+        encontrados: List[Intervalo] = []
+        if hasta > desde:
+            self._solapados(desde, hasta, encontrados)
+        return encontrados
+
+    def _solapados(self, desde: int, hasta: int, encontrados: List[Intervalo]):
+        nodo = self
+        while nodo is not None:
+            if hasta <= nodo.centro:
+                # Todo el nodo termina después de `desde`: alcanza con mirar los inicios
+                for iv in nodo.por_inicio:
+                    if iv[0] >= hasta:
+                        break
+                    encontrados.append(iv)
+                nodo = nodo.izquierda
+            elif desde > nodo.centro:
+                for iv in nodo.por_fin:
+                    if iv[1] <= desde:
+                        break
+                    encontrados.append(iv)
+                nodo = nodo.derecha
+            else:
+                # El centro cae dentro de la consulta: todos los del nodo se superponen
+                encontrados.extend(nodo.por_inicio)
+                if nodo.izquierda is not None:
+                    nodo.izquierda._solapados(desde, hasta, encontrados)
+                nodo = nodo.derecha
+
+# --- Helpers de horarios ---
+
+def a_minutos(hora: str) -> int:
+    """'18:30' o '18:30:00' -> minutos desde la medianoche."""
+    partes = str(hora).split(':')
+    return int(partes[0]) * 60 + (int(partes[1]) if len(partes) > 1 else 0)
+
+def hora_valida(hora: Any) -> bool:
+    """True si `hora` es 'HH:MM' (o 'HH:MM:SS') dentro del día."""
+    partes = str(hora).split(':')
+    try:
+        return 1 <= len(partes) <= 3 and 0 <= int(partes[0]) < 24 and all(0 <= int(p) < 60 for p in partes[1:])
+    except ValueError:
+        return False
+
+def a_hora(minutos: int) -> str:
+    return f"{minutos // 60:02d}:{minutos % 60:02d}"
+
+def _entero(valor: Any, default: int) -> int:
+    try:
+        return int(valor) if valor not in (None, '') else default
+    except (TypeError, ValueError):
+        return default
+
+def intervalo_cita(cita: Dict[str, Any]) -> Tuple[int, int, int]:
+    """(inicio, fin, fin + buffer) de una cita, en minutos."""
+    inicio = a_minutos(cita['time'])
+    fin = inicio + _entero(cita.get('duration'), DURACION_DEFAULT)
+    return inicio, fin, fin + _entero(cita.get('buffertime'), BUFFER_DEFAULT)
+
+# --- Índice por día ---
+
+class IndiceCitas:
+    """Árboles de intervalos por fecha, armados a demanda para una versión de la colección.
+
+    Las citas sueltas se agrupan por fecha. Las series recurrentes no se
+    materializan: se indexan por tipo (diarias, por día de la semana, por día
+    del mes) y sus ocurrencias se calculan solo para los días consultados.
+    """
+
+    def __init__(self, coleccion):
+        self.coleccion = coleccion
+        self.por_fecha: Dict[str, List[Dict[str, Any]]] = {}
+        self.series_diarias: List[Dict[str, Any]] = []
+        self.series_semanales: Dict[int, List[Dict[str, Any]]] = {}
+        self.series_mensuales: Dict[int, List[Dict[str, Any]]] = {}
+        for cita in coleccion.registros:
+            if not (isinstance(cita, dict) and cita.get('date') and cita.get('time') and cita.get('status') not in ESTADOS_INACTIVOS):
+                continue
+            if es_recurrente(cita):
+                inicio = a_fecha(cita['date'])
+                if cita['recurringtype'] == 'daily':
+                    self.series_diarias.append(cita)
+                elif cita['recurringtype'] == 'weekly':
+                    self.series_semanales.setdefault(inicio.weekday(), []).append(cita)
+                else:
+                    self.series_mensuales.setdefault(inicio.day, []).append(cita)
+            else:
+                self.por_fecha.setdefault(str(cita['date'])[:10], []).append(cita)
+        self.fechas = sorted(self.por_fecha)
+        self._arboles: Dict[str, ArbolIntervalos] = {}
+        self._ventanas: "OrderedDict[Tuple[str, str], Dict[str, List[Dict[str, Any]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _series_candidatas(self, dia: date) -> List[Dict[str, Any]]:
+        candidatas = self.series_diarias + self.series_semanales.get(dia.weekday(), [])
+        ultimo_dia = calendar.monthrange(dia.year, dia.month)[1]
+        if dia.day < ultimo_dia:
+            candidatas = candidatas + self.series_mensuales.get(dia.day, [])
+        else:
+            # Las series del 29, 30 o 31 caen el último día de los meses más cortos
+            for d, series in self.series_mensuales.items():
+                if d >= dia.day:
+                    candidatas = candidatas + series
+        return candidatas
+
+    def citas_del_dia(self, fecha: str) -> List[Dict[str, Any]]:
+        dia = a_fecha(fecha)
+        citas = self.por_fecha.get(fecha, [])
+        if dia is None:
+            return citas
+        return citas + [instancia(serie, dia) for serie in self._series_candidatas(dia) if ocurre_en(serie, dia)]
+
+    def arbol(self, fecha: str) -> ArbolIntervalos:
+        arbol = self._arboles.get(fecha)
+        if arbol is None:
+            intervalos = []
+            for cita in self.citas_del_dia(fecha):
+                inicio, _, fin_con_buffer = intervalo_cita(cita)
+                intervalos.append((inicio, fin_con_buffer, cita))
+            arbol = ArbolIntervalos(intervalos)
+            with self._lock:
+                self._arboles[fecha] = arbol
+        return arbol
+
+    def calendario(self, desde: str, hasta: str) -> Dict[str, List[Dict[str, Any]]]:
+        """Citas por día (sueltas y ocurrencias de series) entre dos fechas inclusive.
+
+        Las ventanas ya expandidas se guardan (LRU) hasta que cambia la colección.
+        Lanza ValueError si las fechas no son válidas o el rango supera MAX_DIAS_CALENDARIO días.
+        """
+        inicio, fin = a_fecha(desde), a_fecha(hasta)
+        if inicio is None or fin is None or fin < inicio:
+            raise ValueError("Se requieren 'desde' y 'hasta' (YYYY-MM-DD) para el calendario")
+        if (fin - inicio).days + 1 > MAX_DIAS_CALENDARIO:
+            raise ValueError(f"El rango del calendario no puede superar {MAX_DIAS_CALENDARIO} días")
+        clave = (desde, hasta)
+        with self._lock:
+            if clave in self._ventanas:
+                self._ventanas.move_to_end(clave)
+                return self._ventanas[clave]
+        dias: Dict[str, List[Dict[str, Any]]] = {}
+        for fecha in self.fechas[bisect.bisect_left(self.fechas, desde):bisect.bisect_right(self.fechas, hasta)]:
+            dias[fecha] = list(self.por_fecha[fecha])
+        series = self.series_diarias + [c for l in self.series_semanales.values() for c in l] + [c for l in self.series_mensuales.values() for c in l]
+        for serie in series:
+            for dia in ocurrencias(serie, inicio, fin):
+                dias.setdefault(dia.isoformat(), []).append(instancia(serie, dia))
+        resultado = {fecha: sorted(dias[fecha], key=lambda c: a_minutos(c['time'])) for fecha in sorted(dias)}
+        with self._lock:
+            self._ventanas[clave] = resultado
+            if len(self._ventanas) > VENTANAS_EN_CACHE:
+                self._ventanas.popitem(last=False)
+        return resultado
+
+_indice: Optional[IndiceCitas] = None
+_indice_lock = threading.Lock()
+
+def indice_citas() -> IndiceCitas:
+    """Índice vigente; se rearma cuando la colección de citas cambia (escritura o recarga)."""
+    global _indice
+    coleccion = obtener_coleccion(CITAS_PATH)
+    indice = _indice
+    if indice is None or indice.coleccion is not coleccion:
+        with _indice_lock:
+            if _indice is None or _indice.coleccion is not coleccion:
+                _indice = IndiceCitas(coleccion)
+            indice = _indice
+    return indice
+
+# --- Disponibilidad ---
+
+def verificar_disponibilidad(fecha: str, hora: str, duracion: Optional[int] = None, buffer: Optional[int] = None,
+                             titulo: Optional[str] = None, excluir_id: Optional[str] = None) -> Dict[str, Any]:
+    """Chequea si se puede agendar en fecha/hora.
+
+    Una cita ocupa [inicio, fin + buffertime). Si lo único que se superpone es
+    una clase grupal que empieza a la misma hora y dura lo mismo, se cuenta como
+    un lugar más en esa clase mientras no se llegue a maxcapacity.
+    """
+    inicio = a_minutos(hora)
+    fin = inicio + _entero(duracion, DURACION_DEFAULT)
+    fin_con_buffer = fin + _entero(buffer, BUFFER_DEFAULT)
+    solapados = [iv for iv in indice_citas().arbol(fecha).solapados(inicio, fin_con_buffer) if iv[2].get('id') != excluir_id]
+
+    misma_clase = [iv for iv in solapados
+                   if _entero(iv[2].get('maxcapacity'), 1) > 1 and iv[0] == inicio
+                   and intervalo_cita(iv[2])[1] == fin
+                   and (titulo is None or iv[2].get('title') == titulo)]
+    if solapados and len(misma_clase) == len(solapados):
+        capacidad = max(_entero(iv[2].get('maxcapacity'), 1) for iv in misma_clase)
+        lugares = capacidad - len(misma_clase)
+        conflictos = [] if lugares > 0 else [_conflicto(iv, 'capacity', 'high') for iv in misma_clase[:1]]
+        return {"disponible": lugares > 0, "lugares": max(lugares, 0), "conflictos": conflictos}
+
+    conflictos = []
+    for iv in sorted(solapados, key=lambda iv: iv[0]):
+        _, fin_existente, _ = intervalo_cita(iv[2])
+        # Sin contar buffers, ¿se pisan de verdad?
+        if iv[0] < fin and inicio < fin_existente:
+            conflictos.append(_conflicto(iv, 'overlap', 'high'))
+        else:
+            conflictos.append(_conflicto(iv, 'buffer', 'medium'))
+    return {"disponible": not conflictos, "lugares": 1 if not conflictos else 0, "conflictos": conflictos}
+
+def verificar_serie(cita: Dict[str, Any], excluir_id: Optional[str] = None) -> Dict[str, Any]:
+    """Como verificar_disponibilidad, pero para todas las ocurrencias de una cita recurrente.
+
+    Recorre las ocurrencias de forma perezosa (hasta recurringend o el horizonte)
+    y corta en el primer día con choque.
+    """
+    inicio = a_fecha(cita['date'])
+    fin = a_fecha(cita.get('recurringend')) or inicio + timedelta(days=HORIZONTE_RECURRENCIA_DIAS)
+    resultado = {"disponible": True, "lugares": 1, "conflictos": []}
+    for dia in ocurrencias(cita, inicio, fin):
+        resultado = verificar_disponibilidad(dia.isoformat(), cita['time'], cita['duration'], cita['buffertime'], cita.get('title'), excluir_id)
+        if not resultado['disponible']:
+            resultado['fecha'] = dia.isoformat()
+            return resultado
+    return resultado
+
+def _conflicto(iv: Intervalo, tipo: str, severidad: str) -> Dict[str, Any]:
+    cita = iv[2]
+    return {"id": cita.get('id'), "title": cita.get('title'), "time": a_hora(iv[0]), "type": tipo, "severity": severidad}
+
+def huecos_libres(fecha: str, duracion: Optional[int] = None, desde: Optional[str] = None, hasta: Optional[str] = None) -> List[Dict[str, str]]:
+    """Franjas libres del día donde entra una cita de `duracion` minutos (más su buffer)."""
+    necesario = _entero(duracion, DURACION_DEFAULT) + BUFFER_DEFAULT
+    apertura = a_minutos(desde or APERTURA_DEFAULT)
+    cierre = a_minutos(hasta or CIERRE_DEFAULT)
+    ocupados = sorted(indice_citas().arbol(fecha).solapados(apertura, cierre), key=lambda iv: iv[0])
+    huecos, cursor = [], apertura
+    for inicio, fin, _ in ocupados:
+        if inicio - cursor >= necesario:
+            huecos.append({"desde": a_hora(cursor), "hasta": a_hora(inicio)})
+        cursor = max(cursor, fin)
+    if cierre - cursor >= necesario:
+        huecos.append({"desde": a_hora(cursor), "hasta": a_hora(cierre)})
+    return huecos
+
+# --- Tool ---
+
+def _error_de_datos(action: str, data: Dict[str, Any]) -> Optional[str]:
+    """Mensaje de error si alguna fecha, hora o duración de `data` no se puede interpretar."""
+    fechas = ['date', 'recurringend'] + (['desde', 'hasta'] if action == 'calendario' else [])
+    horas = ['time'] + (['desde', 'hasta'] if action == 'huecos' else [])
+    for campo in fechas:
+        if data.get(campo) not in (None, '') and a_fecha(data[campo]) is None:
+            return f"'{campo}' inválido: {data[campo]!r} (se espera YYYY-MM-DD)."
+    for campo in horas:
+        if data.get(campo) not in (None, '') and not hora_valida(data[campo]):
+            return f"'{campo}' inválido: {data[campo]!r} (se espera HH:MM)."
+    for campo, minimo in (('duration', 1), ('buffertime', 0), ('maxcapacity', 1)):
+        if data.get(campo) not in (None, '') and _entero(data[campo], minimo - 1) < minimo:
+            return f"'{campo}' inválido: {data[campo]!r} (se espera un entero mayor o igual a {minimo})."
+    return None
+
+def _normalizar_cita(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Completa los defaults de la tabla citas de Supabase."""
+    cita = dict(data)
+    cita['date'] = str(cita['date'])[:10]
+    cita['time'] = a_hora(a_minutos(cita['time']))
+    cita['duration'] = _entero(cita.get('duration'), DURACION_DEFAULT)
+    cita['status'] = cita.get('status') or 'scheduled'
+    cita['type'] = cita.get('type') or 'individual'
+    cita['recurring'] = bool(cita.get('recurring', False))
+    cita['maxcapacity'] = _entero(cita.get('maxcapacity'), 1)
+    cita['buffertime'] = _entero(cita.get('buffertime'), BUFFER_DEFAULT)
+    return cita
+
+@requiere_permiso('citas', lecturas=('read', 'disponibilidad', 'huecos', 'calendario'))
+@serializar_escrituras(CITAS_PATH, lecturas=('read', 'disponibilidad', 'huecos', 'calendario'))
+def crud_citas(action: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Gestiona citas (turnos) y responde consultas de disponibilidad.
+
+    Acciones:
+    - 'create': requiere 'title', 'date' (YYYY-MM-DD), 'time' (HH:MM) y 'student_id' (id del alumno).
+      Opcionales: 'duration' (min, 60), 'type' ('individual', 'group', 'evaluation', 'consultation'),
+      'maxcapacity' (lugares de una clase grupal), 'buffertime' (min, 15), 'notes'.
+      Rechaza la cita si el horario está ocupado.
+    - 'read': por 'id', por 'student_id', por 'date', o todas si data está vacío.
+    - 'update': requiere 'id' y los campos a cambiar.
+    - 'delete': requiere 'id'.
+    - 'disponibilidad': requiere 'date' y 'time'; opcional 'duration'. Indica si hay lugar y qué choca.
+    - 'huecos': requiere 'date'; opcionales 'duration', 'desde' y 'hasta' (HH:MM). Lista franjas libres.
+    - 'calendario': requiere 'desde' y 'hasta' (YYYY-MM-DD). Citas agrupadas por día, incluyendo
+      las ocurrencias de citas recurrentes ('recurring', 'recurringtype' daily/weekly/monthly, 'recurringend').
+
+    Ejemplo: "¿hay lugar el martes a las 18?" -> action='disponibilidad', data={'date': '2025-06-03', 'time': '18:00'}
+    """
+    print(f"Ejecutando tool: crud_citas con acción {action} y data {data}")
+    data = data if isinstance(data, dict) else {}
+    error = _error_de_datos(action, data)
+    if error:
+        return {"status": "error", "message": error, "data": None}
+
+    if action == 'create':
+        if not all(data.get(k) for k in ('title', 'date', 'time', 'student_id')):
+            return {"status": "error", "message": "Faltan datos requeridos ('title', 'date', 'time', 'student_id') para crear la cita.", "data": None}
+        cita = _normalizar_cita(data)
+        disponibilidad = verificar_serie(cita)
+        if not disponibilidad['disponible']:
+            return {"status": "error", "message": "El horario seleccionado no está disponible.", "data": disponibilidad}
+        cita['id'] = str(uuid.uuid4())
+        citas = read_json_file(CITAS_PATH)
+        citas.append(cita)
+        write_json_file(CITAS_PATH, citas)
+        return {"status": "success", "message": "Cita creada con éxito.", "data": cita}
+
+    elif action == 'read':
+        if data.get('id'):
+            cita = buscar_por_id(CITAS_PATH, data['id'])
+            if cita:
+                return {"status": "success", "message": "Cita encontrada.", "data": cita}
+            return {"status": "error", "message": "Cita no encontrada.", "data": None}
+        if data.get('student_id'):
+            citas = [c for c in read_json_file(CITAS_PATH) if isinstance(c, dict) and c.get('student_id') == data['student_id']]
+            return {"status": "success", "message": f"Citas encontradas para el alumno {data['student_id']}.", "data": citas}
+        if data.get('date'):
+            fecha = str(data['date'])[:10]
+            citas = sorted((dict(c) for c in indice_citas().citas_del_dia(fecha)), key=lambda c: a_minutos(c['time']))
+            return {"status": "success", "message": f"Citas del {fecha}.", "data": citas}
+        return {"status": "success", "message": "Lista de todas las citas.", "data": read_json_file(CITAS_PATH)}
+
+    elif action == 'update':
+        if not data.get('id'):
+            return {"status": "error", "message": "Se requiere el ID de la cita para actualizar.", "data": None}
+        citas = read_json_file(CITAS_PATH)
+        indice = next((i for i, c in enumerate(citas) if isinstance(c, dict) and c.get('id') == data['id']), -1)
+        if indice == -1:
+            return {"status": "error", "message": "Cita no encontrada para actualizar.", "data": None}
+        actualizada = _normalizar_cita({**citas[indice], **data})
+        if actualizada['status'] not in ESTADOS_INACTIVOS and any(k in data for k in ('date', 'time', 'duration', 'buffertime', 'status', 'recurring', 'recurringtype', 'recurringend')):
+            disponibilidad = verificar_serie(actualizada, excluir_id=data['id'])
+            if not disponibilidad['disponible']:
+                return {"status": "error", "message": "El nuevo horario no está disponible.", "data": disponibilidad}
+        citas[indice] = actualizada
+        write_json_file(CITAS_PATH, citas)
+        return {"status": "success", "message": "Cita actualizada con éxito.", "data": actualizada}
+
+    elif action == 'delete':
+        if not data.get('id'):
+            return {"status": "error", "message": "Se requiere el ID de la cita para eliminar.", "data": None}
+        citas = read_json_file(CITAS_PATH)
+        restantes = [c for c in citas if not (isinstance(c, dict) and c.get('id') == data['id'])]
+        if len(restantes) == len(citas):
+            return {"status": "error", "message": "Cita no encontrada para eliminar.", "data": None}
+        write_json_file(CITAS_PATH, restantes)
+        return {"status": "success", "message": "Cita eliminada con éxito.", "data": {"id": data['id']}}
+
+    elif action == 'disponibilidad':
+        if not data.get('date') or not data.get('time'):
+            return {"status": "error", "message": "Se requieren 'date' y 'time' para consultar disponibilidad.", "data": None}
+        resultado = verificar_disponibilidad(str(data['date'])[:10], data['time'], data.get('duration'), data.get('buffertime'), data.get('title'))
+        mensaje = "Hay lugar en ese horario." if resultado['disponible'] else "Ese horario está ocupado."
+        return {"status": "success", "message": mensaje, "data": resultado}
+
+    elif action == 'huecos':
+        if not data.get('date'):
+            return {"status": "error", "message": "Se requiere 'date' para buscar huecos libres.", "data": None}
+        huecos = huecos_libres(str(data['date'])[:10], data.get('duration'), data.get('desde'), data.get('hasta'))
+        return {"status": "success", "message": f"{len(huecos)} franjas libres.", "data": huecos}
+
+    elif action == 'calendario':
+        desde, hasta = a_fecha(data.get('desde')), a_fecha(data.get('hasta'))
+        if not desde or not hasta or hasta < desde:
+            return {"status": "error", "message": "Se requieren 'desde' y 'hasta' (YYYY-MM-DD) para el calendario.", "data": None}
+        if (hasta - desde).days + 1 > MAX_DIAS_CALENDARIO:
+            return {"status": "error", "message": f"El rango del calendario no puede superar {MAX_DIAS_CALENDARIO} días.", "data": None}
+        dias = indice_citas().calendario(desde.isoformat(), hasta.isoformat())
+        return {"status": "success", "message": f"{sum(len(c) for c in dias.values())} citas entre {desde} y {hasta}.", "data": dias}
+
+    return {"status": "error", "message": "Acción no reconocida para citas.", "data": None}
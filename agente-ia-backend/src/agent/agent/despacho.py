@@ -0,0 +1,62 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Ejecución de las tools del agente. Cuando el modelo pide varias tools en un
+# mismo turno, ADK lanza todas las llamadas juntas, pero una tool síncrona
+# corre dentro del event loop y las demás esperan a que termine. Acá cada tool
+# se envuelve en una corrutina: las lecturas van a un pool de threads y corren
+# en paralelo; las escrituras pasan de a una y en el orden en que las pidió el
+# modelo. Un turno con varias lecturas tarda lo que la más lenta y no la suma.
+
+HILOS_TOOLS = int(os.environ.get("AGENTE_HILOS_TOOLS", "8"))
+
+_pool: Optional[ThreadPoolExecutor] = None
+# Uno por event loop: las escrituras del agente no se pisan entre sí
+_escrituras: Dict[asyncio.AbstractEventLoop, asyncio.Lock] = {}
+
+def _pool_tools() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=HILOS_TOOLS, thread_name_prefix="tools")
+    return _pool
+
+def _lock_escrituras() -> asyncio.Lock:
+    loop = asyncio.get_running_loop()
+    lock = _escrituras.get(loop)
+    if lock is None:
+        lock = _escrituras[loop] = asyncio.Lock()
+    return lock
+
+async def _en_thread(fn: Callable, kwargs: Dict[str, Any]) -> Any:
+    # run_in_executor no copia el contexto (a diferencia de asyncio.to_thread): el usuario actual viaja en él
+    contexto = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_pool_tools(), lambda: contexto.run(fn, **kwargs))
+
+def despachar(fn: Callable, lecturas: Tuple[str, ...] = ('read',), escribe: bool = False) -> Callable:
+    """Versión async de una tool para el agente, con la misma firma y docstring.
+
+    Una tool con argumento `action` es de lectura si la acción está en `lecturas`;
+    las tools sin `action` (resumen, listados, búsquedas) son de lectura salvo
+    que se pase escribe=True (p. ej. la facturación del mes).
+    """
+    con_accion = 'action' in inspect.signature(fn).parameters
+
+    @functools.wraps(fn)
+    async def envoltura(**kwargs):
+        if not escribe and (not con_accion or kwargs.get('action') in lecturas):
+            return await _en_thread(fn, kwargs)
+        async with _lock_escrituras():
+            return await _en_thread(fn, kwargs)
+    return envoltura
+
+def detener():
+    """Libera los threads del pool (al apagar el servidor)."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False)
+        _pool = None
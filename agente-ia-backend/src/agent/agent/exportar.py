@@ -0,0 +1,141 @@
+import csv
+import io
+import itertools
+import json
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from .store import ALUMNOS_PATH, COLECCIONES, instantanea, obtener_coleccion, registros_entre
+
+# Exportación de colecciones por streaming (NDJSON o CSV, opcionalmente gzip).
+# Se recorre la colección vigente sin copiarla y se emiten bloques a medida que
+# se arman: la memoria no depende del tamaño de la colección y los primeros
+# bytes salen enseguida. Todo el trabajo (también cargar la colección) ocurre al
+# pedir bloques, en el thread pool que recorre la respuesta.
+
+FORMATOS = ('ndjson', 'csv')
+# Campo de fecha por el que se filtra con desde/hasta (el primero que tenga el registro)
+CAMPOS_FECHA = {
+    'alumnos': ('fecha_ultima_asistencia',),
+    'pagos': ('fecha_pago', 'fecha'),
+    'notas': ('fecha',),
+    'asistencias': ('fecha',),
+    'citas': ('date',),
+}
+# Tamaño aproximado de cada bloque que se entrega al cliente
+TAMANO_BLOQUE = 64 * 1024
+# Filas de las que salen las columnas del CSV; las claves que aparecen recién
+# después van como JSON en la columna COLUMNA_OTROS
+MUESTRA_COLUMNAS = 1000
+COLUMNA_OTROS = 'otros_campos'
+
+def _fecha(registro: Dict[str, Any], campos: Iterable[str]) -> str:
+    for campo in campos:
+        if registro.get(campo):
+            return str(registro[campo])[:10]
+    return ''
+
+def filas(coleccion: str, sede: Optional[str] = None, desde: Optional[str] = None, hasta: Optional[str] = None,
+          registros: Optional[Sequence[Any]] = None, alumnos: Optional[Dict[Any, Dict[str, Any]]] = None) -> Iterator[Dict[str, Any]]:
+    """Registros de la colección que pasan los filtros, en el orden del archivo.
+
+    Los registros sin 'sede' propia (p. ej. pagos) se filtran por la sede del alumno.
+    """
+    if registros is None:
+        registros = obtener_coleccion(COLECCIONES[coleccion]).registros
+    if alumnos is None:
+        alumnos = obtener_coleccion(ALUMNOS_PATH).por_id if sede else {}
+    campos = CAMPOS_FECHA.get(coleccion, ('fecha',))
+    for registro in registros:
+        if not isinstance(registro, dict):
+            continue
+        if sede:
+            sede_registro = registro.get('sede')
+            if sede_registro is None:
+                sede_registro = alumnos.get(registro.get('alumno_id'), {}).get('sede')
+            if sede_registro != sede:
+                continue
+        if desde or hasta:
+            fecha = _fecha(registro, campos)
+            if not fecha or (desde and fecha < desde) or (hasta and fecha > hasta):
+                continue
+        yield registro
+
+def _en_bloques(partes: Iterable[str]) -> Iterator[bytes]:
+    buffer: List[str] = []
+    tamano = 0
+    for parte in partes:
+        buffer.append(parte)
+        tamano += len(parte)
+        if tamano >= TAMANO_BLOQUE:
+            yield ''.join(buffer).encode('utf-8')
+            buffer, tamano = [], 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+def ndjson(registros: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    return _en_bloques(json.dumps(r, ensure_ascii=False, default=str) + '\n' for r in registros)
+
+def _valor_csv(valor: Any) -> Any:
+    if isinstance(valor, (dict, list)):
+        return json.dumps(valor, ensure_ascii=False, default=str)
+    return valor
+
+def columnas_de(registros: Iterable[Dict[str, Any]]) -> List[str]:
+    """Columnas del CSV: la unión de las claves, en el orden en que aparecen."""
+    vistas: Dict[str, None] = {}
+    for registro in registros:
+        for clave in registro:
+            vistas.setdefault(clave, None)
+    return list(vistas)
+
+def csv_filas(registros: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """CSV con las columnas de las primeras MUESTRA_COLUMNAS filas, sin recorrer antes toda la colección.
+
+    Si hay más filas que la muestra se agrega COLUMNA_OTROS, con las claves que
+    no estaban en la cabecera (en JSON), así no se pierde ningún campo.
+    """
+    iterador = iter(registros)
+    muestra = list(itertools.islice(iterador, MUESTRA_COLUMNAS + 1))
+    columnas = columnas_de(muestra[:MUESTRA_COLUMNAS])
+    otros = len(muestra) > MUESTRA_COLUMNAS
+    if otros:
+        columnas.append(COLUMNA_OTROS)
+    conocidas = set(columnas)
+    def lineas() -> Iterator[str]:
+        salida = io.StringIO()
+        escritor = csv.writer(salida)
+        escritor.writerow(columnas)
+        for registro in itertools.chain(muestra, iterador):
+            fila = [_valor_csv(registro.get(c, '')) for c in columnas]
+            if otros:
+                extra = {k: v for k, v in registro.items() if k not in conocidas}
+                fila[-1] = json.dumps(extra, ensure_ascii=False, default=str) if extra else ''
+            escritor.writerow(fila)
+            yield salida.getvalue()
+            salida.seek(0)
+            salida.truncate()
+        if salida.tell():
+            yield salida.getvalue()
+    # La cabecera queda en el buffer hasta la primera fila; si no hay filas sale al final
+    return _en_bloques(lineas())
+
+def gzip_stream(bloques: Iterable[bytes]) -> Iterator[bytes]:
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31) # wbits=31: formato gzip
+    for bloque in bloques:
+        comprimido = compresor.compress(bloque)
+        if comprimido:
+            yield comprimido
+    yield compresor.flush()
+
+def exportar(coleccion: str, formato: str = 'ndjson', sede: Optional[str] = None, desde: Optional[str] = None,
+             hasta: Optional[str] = None, comprimir: bool = False) -> Iterator[bytes]:
+    """Generador de bytes con la exportación de una colección; no lee nada hasta que se le pide el primer bloque."""
+    # Una sola versión de la colección para todo el recorrido, aunque haya escrituras mientras tanto.
+    # En pagos y asistencias solo se cargan los meses que caen en [desde, hasta].
+    with instantanea():
+        registros = registros_entre(COLECCIONES[coleccion], desde, hasta)
+        alumnos = obtener_coleccion(ALUMNOS_PATH).por_id if sede else {}
+    seleccion = filas(coleccion, sede, desde, hasta, registros, alumnos)
+    bloques = csv_filas(seleccion) if formato == 'csv' else ndjson(seleccion)
+    yield from (gzip_stream(bloques) if comprimir else bloques)
@@ -0,0 +1,146 @@
+import os
+import uuid
+from collections import Counter
+from typing import Any, Dict, Optional, Set, Tuple
+
+from .store import (
+    ALUMNOS_PATH,
+    PAGOS_PATH,
+    agregar_registros,
+    bloqueo_escritura,
+    obtener_coleccion,
+    read_json_file,
+    registros_entre,
+    write_json_file,
+)
+from .permisos import requiere_permiso
+
+# Facturación mensual: genera en una sola pasada el pago 'Pendiente' del mes
+# para cada alumno activo y recalcula estado_pago de todos. Es idempotente por
+# (alumno_id, mes, año): correrla dos veces para el mismo mes no duplica nada.
+# Los pagos nuevos se agregan con una sola escritura y los alumnos con otra.
+
+# Monto de la cuota si el alumno no tiene 'precio_mensual'
+CUOTA_DEFAULT = int(os.environ.get("AGENTE_CUOTA_MENSUAL", "5000"))
+ESTADO_PENDIENTE = 'Pendiente'
+
+Periodo = Tuple[int, int] # (año, mes)
+
+MESES = {'enero': 1, 'febrero': 2, 'marzo': 3, 'abril': 4, 'mayo': 5, 'junio': 6, 'julio': 7, 'agosto': 8,
+         'septiembre': 9, 'setiembre': 9, 'octubre': 10, 'noviembre': 11, 'diciembre': 12}
+
+def numero_mes(valor: Any) -> int:
+    """Mes (1-12) a partir de un número o de su nombre ('mayo'); lanza ValueError si no es un mes."""
+    texto = str(valor).strip().lower()
+    numero = MESES.get(texto) or (int(texto) if texto.isdigit() else 0)
+    if not 1 <= numero <= 12:
+        raise ValueError(f"mes inválido: {valor}")
+    return numero
+
+def periodo_de(pago: Dict[str, Any]) -> Optional[Periodo]:
+    """Mes que paga un pago: 'mes' (número o nombre) y 'año' si los tiene, si no el de la fecha."""
+    if pago.get('mes') and pago.get('año'):
+        try:
+            return int(pago['año']), numero_mes(pago['mes'])
+        except (TypeError, ValueError):
+            pass
+    fecha = str(pago.get('fecha_pago') or pago.get('fecha') or '')
+    try:
+        return int(fecha[:4]), int(fecha[5:7])
+    except ValueError:
+        return None
+
+def estado_pago(pendientes: Set[Periodo], periodo: Periodo) -> str:
+    """'atrasado' si debe un mes anterior a `periodo`, 'pendiente' si debe ese mes, si no 'al_dia'."""
+    if any(p < periodo for p in pendientes):
+        return 'atrasado'
+    return 'pendiente' if periodo in pendientes else 'al_dia'
+
+def facturar(mes: int, anio: int, monto: Optional[float] = None, simular: bool = False) -> Dict[str, Any]:
+    """Genera los pagos pendientes del mes para los alumnos activos y actualiza estado_pago.
+
+    Devuelve cuántos pagos se generaron, cuántos ya existían y cómo quedaron los estados.
+    """
+    try:
+        periodo = (int(anio), numero_mes(mes))
+    except (TypeError, ValueError):
+        raise ValueError(f"mes o año inválido: {mes}/{anio}")
+    # Pagos antes que alumnos, siempre en ese orden
+    with bloqueo_escritura(PAGOS_PATH), bloqueo_escritura(ALUMNOS_PATH):
+        activos = [a for a in obtener_coleccion(ALUMNOS_PATH).registros if isinstance(a, dict) and a.get('activo') and 'id' in a]
+        # Una pasada por todos los pagos: qué alumnos ya tienen el mes y qué meses debe cada uno
+        facturados: Set[Tuple[Any, Periodo]] = set()
+        pendientes: Dict[Any, Set[Periodo]] = {}
+        for pago in registros_entre(PAGOS_PATH):
+            if not isinstance(pago, dict):
+                continue
+            periodo_pago = periodo_de(pago)
+            if periodo_pago is None:
+                continue
+            facturados.add((pago.get('alumno_id'), periodo_pago))
+            if pago.get('estado') == ESTADO_PENDIENTE:
+                pendientes.setdefault(pago.get('alumno_id'), set()).add(periodo_pago)
+
+        vencimiento = f"{periodo[0]:04d}-{periodo[1]:02d}-01"
+        nuevos = []
+        for alumno in activos:
+            if (alumno['id'], periodo) in facturados:
+                continue
+            nuevos.append({
+                'id': str(uuid.uuid4()),
+                'alumno_id': alumno['id'],
+                'monto': monto if monto is not None else alumno.get('precio_mensual') or CUOTA_DEFAULT,
+                'fecha_pago': vencimiento,
+                'mes': periodo[1],
+                'año': periodo[0],
+                'estado': ESTADO_PENDIENTE,
+            })
+            pendientes.setdefault(alumno['id'], set()).add(periodo)
+
+        estados = {alumno['id']: estado_pago(pendientes.get(alumno['id'], set()), periodo) for alumno in activos}
+        if not simular:
+            if nuevos:
+                agregar_registros(PAGOS_PATH, nuevos)
+            alumnos = read_json_file(ALUMNOS_PATH)
+            cambiados = 0
+            for alumno in alumnos:
+                if isinstance(alumno, dict) and alumno.get('id') in estados and alumno.get('estado_pago') != estados[alumno['id']]:
+                    alumno['estado_pago'] = estados[alumno['id']]
+                    cambiados += 1
+            if cambiados:
+                write_json_file(ALUMNOS_PATH, alumnos)
+        else:
+            por_id = obtener_coleccion(ALUMNOS_PATH).por_id
+            cambiados = sum(1 for i, e in estados.items() if por_id.get(i, {}).get('estado_pago') != e)
+
+    return {
+        "mes": periodo[1],
+        "año": periodo[0],
+        "alumnos_activos": len(activos),
+        "pagos_generados": len(nuevos),
+        "ya_facturados": len(activos) - len(nuevos),
+        "monto_total": sum(p['monto'] for p in nuevos if isinstance(p['monto'], (int, float))),
+        "estados_actualizados": cambiados,
+        "estado_pago": dict(Counter(estados.values())),
+        "simulado": simular,
+    }
+
+@requiere_permiso('pagos', accion='create')
+@requiere_permiso('alumnos', accion='update')
+def facturar_mes(mes: int, anio: int, simular: bool = False) -> Dict[str, Any]:
+    """Genera la cuota del mes ('Pendiente') para todos los alumnos activos y actualiza su estado_pago.
+
+    Se puede correr más de una vez para el mismo mes: no duplica cuotas ya generadas.
+    Con simular=True solo informa qué haría, sin escribir.
+
+    Ejemplo: "generá las cuotas de junio 2025" -> mes=6, anio=2025
+    """
+    print(f"Ejecutando tool: facturar_mes para {mes}/{anio}")
+    try:
+        resumen = facturar(mes, anio, simular=simular)
+    except ValueError as e:
+        return {"status": "error", "message": str(e), "data": None}
+    accion = "Se generarían" if simular else "Se generaron"
+    return {"status": "success",
+            "message": f"{accion} {resumen['pagos_generados']} cuotas de {mes}/{anio} ({resumen['ya_facturados']} ya estaban).",
+            "data": resumen}
@@ -0,0 +1,225 @@
+import csv
+import gzip
+import io
+import json
+import unicodedata
+import uuid
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from .store import ALUMNOS_PATH, COLECCIONES, agregar_registros, bloqueo_escritura, ids_existentes, obtener_coleccion
+from .unicidad import ETIQUETAS, alumno_duplicado, claves
+
+# Importación masiva desde CSV o NDJSON (p. ej. al sumar una sede nueva).
+# El archivo se lee fila por fila, cada fila se valida contra el esquema de su
+# colección y las válidas se guardan en lotes: una escritura por lote en lugar
+# de una por registro, y la memoria depende del lote y no del archivo.
+
+FORMATOS = ('csv', 'ndjson')
+TAMANO_LOTE = 1000
+# Cuántos errores con detalle se devuelven como máximo
+MAX_ERRORES_DETALLE = 100
+
+# requeridos: campos obligatorios (una tupla = alcanza con uno de ellos)
+# tipos: conversión de los valores (en CSV todo llega como texto)
+# alumno: si cada registro referencia a un alumno (alumno_id o nombre)
+ESQUEMAS: Dict[str, Dict[str, Any]] = {
+    'alumnos': {
+        'requeridos': ['nombre', 'apellido'],
+        'tipos': {'activo': 'bool', 'alertas_activas': 'bool', 'dias_consecutivos_asistencia': 'int', 'fecha_ultima_asistencia': 'fecha'},
+        'alumno': False,
+    },
+    'pagos': {
+        'requeridos': ['monto', ('fecha_pago', 'fecha')],
+        'tipos': {'monto': 'numero', 'fecha_pago': 'fecha', 'fecha': 'fecha', 'año': 'int'},
+        'alumno': True,
+    },
+    'notas': {
+        'requeridos': ['fecha', 'contenido'],
+        'tipos': {'fecha': 'fecha', 'visible_en_reporte': 'bool'},
+        'alumno': True,
+    },
+    'asistencias': {
+        'requeridos': ['fecha'],
+        'tipos': {'fecha': 'fecha'},
+        'alumno': True,
+    },
+}
+
+class ErrorFila(ValueError):
+    pass
+
+def _normalizar_nombre(nombre: str) -> str:
+    sin_tildes = unicodedata.normalize('NFKD', str(nombre)).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(sin_tildes.lower().split())
+
+def _convertir(campo: str, valor: Any, tipo: str) -> Any:
+    if not isinstance(valor, str):
+        return valor
+    texto = valor.strip()
+    try:
+        if tipo == 'int':
+            return int(texto)
+        if tipo == 'numero':
+            numero = float(texto.replace(',', '.'))
+            return int(numero) if numero.is_integer() else numero
+        if tipo == 'bool':
+            if texto.lower() in ('1', 'true', 'si', 'sí', 'yes'):
+                return True
+            if texto.lower() in ('0', 'false', 'no'):
+                return False
+            raise ValueError(texto)
+        if tipo == 'fecha':
+            if len(texto) < 10 or texto[4] != '-' or texto[7] != '-':
+                raise ValueError(texto)
+            return texto[:10]
+    except (ValueError, IndexError):
+        raise ErrorFila(f"'{campo}' inválido: {valor!r}")
+    return texto
+
+class IndiceAlumnos:
+    """Resuelve la referencia a un alumno por id o por nombre completo."""
+
+    def __init__(self):
+        coleccion = obtener_coleccion(ALUMNOS_PATH)
+        self.ids = set(coleccion.por_id)
+        self.por_nombre: Dict[str, Optional[str]] = {}
+        for alumno in coleccion.por_id.values():
+            self.agregar(alumno)
+
+    def agregar(self, alumno: Dict[str, Any]):
+        self.ids.add(alumno['id'])
+        clave = _normalizar_nombre(f"{alumno.get('nombre', '')} {alumno.get('apellido', '')}")
+        # None marca un nombre repetido: no se puede resolver sin id
+        self.por_nombre[clave] = None if clave in self.por_nombre else alumno['id']
+
+    def resolver(self, fila: Dict[str, Any]) -> str:
+        """alumno_id de la fila; saca de la fila las columnas de nombre usadas para resolverlo."""
+        nombre = fila.pop('alumno', None) or f"{fila.pop('alumno_nombre', '')} {fila.pop('alumno_apellido', '')}"
+        fila.pop('alumno_nombre', None)
+        fila.pop('alumno_apellido', None)
+        if fila.get('alumno_id'):
+            if fila['alumno_id'] not in self.ids:
+                raise ErrorFila(f"alumno_id {fila['alumno_id']} no existe")
+            return fila['alumno_id']
+        clave = _normalizar_nombre(nombre)
+        if not clave:
+            raise ErrorFila("falta el alumno (alumno_id, alumno o alumno_nombre/alumno_apellido)")
+        if clave not in self.por_nombre:
+            raise ErrorFila(f"alumno '{nombre.strip()}' no encontrado")
+        if self.por_nombre[clave] is None:
+            raise ErrorFila(f"hay más de un alumno llamado '{nombre.strip()}', indicar alumno_id")
+        return self.por_nombre[clave]
+
+def validar(coleccion: str, fila: Dict[str, Any], alumnos: IndiceAlumnos) -> Dict[str, Any]:
+    """Registro listo para guardar a partir de una fila; lanza ErrorFila si no cumple el esquema."""
+    esquema = ESQUEMAS[coleccion]
+    registro = {str(k).strip(): v for k, v in fila.items() if k is not None and v not in (None, '')}
+    for requerido in esquema['requeridos']:
+        opciones = requerido if isinstance(requerido, tuple) else (requerido,)
+        if not any(o in registro for o in opciones):
+            raise ErrorFila(f"falta '{' o '.join(opciones)}'")
+    for campo, tipo in esquema['tipos'].items():
+        if campo in registro:
+            registro[campo] = _convertir(campo, registro[campo], tipo)
+    if esquema['alumno']:
+        registro['alumno_id'] = alumnos.resolver(registro)
+    if registro.get('id') is None:
+        registro['id'] = str(uuid.uuid4())
+    return registro
+
+def leer_filas(archivo: BinaryIO, formato: str) -> Iterator[Tuple[int, Any]]:
+    """(número de fila, dict) de a una; si una línea NDJSON no se puede parsear, (número, ErrorFila).
+
+    Acepta el archivo comprimido con gzip (se detecta por el encabezado).
+    """
+    if archivo.read(2) == b'\x1f\x8b':
+        archivo.seek(0)
+        archivo = gzip.GzipFile(fileobj=archivo, mode='rb')
+    else:
+        archivo.seek(0)
+    if formato == 'csv':
+        texto = io.TextIOWrapper(archivo, encoding='utf-8-sig', newline='')
+        # La fila 1 es la cabecera
+        for numero, fila in enumerate(csv.DictReader(texto), start=2):
+            yield numero, fila
+        return
+    for numero, linea in enumerate(archivo, start=1):
+        if not linea.strip():
+            continue
+        try:
+            fila = json.loads(linea)
+        except ValueError as e:
+            yield numero, ErrorFila(f"JSON inválido: {e}")
+            continue
+        yield numero, fila if isinstance(fila, dict) else ErrorFila("se esperaba un objeto JSON")
+
+def _guardar_lote(path: str, lote: List[Tuple[int, Dict[str, Any]]]) -> List[Tuple[int, str]]:
+    """Agrega el lote a la colección en una sola escritura. Devuelve los ids repetidos que se descartaron."""
+    with bloqueo_escritura(path):
+        existentes = ids_existentes(path, [r['id'] for _, r in lote])
+        repetidos = [(numero, f"ya existe un registro con id {r['id']}") for numero, r in lote if r['id'] in existentes]
+        nuevos = [r for _, r in lote if r['id'] not in existentes]
+        if nuevos:
+            agregar_registros(path, nuevos)
+    return repetidos
+
+def importar(coleccion: str, archivo: BinaryIO, formato: str = 'csv', simular: bool = False,
+             tamano_lote: int = TAMANO_LOTE) -> Iterator[Dict[str, Any]]:
+    """Importa un archivo y va informando el progreso (un dict por lote y uno final con 'fin': True).
+
+    Con simular=True solo valida: no escribe nada.
+    """
+    path = COLECCIONES[coleccion]
+    alumnos = IndiceAlumnos()
+    vistos = set()
+    unicos_vistos = set() # (campo, valor normalizado) de los alumnos ya aceptados del archivo
+    procesadas = importadas = cantidad_errores = 0
+    errores: List[Dict[str, Any]] = []
+    lote: List[Tuple[int, Dict[str, Any]]] = []
+
+    def anotar_error(numero: int, mensaje: str):
+        nonlocal cantidad_errores
+        cantidad_errores += 1
+        if len(errores) < MAX_ERRORES_DETALLE:
+            errores.append({"fila": numero, "error": mensaje})
+
+    def cerrar_lote() -> Dict[str, Any]:
+        nonlocal importadas, lote
+        if not simular:
+            for numero, mensaje in _guardar_lote(path, lote):
+                anotar_error(numero, mensaje)
+                importadas -= 1
+        importadas += len(lote)
+        lote = []
+        return {"procesadas": procesadas, "importadas": importadas, "errores": cantidad_errores}
+
+    for numero, fila in leer_filas(archivo, formato):
+        procesadas += 1
+        try:
+            if isinstance(fila, ErrorFila):
+                raise fila
+            registro = validar(coleccion, fila, alumnos)
+            if registro['id'] in vistos:
+                raise ErrorFila(f"id {registro['id']} repetido en el archivo")
+            if coleccion == 'alumnos' and registro['id'] in alumnos.ids:
+                raise ErrorFila(f"ya existe un registro con id {registro['id']}")
+            if coleccion == 'alumnos':
+                unicos = set(claves(registro).items())
+                repetido = next((campo for campo, valor in unicos if (campo, valor) in unicos_vistos), None)
+                if repetido is not None:
+                    raise ErrorFila(f"{ETIQUETAS[repetido]} repetido en el archivo")
+                duplicado = alumno_duplicado(registro)
+                if duplicado is not None:
+                    raise ErrorFila(f"ya existe un alumno con ese {ETIQUETAS[duplicado[0]]} (id {duplicado[1]['id']})")
+        except ErrorFila as e:
+            anotar_error(numero, str(e))
+            continue
+        vistos.add(registro['id'])
+        if coleccion == 'alumnos':
+            alumnos.agregar(registro)
+            unicos_vistos |= unicos
+        lote.append((numero, registro))
+        if len(lote) >= tamano_lote:
+            yield cerrar_lote()
+    final = cerrar_lote()
+    yield {**final, "fin": True, "simulado": simular, "detalle_errores": errores}
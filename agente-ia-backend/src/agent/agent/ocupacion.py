@@ -0,0 +1,302 @@
+import bisect
+import datetime
+import os
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .permisos import requiere_permiso
+from .store import ALUMNOS_PATH, ASISTENCIAS_PATH, bloqueo_escritura, obtener_coleccion, registro_cambios, registros_entre
+
+# Ocupación por sede y turno (el shift_id del alumno) a partir de las
+# asistencias. En lugar de recorrer las asistencias en cada consulta se llevan
+# acumulados: cantidad por (sede, turno, fecha) y por (sede, turno, día de la
+# semana). Se arman una vez recorriendo las asistencias y después siguen el log
+# de cambios (cambios.py): cada asistencia creada, modificada o borrada, por
+# este worker o por otro, suma o resta en su casillero. El mapa por día de la
+# semana y la tendencia leen esos casilleros, solo los de días con asistencias.
+
+DIAS_SEMANA = ('lunes', 'martes', 'miércoles', 'jueves', 'viernes', 'sábado', 'domingo')
+AGRUPACIONES = ('dia', 'semana', 'mes')
+SIN_SEDE = 'sin-sede'
+SIN_TURNO = 'sin-turno'
+# Asistencias que no ocupan lugar
+ESTADOS_AUSENTE = {'ausente', 'falta', 'ausencia'}
+# Días de tendencia cuando no se indica el rango
+DIAS_TENDENCIA = 90
+# Rango máximo de una tendencia (la respuesta tiene un período por día, semana o mes)
+MAX_DIAS_TENDENCIA = int(os.environ.get("AGENTE_OCUPACION_MAX_DIAS", "3660"))
+
+Casillero = Tuple[str, str, str] # (sede, turno, fecha)
+
+def _fecha(valor: Any) -> Optional[datetime.date]:
+    try:
+        return datetime.date.fromisoformat(str(valor or '')[:10])
+    except ValueError:
+        return None
+
+class RollupOcupacion:
+    """Asistencias por (sede, turno, fecha) y por (sede, turno, día de la semana), al día con el log de cambios."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.cursor: Optional[int] = None # último seq del log aplicado; None = hay que armarlo
+        self._casilleros: Dict[Any, Casillero] = {} # id de asistencia -> dónde se contó
+        self.por_fecha: Dict[str, Counter] = {} # fecha -> {(sede, turno): asistencias}
+        self._fechas: List[str] = [] # claves de por_fecha ordenadas, para leer un rango sin pasar por los días vacíos
+        self.por_dia_semana: Dict[Tuple[str, str, int], List[int]] = {} # (sede, turno, día) -> [asistencias, días con asistencias]
+        self.reconstrucciones = 0
+        self.cambios_aplicados = 0
+
+    def _casillero(self, asistencia: Any, alumnos: Dict[Any, Dict[str, Any]]) -> Optional[Casillero]:
+        if not isinstance(asistencia, dict) or str(asistencia.get('estado') or '').lower() in ESTADOS_AUSENTE:
+            return None
+        fecha = _fecha(asistencia.get('fecha'))
+        if fecha is None:
+            return None
+        sede, turno = asistencia.get('sede'), asistencia.get('shift_id')
+        if not sede or not turno:
+            alumno = alumnos.get(asistencia.get('alumno_id')) or {}
+            sede, turno = sede or alumno.get('sede'), turno or alumno.get('shift_id')
+        return (str(sede or SIN_SEDE), str(turno or SIN_TURNO), fecha.isoformat())
+
+    def _sumar(self, casillero: Casillero, delta: int):
+        sede, turno, fecha = casillero
+        del_dia = self.por_fecha.get(fecha)
+        if del_dia is None:
+            del_dia = self.por_fecha[fecha] = Counter()
+            bisect.insort(self._fechas, fecha)
+        antes = del_dia[(sede, turno)]
+        del_dia[(sede, turno)] = despues = antes + delta
+        if despues <= 0:
+            del del_dia[(sede, turno)]
+            if not del_dia:
+                del self.por_fecha[fecha]
+                del self._fechas[bisect.bisect_left(self._fechas, fecha)]
+        clave = (sede, turno, datetime.date.fromisoformat(fecha).weekday())
+        semana = self.por_dia_semana.setdefault(clave, [0, 0])
+        semana[0] += delta
+        semana[1] += (antes == 0 and despues > 0) - (antes > 0 and despues <= 0)
+        if semana[0] <= 0:
+            del self.por_dia_semana[clave]
+
+    def _aplicar(self, op: str, asistencia_id: Any, asistencia: Any, alumnos: Dict[Any, Dict[str, Any]]):
+        # Idempotente: volver a aplicar un cambio ya contado no suma dos veces
+        anterior = self._casilleros.pop(asistencia_id, None)
+        if anterior is not None:
+            self._sumar(anterior, -1)
+        if op != 'delete':
+            casillero = self._casillero(asistencia, alumnos)
+            if casillero is not None:
+                self._casilleros[asistencia_id] = casillero
+                self._sumar(casillero, 1)
+
+    def _reconstruir(self):
+        """Arma los acumulados recorriendo las asistencias (con el lock de escritura de asistencias tomado).
+
+        Con ese lock no hay ninguna a medio publicar: todo lo anotado en el log
+        hasta el cursor está en la colección que se recorre.
+        """
+        self.cursor = registro_cambios.actual()
+        self._casilleros, self.por_fecha, self.por_dia_semana, self._fechas = {}, {}, {}, []
+        alumnos = obtener_coleccion(ALUMNOS_PATH).por_id
+        for i, asistencia in enumerate(registros_entre(ASISTENCIAS_PATH)):
+            asistencia_id = asistencia.get('id') if isinstance(asistencia, dict) else None
+            self._aplicar('insert', asistencia_id if asistencia_id is not None else ('sin-id', i), asistencia, alumnos)
+        self.reconstrucciones += 1
+
+    def _ponerse_al_dia(self):
+        """Aplica los cambios de asistencias del log posteriores al cursor; lo deja en None si el log ya no los tiene."""
+        alumnos = obtener_coleccion(ALUMNOS_PATH).por_id
+        def aplicar(entrada: Dict[str, Any]):
+            self._aplicar(entrada['op'], entrada['id'], entrada['registro'], alumnos)
+            self.cambios_aplicados += 1
+        self.cursor = registro_cambios.aplicar_desde(self.cursor, 'asistencias', aplicar)
+
+    def sincronizar(self):
+        """Lleva los acumulados al último cambio del log; los arma de cero la primera vez o si el log se compactó."""
+        with self._lock:
+            if self.cursor is not None:
+                self._ponerse_al_dia()
+                if self.cursor is not None:
+                    return
+        # Primero el lock de asistencias y después el del rollup, en el mismo orden que una escritura
+        with bloqueo_escritura(ASISTENCIAS_PATH), self._lock:
+            if self.cursor is None:
+                self._reconstruir()
+            self._ponerse_al_dia()
+
+    def al_haber_cambios(self):
+        """Oyente del log: se pone al día en el momento, sin esperar y sin reconstruir.
+
+        Si otro thread está sincronizando (o hay que reconstruir) lo deja para la
+        próxima consulta, que siempre sincroniza antes de leer.
+        """
+        if self.cursor is None or not self._lock.acquire(blocking=False):
+            return
+        try:
+            if self.cursor is not None:
+                self._ponerse_al_dia()
+        finally:
+            self._lock.release()
+
+    def dias(self, desde: datetime.date, hasta: datetime.date, sede: Optional[str] = None,
+             turno: Optional[str] = None) -> Iterator[Tuple[datetime.date, Dict[Tuple[str, str], int]]]:
+        """(fecha, {(sede, turno): asistencias}) de los días del rango con asistencias, filtrado. Llamar con el lock tomado."""
+        inicio = bisect.bisect_left(self._fechas, desde.isoformat())
+        fin = bisect.bisect_right(self._fechas, hasta.isoformat())
+        for fecha in self._fechas[inicio:fin]:
+            cuentas = {(s, t): n for (s, t), n in self.por_fecha[fecha].items()
+                       if (sede is None or s == sede) and (turno is None or t == turno)}
+            if cuentas:
+                yield datetime.date.fromisoformat(fecha), cuentas
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {"cursor": self.cursor, "reconstrucciones": self.reconstrucciones, "cambios_aplicados": self.cambios_aplicados,
+                "asistencias": len(self._casilleros), "fechas": len(self.por_fecha)}
+
+rollup = RollupOcupacion()
+registro_cambios.oyentes.append(rollup.al_haber_cambios)
+
+def rango_mapa(desde: Optional[str], hasta: Optional[str]) -> Tuple[Optional[datetime.date], Optional[datetime.date]]:
+    """Fechas del mapa (cualquiera puede faltar); lanza ValueError si no son YYYY-MM-DD o si desde > hasta."""
+    inicio, fin = _fecha(desde), _fecha(hasta)
+    if (desde and inicio is None) or (hasta and fin is None):
+        raise ValueError("Las fechas tienen que tener formato YYYY-MM-DD")
+    if inicio and fin and inicio > fin:
+        raise ValueError("desde no puede ser posterior a hasta")
+    return inicio, fin
+
+def rango_tendencia(desde: Optional[str], hasta: Optional[str]) -> Tuple[datetime.date, datetime.date]:
+    """Fechas de la tendencia con los valores por defecto; además rechaza rangos de más de MAX_DIAS_TENDENCIA días."""
+    inicio, fin = rango_mapa(desde, hasta)
+    fin = fin or datetime.date.today()
+    inicio = inicio or fin - datetime.timedelta(days=DIAS_TENDENCIA - 1)
+    if inicio > fin:
+        raise ValueError("desde no puede ser posterior a hasta")
+    if (fin - inicio).days + 1 > MAX_DIAS_TENDENCIA:
+        raise ValueError(f"El rango de la tendencia no puede superar {MAX_DIAS_TENDENCIA} días")
+    return inicio, fin
+
+def _fila(sede: str, turno: str) -> Dict[str, Any]:
+    return {"sede": sede, "shift_id": turno, "asistencias": [0] * 7, "dias_con_clase": [0] * 7}
+
+def _cerrar_filas(filas: Dict[Tuple[str, str], Dict[str, Any]]) -> List[Dict[str, Any]]:
+    for fila in filas.values():
+        fila["promedio"] = [round(n / d, 1) if d else 0 for n, d in zip(fila["asistencias"], fila["dias_con_clase"])]
+        fila["total"] = sum(fila["asistencias"])
+    return [filas[clave] for clave in sorted(filas)]
+
+def mapa_ocupacion(desde: Optional[str] = None, hasta: Optional[str] = None, sede: Optional[str] = None,
+                   shift_id: Optional[str] = None) -> Dict[str, Any]:
+    """Asistencias por (sede, turno) y día de la semana: total, días con clase y promedio por clase.
+
+    Sin rango sale directo del acumulado por día de la semana; con rango suma
+    los casilleros de los días con asistencias entre `desde` y `hasta`.
+    """
+    inicio, fin = rango_mapa(desde, hasta)
+    rollup.sincronizar()
+    filas: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    with rollup._lock:
+        if inicio is None and fin is None:
+            for (s, t, dia), (n, d) in rollup.por_dia_semana.items():
+                if (sede is None or s == sede) and (shift_id is None or t == shift_id):
+                    fila = filas.setdefault((s, t), _fila(s, t))
+                    fila["asistencias"][dia] += n
+                    fila["dias_con_clase"][dia] += d
+        else:
+            for dia, cuentas in rollup.dias(inicio or datetime.date.min, fin or datetime.date.max, sede, shift_id):
+                for (s, t), n in cuentas.items():
+                    fila = filas.setdefault((s, t), _fila(s, t))
+                    fila["asistencias"][dia.weekday()] += n
+                    fila["dias_con_clase"][dia.weekday()] += 1
+    return {"desde": inicio.isoformat() if inicio else None, "hasta": fin.isoformat() if fin else None,
+            "dias_semana": list(DIAS_SEMANA), "filas": _cerrar_filas(filas)}
+
+def _periodo(dia: datetime.date, agrupar: str) -> str:
+    if agrupar == 'semana':
+        return (dia - datetime.timedelta(days=dia.weekday())).isoformat()
+    if agrupar == 'mes':
+        return dia.strftime('%Y-%m')
+    return dia.isoformat()
+
+def _periodos(inicio: datetime.date, fin: datetime.date, agrupar: str) -> Iterator[str]:
+    """Claves de los períodos que tocan [inicio, fin], en orden: uno por paso y no uno por día."""
+    dia = inicio
+    while dia <= fin:
+        yield _periodo(dia, agrupar)
+        if agrupar == 'semana':
+            dia += datetime.timedelta(days=7 - dia.weekday())
+        elif agrupar == 'mes':
+            dia = (dia.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+        else:
+            dia += datetime.timedelta(days=1)
+
+def serie_ocupacion(desde: Optional[str] = None, hasta: Optional[str] = None, agrupar: str = 'semana',
+                    sede: Optional[str] = None, shift_id: Optional[str] = None) -> Dict[str, Any]:
+    """Asistencias por período (día, semana que empieza el lunes o mes) entre `desde` y `hasta`, con los períodos vacíos en 0."""
+    if agrupar not in AGRUPACIONES:
+        raise ValueError(f"agrupar tiene que ser uno de: {', '.join(AGRUPACIONES)}")
+    inicio, fin = rango_tendencia(desde, hasta)
+    rollup.sincronizar()
+    periodos = {clave: {"periodo": clave, "asistencias": 0, "dias_con_clase": 0, "por_turno": Counter()}
+                for clave in _periodos(inicio, fin, agrupar)}
+    with rollup._lock:
+        for dia, cuentas in rollup.dias(inicio, fin, sede, shift_id):
+            periodo = periodos[_periodo(dia, agrupar)]
+            periodo["asistencias"] += sum(cuentas.values())
+            periodo["dias_con_clase"] += 1
+            for (s, t), n in cuentas.items():
+                periodo["por_turno"][f"{s}/{t}"] += n
+    serie = []
+    for periodo in periodos.values():
+        periodo["promedio_diario"] = round(periodo["asistencias"] / periodo["dias_con_clase"], 1) if periodo["dias_con_clase"] else 0
+        periodo["por_turno"] = dict(sorted(periodo["por_turno"].items()))
+        serie.append(periodo)
+    return {"desde": inicio.isoformat(), "hasta": fin.isoformat(), "agrupar": agrupar, "serie": serie}
+
+@requiere_permiso('asistencias', accion='read')
+def ocupacion_por_turno(desde: Optional[str] = None, hasta: Optional[str] = None, sede: Optional[str] = None,
+                        shift_id: Optional[str] = None) -> Dict[str, Any]:
+    """Mapa de ocupación: asistencias por sede, turno (shift_id) y día de la semana, con el promedio por clase.
+
+    Args:
+        desde: Fecha inicial (YYYY-MM-DD). Sin desde ni hasta usa todas las asistencias.
+        hasta: Fecha final (YYYY-MM-DD).
+        sede: Solo esta sede.
+        shift_id: Solo este turno.
+    """
+    print(f"Ejecutando tool: ocupacion_por_turno desde={desde} hasta={hasta} sede={sede} shift_id={shift_id}")
+    try:
+        mapa = mapa_ocupacion(desde, hasta, sede, shift_id)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    if not mapa["filas"]:
+        return {"status": "success", "message": "No hay asistencias para esos filtros.", "data": mapa}
+    pico = max(((fila["promedio"][d], fila, d) for fila in mapa["filas"] for d in range(7)), key=lambda x: x[0])
+    return {"status": "success",
+            "message": (f"Ocupación de {len(mapa['filas'])} combinaciones sede/turno. Mayor promedio: "
+                        f"{pico[1]['sede']} / {pico[1]['shift_id']} los {DIAS_SEMANA[pico[2]]} ({pico[0]} por clase)."),
+            "data": mapa}
+
+@requiere_permiso('asistencias', accion='read')
+def tendencia_ocupacion(desde: Optional[str] = None, hasta: Optional[str] = None, agrupar: str = 'semana',
+                        sede: Optional[str] = None, shift_id: Optional[str] = None) -> Dict[str, Any]:
+    """Tendencia de ocupación: asistencias por día, semana o mes, opcionalmente de una sede o turno.
+
+    Args:
+        desde: Fecha inicial (YYYY-MM-DD). Por defecto, los últimos 90 días.
+        hasta: Fecha final (YYYY-MM-DD). Por defecto, hoy.
+        agrupar: 'dia', 'semana' o 'mes'.
+        sede: Solo esta sede.
+        shift_id: Solo este turno.
+    """
+    print(f"Ejecutando tool: tendencia_ocupacion desde={desde} hasta={hasta} agrupar={agrupar} sede={sede} shift_id={shift_id}")
+    try:
+        serie = serie_ocupacion(desde, hasta, agrupar, sede, shift_id)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    total = sum(p["asistencias"] for p in serie["serie"])
+    return {"status": "success",
+            "message": f"{total} asistencias entre {serie['desde']} y {serie['hasta']} en {len(serie['serie'])} períodos ({agrupar}).",
+            "data": serie}
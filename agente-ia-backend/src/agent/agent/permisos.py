@@ -0,0 +1,125 @@
+import contextvars
+import functools
+import os
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .store import SUDO_USERS_PATH, obtener_coleccion
+
+# Permisos de los usuarios SUDO (sudo-users.json). Las cadenas "recurso:acciones"
+# se compilan una sola vez a máscaras de bits por usuario; chequear un permiso es
+# un par de búsquedas en diccionarios y un AND, sin I/O. La compilación se rehace
+# sola cuando cambia el archivo (escritura nuestra o recarga del vigilante).
+
+LEER = 1
+CREAR = 2
+ACTUALIZAR = 4
+BORRAR = 8
+ESCRITURA = CREAR | ACTUALIZAR | BORRAR
+TODO = LEER | ESCRITURA
+
+# Acciones con nombre; además se aceptan combinaciones de letras como "crud" o "ru"
+ACCIONES_CON_NOMBRE = {'read': LEER, 'create': CREAR, 'update': ACTUALIZAR, 'delete': BORRAR, 'write': ESCRITURA, '*': TODO}
+LETRAS = {'c': CREAR, 'r': LEER, 'u': ACTUALIZAR, 'd': BORRAR}
+BITS_ACCION = {'read': LEER, 'create': CREAR, 'update': ACTUALIZAR, 'delete': BORRAR}
+
+# Usuario SUDO que hace el request actual (id o nombre). Los endpoints lo fijan a
+# partir del header X-Sudo-User; asyncio.to_thread copia el contexto, así que
+# también lo ven las tools que corren en el thread pool.
+usuario_actual: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('usuario_actual', default=None)
+
+# Por defecto se rechazan las llamadas a tools sin usuario (sin header): si no,
+# requiere_permiso no protegería nada. AGENTE_EXIGIR_USUARIO=0 las deja pasar sin
+# chequeo, solo para clientes viejos que todavía no mandan el header. Los trabajos
+# programados y los scripts de línea de comandos no pasan por las tools decoradas.
+EXIGIR_USUARIO = os.environ.get("AGENTE_EXIGIR_USUARIO", "1") != "0"
+
+def compilar_permisos(permisos: Any) -> Dict[str, int]:
+    """["pagos:crud", "resumen:read"] -> {'pagos': 15, 'resumen': 1}. Ignora entradas mal formadas."""
+    mascaras: Dict[str, int] = {}
+    for permiso in permisos if isinstance(permisos, list) else []:
+        recurso, _, acciones = str(permiso).strip().lower().partition(':')
+        if not recurso or not acciones:
+            continue
+        if acciones in ACCIONES_CON_NOMBRE:
+            bits = ACCIONES_CON_NOMBRE[acciones]
+        elif set(acciones) <= set(LETRAS):
+            bits = 0
+            for letra in acciones:
+                bits |= LETRAS[letra]
+        else:
+            continue
+        mascaras[recurso] = mascaras.get(recurso, 0) | bits
+    return mascaras
+
+class TablaPermisos:
+    """Máscaras compiladas para una versión de sudo-users.json, por id y por nombre de usuario."""
+
+    __slots__ = ('coleccion', 'por_usuario')
+
+    def __init__(self, coleccion):
+        self.coleccion = coleccion
+        self.por_usuario: Dict[str, Dict[str, int]] = {}
+        for usuario in coleccion.registros:
+            if not isinstance(usuario, dict):
+                continue
+            mascaras = compilar_permisos(usuario.get('permisos'))
+            for clave in (usuario.get('id'), usuario.get('nombre')):
+                if clave not in (None, ''):
+                    self.por_usuario.setdefault(str(clave), mascaras)
+
+    def permite(self, usuario: str, recurso: str, bits: int) -> bool:
+        mascaras = self.por_usuario.get(usuario)
+        if mascaras is None:
+            return False
+        return (mascaras.get(recurso, 0) | mascaras.get('*', 0)) & bits == bits
+
+_tabla: Optional[TablaPermisos] = None
+_tabla_lock = threading.Lock()
+
+def tabla_permisos() -> TablaPermisos:
+    """Tabla vigente; se recompila cuando la colección de sudo users cambia."""
+    global _tabla
+    coleccion = obtener_coleccion(SUDO_USERS_PATH)
+    tabla = _tabla
+    if tabla is None or tabla.coleccion is not coleccion:
+        with _tabla_lock:
+            if _tabla is None or _tabla.coleccion is not coleccion:
+                _tabla = TablaPermisos(coleccion)
+            tabla = _tabla
+    return tabla
+
+def bits_de_accion(action: Any, lecturas: Tuple[str, ...] = ('read',)) -> int:
+    """Bits que necesita una acción de las tools crud_*. Las acciones de consulta cuentan como lectura."""
+    if action in lecturas:
+        return LEER
+    return BITS_ACCION.get(action, ESCRITURA)
+
+def verificar_permiso(recurso: str, bits: int, usuario: Optional[str] = None) -> Optional[str]:
+    """None si el usuario (por defecto, el del request actual) puede; si no, el motivo."""
+    usuario = usuario if usuario is not None else usuario_actual.get()
+    if usuario is None:
+        return "Se requiere un usuario SUDO (header X-Sudo-User)." if EXIGIR_USUARIO else None
+    if tabla_permisos().permite(str(usuario), recurso, bits):
+        return None
+    return f"El usuario {usuario} no tiene permiso sobre {recurso}."
+
+def requiere_permiso(recurso: str, lecturas: Tuple[str, ...] = ('read',), accion: Optional[str] = None) -> Callable:
+    """Decorador para las tools: rechaza la llamada si el usuario actual no tiene permiso sobre `recurso`.
+
+    Las tools crud_* se chequean según su argumento `action`; para las demás se
+    pasa `accion` fija (p. ej. 'read'). Conserva nombre, firma y docstring.
+    """
+    def decorador(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def envoltura(*args, **kwargs):
+            if accion is not None:
+                bits = bits_de_accion(accion, lecturas)
+            else:
+                bits = bits_de_accion(kwargs['action'] if 'action' in kwargs else (args[0] if args else None), lecturas)
+            motivo = verificar_permiso(recurso, bits)
+            if motivo is not None:
+                return {"status": "error", "message": f"Permiso denegado: {motivo}", "data": None}
+            return fn(*args, **kwargs)
+        return envoltura
+    return decorador
@@ -0,0 +1,77 @@
+import calendar
+from datetime import date, timedelta
+from typing import Any, Dict, Iterator, Optional
+
+# Expansión perezosa de citas recurrentes (recurring / recurringtype / recurringend).
+# En lugar de guardar cada instancia, una serie se guarda una sola vez y sus
+# ocurrencias se calculan solo dentro de la ventana que se consulta.
+
+TIPOS_RECURRENCIA = ('daily', 'weekly', 'monthly')
+
+def a_fecha(valor: Any) -> Optional[date]:
+    """'2025-06-03' (o un datetime/ISO con hora) -> date. None si no se puede interpretar."""
+    if isinstance(valor, date):
+        return valor
+    try:
+        return date.fromisoformat(str(valor)[:10])
+    except (TypeError, ValueError):
+        return None
+
+def es_recurrente(cita: Dict[str, Any]) -> bool:
+    return bool(cita.get('recurring')) and cita.get('recurringtype') in TIPOS_RECURRENCIA and a_fecha(cita.get('date')) is not None
+
+def sumar_meses(inicio: date, meses: int, dia: int) -> date:
+    """Mismo día del mes `meses` más adelante; si ese mes es más corto, el último día."""
+    mes_total = inicio.month - 1 + meses
+    anio, mes = inicio.year + mes_total // 12, mes_total % 12 + 1
+    return date(anio, mes, min(dia, calendar.monthrange(anio, mes)[1]))
+
+def ocurrencias(cita: Dict[str, Any], desde: date, hasta: date) -> Iterator[date]:
+    """Genera las fechas de la cita dentro de [desde, hasta], en orden.
+
+    Salta directo a la primera ocurrencia de la ventana, así el costo depende
+    de cuántas ocurrencias caen en ella y no de la antigüedad de la serie.
+    """
+    inicio = a_fecha(cita.get('date'))
+    if inicio is None:
+        return
+    if not es_recurrente(cita):
+        if desde <= inicio <= hasta:
+            yield inicio
+        return
+    fin = a_fecha(cita.get('recurringend'))
+    if fin is not None:
+        hasta = min(hasta, fin)
+    desde = max(desde, inicio)
+    if desde > hasta:
+        return
+    tipo = cita['recurringtype']
+    if tipo == 'monthly':
+        meses = (desde.year - inicio.year) * 12 + (desde.month - inicio.month)
+        fecha = sumar_meses(inicio, meses, inicio.day)
+        if fecha < desde:
+            meses += 1
+            fecha = sumar_meses(inicio, meses, inicio.day)
+        while fecha <= hasta:
+            yield fecha
+            meses += 1
+            fecha = sumar_meses(inicio, meses, inicio.day)
+        return
+    paso = 1 if tipo == 'daily' else 7
+    saltos = -(-(desde - inicio).days // paso) # redondeo hacia arriba
+    fecha = inicio + timedelta(days=saltos * paso)
+    while fecha <= hasta:
+        yield fecha
+        fecha += timedelta(days=paso)
+
+def ocurre_en(cita: Dict[str, Any], fecha: date) -> bool:
+    """¿La cita (recurrente o no) tiene una ocurrencia en `fecha`? O(1)."""
+    return next(ocurrencias(cita, fecha, fecha), None) is not None
+
+def instancia(cita: Dict[str, Any], fecha: date) -> Dict[str, Any]:
+    """Ocurrencia concreta de una serie: la misma cita con la fecha de ese día."""
+    ocurrencia = dict(cita)
+    ocurrencia['date'] = fecha.isoformat()
+    if es_recurrente(cita):
+        ocurrencia['serie_id'] = cita.get('id')
+    return ocurrencia
@@ -0,0 +1,296 @@
+import asyncio
+import os
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+
+# Cliente de una API PostgREST (la de Supabase o cualquier otra compatible) para
+# las colecciones que no viven en archivos. Un solo httpx.AsyncClient con sus
+# conexiones keep-alive atiende a todos los threads: corre en un event loop
+# propio y las funciones síncronas le mandan corrutinas. Las búsquedas por un
+# valor (un id, un alumno_id) que llegan casi juntas se juntan en una sola
+# consulta `columna=in.(...)`, y delante de la API hay una caché de lectura con
+# vencimiento: lo leído se reutiliza durante TTL_SEGUNDOS y cada escritura
+# propia descarta lo cacheado de esa tabla.
+
+TTL_SEGUNDOS = float(os.environ.get("AGENTE_REMOTO_TTL", "5"))
+CONEXIONES = int(os.environ.get("AGENTE_REMOTO_CONEXIONES", "20"))
+TIMEOUT_SEGUNDOS = float(os.environ.get("AGENTE_REMOTO_TIMEOUT", "10"))
+# Valores por consulta in.(...) y cuánto se espera a que se sumen otros al lote
+LOTE = int(os.environ.get("AGENTE_REMOTO_LOTE", "100"))
+ESPERA_LOTE_SEGUNDOS = float(os.environ.get("AGENTE_REMOTO_ESPERA_MS", "2")) / 1000
+# Filas por página al leer una tabla entera (Supabase devuelve a lo sumo 1000 por pedido)
+FILAS_POR_PAGINA = 1000
+
+class ErrorRemoto(Exception):
+    """La API respondió con un error (o no respondió)."""
+
+    def __init__(self, mensaje: str, status: Optional[int] = None):
+        super().__init__(mensaje)
+        self.status = status
+
+def _literal(valor: Any) -> str:
+    # Dentro de in.(...) los valores van entre comillas: así una coma o un paréntesis no corta la lista
+    texto = str(valor).replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{texto}"'
+
+def filtro_en(valores: Iterable[Any]) -> str:
+    return f"in.({','.join(_literal(v) for v in valores)})"
+
+class ClientePostgrest:
+    """Acceso síncrono (para las tools) a tablas PostgREST, con conexiones compartidas, lotes y caché."""
+
+    def __init__(self, url: str, clave: Optional[str] = None, ttl: float = TTL_SEGUNDOS, conexiones: int = CONEXIONES,
+                 lote: int = LOTE, espera_lote: float = ESPERA_LOTE_SEGUNDOS):
+        self.url = url.rstrip('/')
+        self.clave = clave
+        self.ttl = ttl
+        self.conexiones = conexiones
+        self.lote = lote
+        self.espera_lote = espera_lote
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._http: Optional[httpx.AsyncClient] = None
+        self._arranque = threading.Lock()
+        # Caché: (tabla, columna, valor) -> (vence, filas) y tabla -> (vence, filas)
+        self._cache_lock = threading.Lock()
+        self._por_valor: Dict[Tuple[str, str, str], Tuple[float, List[Dict[str, Any]]]] = {}
+        self._tablas: Dict[str, Tuple[float, List[Dict[str, Any]]]] = {}
+        # Sube con cada invalidación: una lectura que empezó antes de una escritura no se cachea
+        self._generacion: Counter = Counter()
+        # Solo se tocan desde el loop del cliente
+        self._lotes: Dict[Tuple[str, str], Dict[str, asyncio.Future]] = {}
+        # Valores pedidos (en un lote abierto o ya enviado) que todavía no tienen respuesta
+        self._esperando: Dict[Tuple[str, str, str], asyncio.Future] = {}
+        self._leyendo_tabla: Dict[str, asyncio.Future] = {}
+        self._contadores: Counter = Counter()
+
+    @classmethod
+    def desde_entorno(cls) -> 'ClientePostgrest':
+        """AGENTE_REMOTO_URL (o SUPABASE_URL + /rest/v1) y la clave de servicio de Supabase."""
+        url = os.environ.get("AGENTE_REMOTO_URL")
+        if not url and os.environ.get("SUPABASE_URL"):
+            url = os.environ["SUPABASE_URL"].rstrip('/') + '/rest/v1'
+        if not url:
+            raise RuntimeError("Falta AGENTE_REMOTO_URL (o SUPABASE_URL) para usar el almacén remoto")
+        clave = (os.environ.get("AGENTE_REMOTO_CLAVE") or os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
+                 or os.environ.get("SUPABASE_ANON_KEY"))
+        return cls(url, clave)
+
+    # --- Event loop propio ---
+
+    def _iniciar(self) -> asyncio.AbstractEventLoop:
+        with self._arranque:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                listo = threading.Event()
+
+                def correr():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(listo.set)
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=correr, name="cliente-remoto", daemon=True)
+                self._thread.start()
+                listo.wait()
+                self._loop = loop
+            return self._loop
+
+    def _correr(self, corrutina) -> Any:
+        loop = self._iniciar()
+        if threading.current_thread() is self._thread:
+            corrutina.close()
+            raise RuntimeError("El cliente remoto no se puede usar de forma síncrona desde su propio loop")
+        return asyncio.run_coroutine_threadsafe(corrutina, loop).result(self.ttl + TIMEOUT_SEGUNDOS * 3)
+
+    def cerrar(self):
+        loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        if self._http is not None:
+            asyncio.run_coroutine_threadsafe(self._http.aclose(), loop).result(TIMEOUT_SEGUNDOS)
+            self._http = None
+        loop.call_soon_threadsafe(loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _cliente_http(self) -> httpx.AsyncClient:
+        if self._http is None:
+            cabeceras = {"Accept": "application/json"}
+            if self.clave:
+                cabeceras.update({"apikey": self.clave, "Authorization": f"Bearer {self.clave}"})
+            limites = httpx.Limits(max_connections=self.conexiones, max_keepalive_connections=self.conexiones, keepalive_expiry=30)
+            self._http = httpx.AsyncClient(base_url=self.url, headers=cabeceras, limits=limites,
+                                           timeout=httpx.Timeout(TIMEOUT_SEGUNDOS))
+        return self._http
+
+    async def _pedir(self, metodo: str, tabla: str, params: Optional[Dict[str, Any]] = None, cuerpo: Any = None,
+                     prefer: Optional[str] = None) -> Any:
+        self._contadores['pedidos'] += 1
+        cabeceras = {"Prefer": prefer} if prefer else None
+        try:
+            respuesta = await self._cliente_http().request(metodo, f"/{tabla}", params=params, json=cuerpo, headers=cabeceras)
+        except httpx.HTTPError as e:
+            self._contadores['errores'] += 1
+            raise ErrorRemoto(f"{metodo} {tabla}: {e}") from e
+        if respuesta.status_code >= 400:
+            self._contadores['errores'] += 1
+            raise ErrorRemoto(f"{metodo} {tabla}: {respuesta.status_code} {respuesta.text[:300]}", respuesta.status_code)
+        return respuesta.json() if respuesta.content else None
+
+    # --- Caché de lectura ---
+
+    def _cacheado(self, cache: Dict, clave: Any) -> Optional[List[Dict[str, Any]]]:
+        with self._cache_lock:
+            entrada = cache.get(clave)
+            if entrada is not None and entrada[0] > time.monotonic():
+                self._contadores['aciertos_cache'] += 1
+                return entrada[1]
+        return None
+
+    def _cachear(self, cache: Dict, clave: Any, filas: List[Dict[str, Any]], tabla: str, generacion: int):
+        with self._cache_lock:
+            if self._generacion[tabla] == generacion:
+                cache[clave] = (time.monotonic() + self.ttl, filas)
+
+    def invalidar(self, tabla: str):
+        """Descarta lo cacheado de una tabla (después de escribirla, o si escribió otro worker)."""
+        with self._cache_lock:
+            self._generacion[tabla] += 1
+            self._tablas.pop(tabla, None)
+            for clave in [c for c in self._por_valor if c[0] == tabla]:
+                del self._por_valor[clave]
+
+    def estadisticas(self) -> Dict[str, int]:
+        return dict(self._contadores)
+
+    # --- Lecturas ---
+
+    async def _cargar(self, tabla: str, columna: str, valor: str) -> List[Dict[str, Any]]:
+        # Si ese valor ya se pidió se espera esa respuesta; si no, se suma al lote
+        # abierto de (tabla, columna) y el primero del lote programa el envío
+        futuro = self._esperando.get((tabla, columna, valor))
+        if futuro is None:
+            lote = self._lotes.setdefault((tabla, columna), {})
+            futuro = lote[valor] = self._esperando[(tabla, columna, valor)] = asyncio.get_running_loop().create_future()
+            if len(lote) >= self.lote:
+                self._enviar_lote(tabla, columna)
+            elif len(lote) == 1:
+                asyncio.get_running_loop().call_later(self.espera_lote, self._enviar_lote, tabla, columna)
+        return await asyncio.shield(futuro)
+
+    def _enviar_lote(self, tabla: str, columna: str):
+        lote = self._lotes.pop((tabla, columna), None)
+        if lote:
+            asyncio.get_running_loop().create_task(self._resolver_lote(tabla, columna, lote))
+
+    async def _resolver_lote(self, tabla: str, columna: str, lote: Dict[str, asyncio.Future]):
+        if len(lote) > 1:
+            self._contadores['consultas_agrupadas'] += 1
+            self._contadores['valores_agrupados'] += len(lote)
+        generacion = self._generacion[tabla]
+        try:
+            filas = await self._pedir('GET', tabla, {'select': '*', columna: filtro_en(lote)})
+        except Exception as e:
+            for valor, futuro in lote.items():
+                self._esperando.pop((tabla, columna, valor), None)
+                if not futuro.done():
+                    futuro.set_exception(e)
+            return
+        grupos: Dict[str, List[Dict[str, Any]]] = {}
+        for fila in filas:
+            grupos.setdefault(str(fila.get(columna)), []).append(fila)
+        for valor, futuro in lote.items():
+            self._esperando.pop((tabla, columna, valor), None)
+            self._cachear(self._por_valor, (tabla, columna, valor), grupos.get(valor, []), tabla, generacion)
+            if not futuro.done():
+                futuro.set_result(grupos.get(valor, []))
+
+    def cargar(self, tabla: str, columna: str, valor: Any) -> List[Dict[str, Any]]:
+        """Filas con columna = valor. Las búsquedas concurrentes de la misma columna viajan en una sola consulta."""
+        filas = self._cacheado(self._por_valor, (tabla, columna, str(valor)))
+        if filas is None:
+            filas = self._correr(self._cargar(tabla, columna, str(valor)))
+        return filas
+
+    async def _por_valores(self, tabla: str, columna: str, valores: List[Any], select: str) -> List[Dict[str, Any]]:
+        tandas = [valores[i:i + self.lote] for i in range(0, len(valores), self.lote)]
+        respuestas = await asyncio.gather(*(self._pedir('GET', tabla, {'select': select, columna: filtro_en(t)}) for t in tandas))
+        return [fila for filas in respuestas for fila in filas]
+
+    def por_valores(self, tabla: str, columna: str, valores: Iterable[Any], select: str = '*') -> List[Dict[str, Any]]:
+        """Filas cuya columna está en `valores`: una consulta in.(...) por cada LOTE valores, en paralelo."""
+        valores = list(dict.fromkeys(valores))
+        return self._correr(self._por_valores(tabla, columna, valores, select)) if valores else []
+
+    async def _leer_tabla(self, tabla: str) -> List[Dict[str, Any]]:
+        filas: List[Dict[str, Any]] = []
+        while True:
+            pagina = await self._pedir('GET', tabla, {'select': '*', 'order': 'id.asc', 'limit': FILAS_POR_PAGINA, 'offset': len(filas)})
+            filas.extend(pagina)
+            if len(pagina) < FILAS_POR_PAGINA:
+                return filas
+
+    async def _todos(self, tabla: str) -> List[Dict[str, Any]]:
+        # Single-flight: si ya hay una lectura completa de la tabla en curso, se espera esa
+        futuro = self._leyendo_tabla.get(tabla)
+        if futuro is None:
+            futuro = self._leyendo_tabla[tabla] = asyncio.ensure_future(self._leer_tabla(tabla))
+            futuro.add_done_callback(lambda _f: self._leyendo_tabla.pop(tabla, None))
+        return await asyncio.shield(futuro)
+
+    def todos(self, tabla: str) -> List[Dict[str, Any]]:
+        """La tabla completa (paginada de a FILAS_POR_PAGINA). Mientras no venza devuelve la misma lista."""
+        filas = self._cacheado(self._tablas, tabla)
+        if filas is None:
+            generacion = self._generacion[tabla]
+            filas = self._correr(self._todos(tabla))
+            self._cachear(self._tablas, tabla, filas, tabla, generacion)
+        return filas
+
+    # --- Escrituras ---
+
+    def insertar(self, tabla: str, filas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Inserta todas las filas en un solo pedido. Las columnas que le faltan a una fila toman su default."""
+        if not filas:
+            return []
+        columnas = ','.join(dict.fromkeys(k for fila in filas for k in fila))
+        try:
+            return self._correr(self._pedir('POST', tabla, {'columns': columnas}, filas,
+                                            prefer='return=representation,missing=default'))
+        finally:
+            self.invalidar(tabla)
+
+    async def _actualizar_varios(self, tabla: str, cambios: List[Tuple[Any, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        respuestas = await asyncio.gather(*(self._pedir('PATCH', tabla, {'id': f"eq.{registro_id}"}, campos, prefer='return=representation')
+                                            for registro_id, campos in cambios))
+        return [fila for filas in respuestas for fila in filas]
+
+    def actualizar(self, tabla: str, cambios: List[Tuple[Any, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Aplica (id, campos) a cada fila; los PATCH salen en paralelo por las conexiones del pool."""
+        if not cambios:
+            return []
+        try:
+            return self._correr(self._actualizar_varios(tabla, cambios))
+        finally:
+            self.invalidar(tabla)
+
+    async def _borrar(self, tabla: str, ids: List[Any]) -> List[Dict[str, Any]]:
+        tandas = [ids[i:i + self.lote] for i in range(0, len(ids), self.lote)]
+        respuestas = await asyncio.gather(*(self._pedir('DELETE', tabla, {'id': filtro_en(t)}, prefer='return=representation')
+                                            for t in tandas))
+        return [fila for filas in respuestas for fila in filas]
+
+    def borrar(self, tabla: str, ids: Iterable[Any]) -> List[Dict[str, Any]]:
+        """Borra las filas con esos ids (in.(...) de a LOTE) y devuelve las que existían."""
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            return []
+        try:
+            return self._correr(self._borrar(tabla, ids))
+        finally:
+            self.invalidar(tabla)
@@ -0,0 +1,86 @@
+import datetime
+import os
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from .store import ALUMNOS_PATH, ASISTENCIAS_PATH, PAGOS_PATH, instantanea, obtener_coleccion, registros_entre, ultimo_por_alumno
+
+# Cálculos pesados que recorren colecciones enteras (alertas, reportes por mes).
+# Son funciones puras sobre el store: tareas.py las corre en un pool de
+# procesos, así no ocupan el event loop ni compiten por el GIL con los requests.
+# Cada una corre dentro de una instantanea(): todas las colecciones que cruza son
+# las de un mismo momento aunque haya escrituras mientras recorre.
+
+# Días sin asistir a partir de los cuales un alumno activo entra en las alertas
+DIAS_SIN_ASISTIR = int(os.environ.get("AGENTE_DIAS_SIN_ASISTIR", "14"))
+
+def alertas(dias_sin_asistir: Optional[int] = None, hoy: Optional[str] = None) -> Dict[str, Any]:
+    """Alumnos activos (con alertas_activas) que no vienen hace `dias_sin_asistir` días o deben cuotas."""
+    with instantanea():
+        return _alertas(DIAS_SIN_ASISTIR if dias_sin_asistir is None else int(dias_sin_asistir),
+                        datetime.date.fromisoformat(hoy) if hoy else datetime.date.today())
+
+def _alertas(dias: int, fecha_hoy: datetime.date) -> Dict[str, Any]:
+    limite = (fecha_hoy - datetime.timedelta(days=dias)).isoformat()
+    sin_asistir, deudores = [], []
+    for alumno in obtener_coleccion(ALUMNOS_PATH).registros:
+        if not isinstance(alumno, dict) or not alumno.get('activo') or alumno.get('alertas_activas') is False:
+            continue
+        nombre = f"{alumno.get('nombre', '')} {alumno.get('apellido', '')}".strip()
+        ultima = ultimo_por_alumno(ASISTENCIAS_PATH, alumno.get('id'), ('fecha',))
+        fecha = (ultima or {}).get('fecha') or alumno.get('fecha_ultima_asistencia')
+        if not fecha or str(fecha)[:10] < limite:
+            sin_asistir.append({"alumno_id": alumno.get('id'), "alumno": nombre, "ultima_asistencia": fecha})
+        if alumno.get('estado_pago') in ('pendiente', 'atrasado'):
+            deudores.append({"alumno_id": alumno.get('id'), "alumno": nombre, "estado_pago": alumno['estado_pago']})
+    partes = []
+    if sin_asistir:
+        partes.append(f"{len(sin_asistir)} " + ("persona no asiste" if len(sin_asistir) == 1 else "personas no asisten")
+                      + f" hace más de {dias} días")
+    if deudores:
+        partes.append(f"{len(deudores)} " + ("debe" if len(deudores) == 1 else "deben") + " la cuota")
+    return {
+        "fecha": fecha_hoy.isoformat(),
+        "sin_asistir": sin_asistir,
+        "deudores": deudores,
+        "texto": f"Aquí hay algunas alertas pendientes: {' y '.join(partes)}." if partes else "No hay alertas pendientes.",
+    }
+
+def reporte_mensual(desde: Optional[str] = None, hasta: Optional[str] = None) -> Dict[str, Any]:
+    """Pagos y asistencias agrupados por mes (YYYY-MM) entre dos fechas (incluidas)."""
+    with instantanea():
+        return _reporte_mensual(desde, hasta)
+
+def _reporte_mensual(desde: Optional[str], hasta: Optional[str]) -> Dict[str, Any]:
+    meses: Dict[str, Dict[str, Any]] = {}
+
+    def en_rango(fecha: str) -> bool:
+        return bool(fecha) and (not desde or fecha[:10] >= desde[:10]) and (not hasta or fecha[:10] <= hasta[:10])
+
+    def mes(clave: str) -> Dict[str, Any]:
+        return meses.setdefault(clave, {"pagos": 0, "cobrado": 0, "pendiente": 0, "por_metodo": Counter(),
+                                        "asistencias": 0, "alumnos_presentes": set(), "por_sede": Counter()})
+
+    for pago in registros_entre(PAGOS_PATH, desde, hasta):
+        fecha = str(pago.get('fecha_pago') or pago.get('fecha') or '') if isinstance(pago, dict) else ''
+        if not en_rango(fecha):
+            continue
+        fila = mes(fecha[:7])
+        monto = pago.get('monto') if isinstance(pago.get('monto'), (int, float)) else 0
+        fila["pagos"] += 1
+        fila["pendiente" if pago.get('estado') == 'Pendiente' else "cobrado"] += monto
+        if pago.get('metodo_pago'):
+            fila["por_metodo"][pago['metodo_pago']] += 1
+    for asistencia in registros_entre(ASISTENCIAS_PATH, desde, hasta):
+        fecha = str(asistencia.get('fecha') or '') if isinstance(asistencia, dict) else ''
+        if not en_rango(fecha):
+            continue
+        fila = mes(fecha[:7])
+        fila["asistencias"] += 1
+        fila["alumnos_presentes"].add(asistencia.get('alumno_id'))
+        if asistencia.get('sede'):
+            fila["por_sede"][asistencia['sede']] += 1
+    for fila in meses.values():
+        fila["alumnos_presentes"] = len(fila["alumnos_presentes"])
+        fila["por_metodo"], fila["por_sede"] = dict(fila["por_metodo"]), dict(fila["por_sede"])
+    return {"desde": desde, "hasta": hasta, "meses": dict(sorted(meses.items()))}
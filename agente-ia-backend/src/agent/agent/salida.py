@@ -0,0 +1,154 @@
+import functools
+import inspect
+import json
+import os
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Recorte de las respuestas de las tools antes de que lleguen al modelo. Todo lo
+# que devuelve una tool queda en el contexto de los turnos siguientes, así que
+# una lectura de la colección completa encarece (en tokens y en latencia) el
+# resto de la conversación. Cada tool tiene un presupuesto de tokens: si la
+# respuesta no entra, las listas se cortan con un resumen agregado (cantidad,
+# totales, fechas) y un cursor para pedir la página siguiente, y los textos
+# largos se recortan con una marca. Los endpoints HTTP usan las tools sin recortar.
+
+# Presupuesto por defecto y por tool (AGENTE_PRESUPUESTO_TOKENS_TOOLS="crud_pagos=800,resumen_alumno=600")
+PRESUPUESTO_DEFAULT = int(os.environ.get("AGENTE_PRESUPUESTO_TOKENS", "1500"))
+PRESUPUESTOS: Dict[str, int] = {
+    'resumen_alumno': 800,
+    'listar_nombres_alumnos': 2000,
+}
+for _par in filter(None, os.environ.get("AGENTE_PRESUPUESTO_TOKENS_TOOLS", "").split(',')):
+    _tool, _, _valor = _par.partition('=')
+    if _valor.strip().isdigit():
+        PRESUPUESTOS[_tool.strip()] = int(_valor)
+
+# Aproximación de tokens por caracteres de JSON (no hace falta el tokenizer del modelo)
+CARACTERES_POR_TOKEN = 4
+# Tokens reservados para el mensaje, el resumen y el cursor cuando se corta una lista
+RESERVA_METADATOS = 200
+# Largo máximo de un texto dentro de un registro (p. ej. el contenido de una nota)
+MAX_CARACTERES_CAMPO = 300
+# Campos por los que se cuentan valores en el resumen de una lista cortada
+CAMPOS_AGRUPADOS = ('estado', 'tipo', 'sede', 'status', 'metodo_pago')
+CAMPOS_FECHA = ('fecha_pago', 'fecha', 'date')
+
+# Cuántas veces se recortó la salida de cada tool desde que arrancó el proceso
+_recortes: Counter = Counter()
+_recortes_lock = threading.Lock()
+
+def estadisticas() -> Dict[str, int]:
+    with _recortes_lock:
+        return dict(_recortes)
+
+def tokens(valor: Any) -> int:
+    """Tokens aproximados de un valor una vez serializado."""
+    texto = valor if isinstance(valor, str) else json.dumps(valor, ensure_ascii=False, default=str)
+    return len(texto) // CARACTERES_POR_TOKEN + 1
+
+def presupuesto(nombre: str) -> int:
+    return PRESUPUESTOS.get(nombre, PRESUPUESTO_DEFAULT)
+
+def _compactar_registro(registro: Any) -> Any:
+    if not isinstance(registro, dict):
+        return registro
+    return {k: v[:MAX_CARACTERES_CAMPO] + '…' if isinstance(v, str) and len(v) > MAX_CARACTERES_CAMPO else v
+            for k, v in registro.items()}
+
+def agregados(registros: List[Any]) -> Dict[str, Any]:
+    """Resumen de una lista de registros: cantidad, total de 'monto', rango de fechas y conteos por campo."""
+    resumen: Dict[str, Any] = {"cantidad": len(registros)}
+    dicts = [r for r in registros if isinstance(r, dict)]
+    montos = [r['monto'] for r in dicts if isinstance(r.get('monto'), (int, float))]
+    if montos:
+        resumen["total_monto"] = sum(montos)
+    fechas = [str(f)[:10] for f in (next((r[c] for c in CAMPOS_FECHA if r.get(c)), None) for r in dicts) if f]
+    if fechas:
+        resumen["primera_fecha"], resumen["ultima_fecha"] = min(fechas), max(fechas)
+    for campo in CAMPOS_AGRUPADOS:
+        valores = Counter(str(r[campo]) for r in dicts if r.get(campo) not in (None, ''))
+        if valores:
+            resumen[f"por_{campo}"] = dict(valores.most_common(10))
+    return resumen
+
+def _cortar_lista(elementos: List[Any], desde: int, disponible: int) -> Tuple[List[Any], int]:
+    """Los elementos a partir de `desde` que entran en `disponible` tokens (al menos uno)."""
+    elegidos: List[Any] = []
+    usados = 0
+    for elemento in elementos[desde:]:
+        costo = tokens(elemento)
+        if elegidos and usados + costo > disponible:
+            break
+        elegidos.append(elemento)
+        usados += costo
+    return elegidos, desde + len(elegidos)
+
+def _recortar_texto(texto: str, limite: int) -> str:
+    maximo = max(limite * CARACTERES_POR_TOKEN, 200)
+    if len(texto) <= maximo:
+        return texto
+    return texto[:maximo] + f"\n[… recortado: {len(texto) - maximo} caracteres más]"
+
+def acotar_resultado(resultado: Any, limite: int, cursor: int = 0, acepta_cursor: bool = True) -> Any:
+    """La respuesta de una tool recortada para que entre en `limite` tokens.
+
+    Con `cursor` devuelve la página que empieza en esa posición de la lista aunque el total entre.
+    """
+    if not isinstance(resultado, dict) or (tokens(resultado) <= limite and not cursor):
+        return resultado
+    acotado = dict(resultado)
+    # Se pagina 'data' o, si no hay, la primera lista de la respuesta (p. ej. 'nombres')
+    clave = 'data' if isinstance(acotado.get('data'), (list, dict)) else next((k for k, v in acotado.items() if isinstance(v, list)), None)
+    data = acotado.get(clave)
+    if isinstance(data, (list, dict)):
+        # Un dict (p. ej. el calendario por día) se pagina por claves, en su orden
+        elementos = list(data.items()) if isinstance(data, dict) else [_compactar_registro(r) for r in data]
+        valores = [v for _, vs in elementos for v in (vs if isinstance(vs, list) else [vs])] if isinstance(data, dict) else data
+        desde = min(max(cursor, 0), len(elementos))
+        pagina, hasta = _cortar_lista(elementos, desde, limite - RESERVA_METADATOS)
+        acotado[clave] = dict(pagina) if isinstance(data, dict) else pagina
+        if desde == 0 and hasta == len(elementos):
+            return acotado
+        siguiente = hasta if hasta < len(elementos) else None
+        acotado.update({"truncado": True, "total": len(elementos), "desde": desde, "siguiente_cursor": siguiente,
+                        "resumen_total": agregados(valores)})
+        aviso = f"Se muestran {len(pagina)} de {len(elementos)} (desde la posición {desde})."
+        if siguiente is not None:
+            aviso += (f" Para ver más, repetir la llamada agregando 'cursor': {siguiente} en data." if acepta_cursor
+                      else " Para ver el resto, hacer una consulta más específica.")
+        acotado['message'] = f"{acotado.get('message', '')} {aviso}".strip()
+    for campo, valor in list(acotado.items()):
+        # Textos libres (p. ej. 'resumen') que igual no entran
+        if isinstance(valor, str) and tokens(valor) > limite - RESERVA_METADATOS:
+            acotado[campo] = _recortar_texto(valor, limite - RESERVA_METADATOS)
+            acotado['truncado'] = True
+    return acotado
+
+def acotar(fn: Callable, limite: Optional[int] = None) -> Callable:
+    """Envuelve una tool para el agente: misma firma y docstring, salida dentro del presupuesto.
+
+    En las tools con argumento `data`, data['cursor'] pide la página siguiente de una respuesta cortada.
+    """
+    nombre = fn.__name__
+    acepta_cursor = 'data' in inspect.signature(fn).parameters
+
+    @functools.wraps(fn)
+    def envoltura(*args, **kwargs):
+        cursor = 0
+        data = kwargs.get('data')
+        if acepta_cursor and isinstance(data, dict) and 'cursor' in data:
+            data = dict(data)
+            try:
+                cursor = int(data.pop('cursor') or 0)
+            except (TypeError, ValueError):
+                cursor = 0
+            kwargs['data'] = data
+        resultado = fn(*args, **kwargs)
+        acotado = acotar_resultado(resultado, limite or presupuesto(nombre), cursor, acepta_cursor)
+        if acotado is not resultado and isinstance(acotado, dict) and acotado.get('truncado'):
+            with _recortes_lock:
+                _recortes[nombre] += 1
+        return acotado
+    return envoltura
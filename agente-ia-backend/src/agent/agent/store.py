@@ -0,0 +1,1061 @@
+import asyncio
+import contextlib
+import contextvars
+import fcntl
+import functools
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from .cambios import Cambio, RegistroCambios, diferencias
+from .watcher import Vigilante
+
+if TYPE_CHECKING:
+    # remoto.py necesita httpx: se importa solo con AGENTE_ALMACEN=supabase/postgrest
+    from .remoto import ClientePostgrest
+
+# Rutas a los archivos JSON de datos (relativas a este archivo)
+BASE_DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
+ALUMNOS_PATH = os.path.join(BASE_DATA_PATH, 'alumnos.json')
+PAGOS_PATH = os.path.join(BASE_DATA_PATH, 'pagos.json')
+NOTAS_PATH = os.path.join(BASE_DATA_PATH, 'notas.json')
+ASISTENCIAS_PATH = os.path.join(BASE_DATA_PATH, 'asistencias.json') # Asegurarse de crear este archivo
+CITAS_PATH = os.path.join(BASE_DATA_PATH, 'citas.json')
+# sudo-users.json está en la raíz del repositorio; AGENTE_SUDO_USERS permite indicar otro archivo
+SUDO_USERS_PATH = os.environ.get("AGENTE_SUDO_USERS") or os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', '..', 'sudo-users.json'))
+
+COLECCIONES = {
+    'alumnos': ALUMNOS_PATH,
+    'pagos': PAGOS_PATH,
+    'notas': NOTAS_PATH,
+    'asistencias': ASISTENCIAS_PATH,
+    'citas': CITAS_PATH,
+}
+
+# Pagos y asistencias crecen sin límite pero casi todas las consultas miran lo
+# reciente: se guardan particionadas por mes (data/pagos/2025-05.json, ...) con
+# un índice resumen por partición (data/pagos/_indice.json). El valor es el
+# campo de fecha que decide la partición (el primero que tenga el registro).
+PARTICIONADAS = {
+    'pagos': ('fecha_pago', 'fecha'),
+    'asistencias': ('fecha',),
+}
+# Particiones más recientes que se cargan al arrancar; las demás se cargan al pedirlas
+PARTICIONES_CALIENTES = int(os.environ.get("AGENTE_PARTICIONES_CALIENTES", "2"))
+SIN_FECHA = 'sin-fecha'
+
+# Modo multiproceso (uvicorn --workers N): las escrituras toman además un lock
+# entre procesos y publican un contador de versión compartido, para que el resto
+# de los workers invalide su caché. Uvicorn toma la cantidad de workers de
+# WEB_CONCURRENCY, así que alcanza con esa variable para activarlo.
+MULTIPROCESO = os.environ.get("AGENTE_MULTIPROCESO") == "1" or int(os.environ.get("WEB_CONCURRENCY") or 1) > 1
+
+# AGENTE_ALMACEN=supabase (o postgrest): las colecciones de AGENTE_REMOTO_COLECCIONES
+# se leen y escriben en las tablas del mismo nombre de una API PostgREST (ver
+# remoto.py) en lugar de los archivos de data/. Las tools no cambian.
+ALMACEN = os.environ.get("AGENTE_ALMACEN", "json").lower()
+COLECCIONES_REMOTAS = [c.strip() for c in os.environ.get("AGENTE_REMOTO_COLECCIONES", "alumnos,pagos,notas,asistencias,citas").split(',')
+                       if c.strip()] if ALMACEN in ('supabase', 'postgrest') else []
+VERSIONES_PATH = os.path.join(BASE_DATA_PATH, '.versiones')
+CAMBIOS_PATH = os.path.join(BASE_DATA_PATH, 'cambios.log')
+
+class VersionesCompartidas:
+    """Contadores de versión por archivo en un mmap compartido entre workers.
+
+    Cada archivo ocupa un slot de 8 bytes elegido por crc32 del nombre. Si dos
+    archivos caen en el mismo slot solo hay invalidaciones de más, nunca de menos.
+    """
+
+    SLOTS = 256
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._lock = threading.Lock()
+
+    def _abrir(self) -> mmap.mmap:
+        if self._mmap is None:
+            with self._lock:
+                if self._mmap is None:
+                    fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                    if os.fstat(fd).st_size < self.SLOTS * 8:
+                        os.ftruncate(fd, self.SLOTS * 8)
+                    self._fd = fd
+                    self._mmap = mmap.mmap(fd, self.SLOTS * 8)
+        return self._mmap
+
+    def _offset(self, filepath: str) -> int:
+        # Ruta relativa y no solo el nombre: las particiones de pagos y asistencias se llaman igual
+        return (zlib.crc32(os.path.relpath(filepath, BASE_DATA_PATH).encode('utf-8')) % self.SLOTS) * 8
+
+    def leer(self, filepath: str) -> int:
+        return struct.unpack_from('<Q', self._abrir(), self._offset(filepath))[0]
+
+    def incrementar(self, filepath: str) -> int:
+        mm = self._abrir()
+        offset = self._offset(filepath)
+        # lockf sobre el rango del slot: el incremento es atómico entre procesos
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, 8, offset)
+        try:
+            valor = struct.unpack_from('<Q', mm, offset)[0] + 1
+            struct.pack_into('<Q', mm, offset, valor)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, 8, offset)
+        return valor
+
+versiones_compartidas = VersionesCompartidas(VERSIONES_PATH)
+
+def _version_compartida(filepath: str) -> int:
+    return versiones_compartidas.leer(filepath) if MULTIPROCESO else 0
+
+class Coleccion:
+    """Contenido parseado de un archivo junto con sus índices.
+
+    Nunca se modifica después de construida (ni la tupla, ni los registros, ni
+    los índices): una recarga o una escritura arma una Coleccion nueva y
+    reemplaza la anterior de una sola vez, así un lector nunca ve un estado a
+    medio cargar y puede seguir usando la versión que tomó sin locks.
+    """
+
+    __slots__ = ('registros', 'por_id', 'por_alumno', 'firma', 'version')
+
+    def __init__(self, registros: Sequence[Any], firma: Optional[Tuple[int, int]], version: int):
+        self.registros = tuple(registros)
+        self.firma = firma
+        self.version = version
+        self.por_id: Dict[Any, Dict[str, Any]] = {}
+        self.por_alumno: Dict[Any, List[Dict[str, Any]]] = {}
+        for r in self.registros:
+            if not isinstance(r, dict):
+                continue
+            if 'id' in r:
+                self.por_id.setdefault(r['id'], r)
+            if 'alumno_id' in r:
+                self.por_alumno.setdefault(r['alumno_id'], []).append(r)
+
+    def derivar(self, registros: Sequence[Any], firma: Optional[Tuple[int, int]], version: int) -> 'Coleccion':
+        """La versión siguiente con estos registros, compartiendo con esta todo lo que no cambió.
+
+        Un registro igual al de esta versión (mismo id) se reutiliza en lugar de
+        copiarse y las listas de por_alumno de los alumnos no tocados son las
+        mismas; solo se copian los registros nuevos o cambiados, así el que llama
+        puede seguir modificando los suyos.
+        """
+        nueva = Coleccion.__new__(Coleccion)
+        nueva.firma, nueva.version = firma, version
+        propios: List[Any] = []
+        por_id: Dict[Any, Dict[str, Any]] = {}
+        tocados: Set[Any] = set() # alumno_id con algún registro nuevo, cambiado o borrado
+        for r in registros:
+            if isinstance(r, dict):
+                anterior = self.por_id.get(r.get('id'))
+                if anterior is not r:
+                    if anterior is not None and anterior == r:
+                        r = anterior
+                    else:
+                        r = dict(r)
+                        tocados.add(r.get('alumno_id'))
+                        if anterior is not None:
+                            tocados.add(anterior.get('alumno_id'))
+                if 'id' in r:
+                    por_id.setdefault(r['id'], r)
+            propios.append(r)
+        for registro_id in self.por_id.keys() - por_id.keys():
+            tocados.add(self.por_id[registro_id].get('alumno_id'))
+        if tocados:
+            por_alumno = {alumno_id: lista for alumno_id, lista in self.por_alumno.items() if alumno_id not in tocados}
+            for r in propios:
+                if isinstance(r, dict) and 'alumno_id' in r and r['alumno_id'] in tocados:
+                    por_alumno.setdefault(r['alumno_id'], []).append(r)
+        else:
+            por_alumno = self.por_alumno
+        nueva.registros, nueva.por_id, nueva.por_alumno = tuple(propios), por_id, por_alumno
+        return nueva
+
+# Colecciones ya parseadas por ruta. La firma (mtime_ns, tamaño) detecta cambios
+# hechos por fuera del proceso; en modo multiproceso la versión compartida cubre
+# además escrituras de otros workers que no cambian tamaño dentro de la
+# resolución del mtime.
+_cache: Dict[str, Coleccion] = {}
+_cache_lock = threading.Lock()
+
+# Versiones ya escritas en disco que los lectores todavía no ven: un thread que
+# escribe varias colecciones (p. ej. facturar: pagos y alumnos) las hace visibles
+# todas juntas recién al soltar su último bloqueo_escritura. Hasta entonces las
+# leen solo los que escriben (que tienen el lock del archivo); None = archivo borrado.
+_sin_publicar: Dict[str, Optional[Coleccion]] = {}
+
+# Un lock por archivo para que dos escrituras concurrentes (p. ej. desde el
+# thread pool de los handlers async) no se pisen el ciclo leer-modificar-escribir.
+_bloqueos: Dict[str, threading.RLock] = {}
+
+def _firma(filepath: str) -> Tuple[int, int]:
+    st = os.stat(filepath)
+    return (st.st_mtime_ns, st.st_size)
+
+def _copiar(registros: List[Any]) -> List[Any]:
+    # Los registros son planos: una copia por dict alcanza para que el que llama
+    # pueda modificarlos sin tocar la caché (y es mucho más barata que parsear).
+    return [dict(r) if isinstance(r, dict) else r for r in registros]
+
+# Mientras el vigilante de archivos (watcher.py) está corriendo, los cambios en
+# disco se recargan en segundo plano y los lectores no necesitan hacer stat.
+vigilancia_activa = False
+vigilante = Vigilante(intervalo_polling=float(os.environ.get("AGENTE_VIGILANCIA_INTERVALO", "1")))
+
+# Log de cambios (cambios.py) de las escrituras sobre COLECCIONES
+registro_cambios = RegistroCambios(CAMBIOS_PATH, multiproceso=MULTIPROCESO)
+_nombres_colecciones = {path: nombre for nombre, path in COLECCIONES.items()}
+
+# Funciones que se llaman después de cada escritura sobre COLECCIONES con
+# (nombre de la colección, cambios), donde cada cambio es (op, id, registro, anterior).
+# Corren en el thread que escribió y con el lock de escritura todavía tomado.
+_suscriptores: List[Callable[[str, List[Cambio]], None]] = []
+
+def suscribir(callback: Callable[[str, List[Cambio]], None]):
+    """Registra una función a llamar después de cada escritura."""
+    _suscriptores.append(callback)
+
+def _publicar(nombre: str, cambios: List[Cambio]):
+    """Anota los cambios de una escritura en el log y avisa a los suscriptores."""
+    if not cambios:
+        return
+    registro_cambios.registrar(nombre, cambios)
+    for callback in _suscriptores:
+        try:
+            callback(nombre, cambios)
+        except Exception as e:
+            print(f"Error en suscriptor de escrituras para {nombre}: {e}")
+
+class Instantanea:
+    """Las colecciones que ve un request: la primera lectura de cada archivo la fija y las siguientes la repiten.
+
+    Arranca con las versiones vigentes al abrirla, así dos colecciones leídas en
+    distintos momentos del mismo request (p. ej. alumnos y pagos en un resumen)
+    son las de un mismo instante aunque mientras tanto haya escrituras. Las
+    escrituras hechas dentro del mismo request sí se ven.
+    """
+
+    __slots__ = ('iniciales', 'fijadas')
+
+    def __init__(self, iniciales: Dict[str, Coleccion]):
+        self.iniciales = iniciales
+        self.fijadas: Dict[str, Coleccion] = {}
+
+    def leer(self, filepath: str) -> Coleccion:
+        coleccion = self.fijadas.get(filepath)
+        if coleccion is None:
+            inicial = self.iniciales.get(filepath)
+            # Si la caché ya no tiene la versión inicial, alguien escribió después de abrir la instantánea
+            coleccion = inicial if inicial is not None and _cache.get(filepath) is not inicial else _publicada(filepath)
+            coleccion = self.fijadas.setdefault(filepath, coleccion)
+        return coleccion
+
+    def actualizar(self, escritas: Dict[str, Optional[Coleccion]]):
+        for filepath, coleccion in escritas.items():
+            if coleccion is None:
+                self.fijadas.pop(filepath, None)
+            else:
+                self.fijadas[filepath] = coleccion
+        # Las vistas completas de particionadas y remotas se vuelven a armar con lo nuevo
+        for filepath in list(self.fijadas):
+            if filepath in _particionadas or filepath in _remotas:
+                del self.fijadas[filepath]
+
+_instantanea: contextvars.ContextVar[Optional[Instantanea]] = contextvars.ContextVar('instantanea', default=None)
+
+@contextlib.contextmanager
+def instantanea() -> Iterator[Instantanea]:
+    """Fija las colecciones tal como están ahora para todo lo que se lea dentro del bloque (y en los threads que copien el contexto).
+
+    Leer no toma locks ni bloquea a nadie. Anidada, reutiliza la de afuera.
+    """
+    actual = _instantanea.get()
+    if actual is not None:
+        yield actual
+        return
+    with _cache_lock:
+        nueva = Instantanea(dict(_cache))
+    token = _instantanea.set(nueva)
+    try:
+        yield nueva
+    finally:
+        _instantanea.reset(token)
+
+def _escribiendo() -> bool:
+    """Si el thread actual tiene algún bloqueo_escritura tomado."""
+    return bool(getattr(_tomados, 'profundidad', 0))
+
+def _parsear(filepath: str) -> Optional[Coleccion]:
+    """Lee y parsea un archivo. None si no existe; lanza JSONDecodeError si está mal formado."""
+    version = _version_compartida(filepath)
+    try:
+        firma = _firma(filepath)
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return Coleccion(json.load(f), firma, version)
+    except FileNotFoundError:
+        return None
+
+def obtener_coleccion(filepath: str) -> Coleccion:
+    """Devuelve la colección vigente de un archivo, cargándola si hace falta.
+
+    La versión compartida se compara antes de tocar el disco: si otro worker
+    escribió, la próxima lectura ve un contador distinto y recarga. Para una
+    colección particionada devuelve todas sus particiones juntas (las carga todas).
+    Dentro de una instantanea() devuelve la versión fijada para el request; con
+    un bloqueo_escritura tomado, siempre la última (incluida la aún no publicada).
+    """
+    if _escribiendo():
+        pendiente = _sin_publicar.get(filepath, _cache)
+        if pendiente is not _cache:
+            return pendiente if pendiente is not None else Coleccion((), None, 0)
+        return _publicada(filepath)
+    fijada = _instantanea.get()
+    if fijada is not None:
+        return fijada.leer(filepath)
+    return _publicada(filepath)
+
+def _publicada(filepath: str) -> Coleccion:
+    remota = _remotas.get(filepath)
+    if remota is not None:
+        return remota.completa()
+    particionada = _particionadas.get(filepath)
+    if particionada is not None:
+        return particionada.completa()
+    actual = _cache.get(filepath)
+    if actual is not None and filepath in _sin_publicar:
+        # Otro thread lo está escribiendo junto con otras colecciones: hasta que las publique se ve lo anterior
+        return actual
+    if actual is not None and actual.version == _version_compartida(filepath):
+        if vigilancia_activa:
+            return actual
+        try:
+            if actual.firma == _firma(filepath):
+                return actual
+        except FileNotFoundError:
+            pass
+    try:
+        nueva = _parsear(filepath)
+    except json.JSONDecodeError:
+        nueva = Coleccion((), None, _version_compartida(filepath)) # Lista vacía si el JSON está vacío o mal formado
+    if nueva is None:
+        return Coleccion((), None, 0)
+    with _cache_lock:
+        _cache[filepath] = nueva
+    return nueva
+
+def _coleccion_de(filepath: str) -> Optional[Tuple[str, str]]:
+    """(nombre, ruta de su lock de escritura) de la colección a la que pertenece el archivo, o None."""
+    nombre = _nombres_colecciones.get(filepath)
+    if nombre is not None:
+        return nombre, filepath
+    for particionada in _particionadas.values():
+        if os.path.dirname(filepath) == particionada.directorio and filepath != particionada.indice_path:
+            return particionada.nombre, particionada.path
+    return None
+
+def recargar(filepath: str) -> bool:
+    """Vuelve a parsear un archivo cambiado por fuera y reemplaza su colección.
+
+    Pensada para el vigilante: trabaja fuera del camino de los requests. Si el
+    archivo no cambió respecto de lo que hay en memoria (p. ej. lo escribimos
+    nosotros) o quedó mal formado a mitad de una edición, se conserva lo actual.
+    Si es una colección (o una de sus particiones) y no lo escribió otro worker,
+    los registros que cambiaron se publican como en cualquier escritura: el log
+    de cambios, /changes y los suscriptores también ven las ediciones hechas a mano.
+    """
+    coleccion = _coleccion_de(filepath)
+    if coleccion is None:
+        return _recargar(filepath, None)
+    nombre, ruta_lock = coleccion
+    # Con el lock de escritura ningún worker está a mitad de escribir (y anotar en el log) el archivo
+    with bloqueo_escritura(ruta_lock):
+        return _recargar(filepath, nombre)
+
+def _recargar(filepath: str, nombre: Optional[str]) -> bool:
+    actual = _cache.get(filepath)
+    if filepath in _sin_publicar:
+        # Lo escribimos nosotros y se publica al soltar el lock
+        return False
+    try:
+        if actual is not None and actual.firma == _firma(filepath):
+            return False
+    except FileNotFoundError:
+        pass
+    # Las escrituras de otro worker suben la versión compartida y ya están en el log.
+    # Una edición externa no: se sube acá, así los demás workers la ven como ya publicada.
+    externa = nombre is not None and actual is not None and actual.version == _version_compartida(filepath)
+    try:
+        if externa and MULTIPROCESO:
+            versiones_compartidas.incrementar(filepath)
+        nueva = _parsear(filepath)
+    except FileNotFoundError:
+        nueva = None
+    except json.JSONDecodeError:
+        print(f"Archivo {filepath} mal formado, se mantiene la versión anterior")
+        return False
+    with _cache_lock:
+        if _cache.get(filepath) is not actual:
+            # Mientras parseábamos hubo una escritura nuestra: esa versión es más nueva
+            return False
+        if nueva is None:
+            _cache.pop(filepath, None)
+        else:
+            _cache[filepath] = nueva
+    if externa:
+        _publicar(nombre, diferencias(actual.por_id, nueva.por_id if nueva is not None else {}))
+    return True
+
+def etag(filepaths: List[str], *extra: Any) -> str:
+    """ETag para una respuesta que depende de estas colecciones (y de `extra`, p. ej. el body).
+
+    Sale de la firma y la versión compartida de cada colección, que son iguales
+    en todos los workers, así que no hace falta serializar la respuesta para
+    saber si cambió.
+    """
+    h = hashlib.blake2b(digest_size=12)
+    for path in filepaths:
+        remota = _remotas.get(path)
+        if remota is not None:
+            h.update(f"{remota.nombre}:{remota.etiqueta()};".encode('utf-8'))
+            continue
+        # De una colección particionada alcanza con el índice: se reescribe en cada escritura
+        particionada = _particionadas.get(path)
+        coleccion = obtener_coleccion(particionada.indice_path if particionada is not None else path)
+        h.update(f"{os.path.basename(path)}:{coleccion.firma}:{coleccion.version};".encode('utf-8'))
+    h.update(json.dumps(extra, sort_keys=True, default=str).encode('utf-8'))
+    return f'"{h.hexdigest()}"'
+
+# --- Helpers para leer y escribir JSON ---
+
+def read_json_file(filepath: str) -> List[Dict[str, Any]]:
+    """Lee datos de un archivo JSON, reutilizando la versión parseada si el archivo no cambió."""
+    return _copiar(obtener_coleccion(filepath).registros)
+
+def buscar_por_id(filepath: str, registro_id: Any) -> Optional[Dict[str, Any]]:
+    """Busca un registro por 'id' usando el índice de la colección."""
+    particionada = _particionadas.get(filepath)
+    if filepath in _remotas:
+        registro = _remotas[filepath].buscar_por_id(registro_id)
+    elif particionada is not None:
+        registro = particionada.buscar_por_id(registro_id)[1]
+    else:
+        registro = obtener_coleccion(filepath).por_id.get(registro_id)
+    return dict(registro) if registro is not None else None
+
+def buscar(filepath: str, predicado: Callable[[Dict[str, Any]], bool]) -> Optional[Dict[str, Any]]:
+    """Primer registro que cumple el predicado, sin copiar toda la colección."""
+    registro = next((r for r in obtener_coleccion(filepath).registros if isinstance(r, dict) and predicado(r)), None)
+    return dict(registro) if registro is not None else None
+
+def buscar_por_alumno(filepath: str, alumno_id: Any) -> List[Dict[str, Any]]:
+    """Registros de un alumno (en el orden del archivo) usando el índice por 'alumno_id'."""
+    if filepath in _remotas:
+        return _copiar(_remotas[filepath].por_alumno(alumno_id))
+    particionada = _particionadas.get(filepath)
+    if particionada is not None:
+        return _copiar(particionada.por_alumno(alumno_id))
+    return _copiar(obtener_coleccion(filepath).por_alumno.get(alumno_id, []))
+
+def ids_existentes(filepath: str, ids: Iterable[Any]) -> Set[Any]:
+    """Cuáles de esos ids ya están en la colección (una pasada por partición, no una búsqueda por id)."""
+    if filepath in _remotas:
+        return _remotas[filepath].ids_existentes(ids)
+    particionada = _particionadas.get(filepath)
+    indices = [particionada.coleccion(p).por_id for p in particionada.particiones()] if particionada is not None \
+        else [obtener_coleccion(filepath).por_id]
+    return {registro_id for registro_id in ids if any(registro_id in por_id for por_id in indices)}
+
+def _fecha(registro: Dict[str, Any], campos: Tuple[str, ...]) -> str:
+    for campo in campos:
+        if registro.get(campo):
+            return str(registro[campo])[:10]
+    return ''
+
+def ultimo_por_alumno(filepath: str, alumno_id: Any, campos: Tuple[str, ...] = ('fecha',)) -> Optional[Dict[str, Any]]:
+    """Registro más reciente de un alumno según el primer campo de fecha presente en `campos`."""
+    particionada = _particionadas.get(filepath)
+    if particionada is not None:
+        registro = particionada.ultimo_por_alumno(alumno_id)
+    elif filepath in _remotas:
+        registros = _remotas[filepath].por_alumno(alumno_id)
+        registro = max(registros, key=lambda r: _fecha(r, campos)) if registros else None
+    else:
+        registros = obtener_coleccion(filepath).por_alumno.get(alumno_id, [])
+        registro = max(registros, key=lambda r: _fecha(r, campos)) if registros else None
+    return dict(registro) if registro is not None else None
+
+def registros_entre(filepath: str, desde: Optional[str] = None, hasta: Optional[str] = None) -> Sequence[Any]:
+    """Registros de la colección (sin copiar), tocando solo las particiones que caen en [desde, hasta].
+
+    En una colección sin particiones devuelve todos: el filtro fino por fecha lo hace el que llama.
+    """
+    particionada = _particionadas.get(filepath)
+    if particionada is not None:
+        return [r for p in particionada.particiones(desde, hasta) for r in particionada.coleccion(p).registros]
+    return obtener_coleccion(filepath).registros
+
+def write_json_file(filepath: str, data: List[Dict[str, Any]], durable: bool = False):
+    """Escribe datos a un archivo JSON y actualiza la caché.
+
+    Escribe en un temporal y lo renombra, así ningún lector (de este u otro
+    proceso) ve el archivo a medio escribir. Si es una de las COLECCIONES, los
+    registros que cambiaron quedan en el log de cambios. En una colección
+    particionada solo se reescriben las particiones que cambiaron. Con
+    durable=True vuelve recién cuando los datos están en el disco (fsync).
+    """
+    particionada = _particionadas.get(filepath) or _remotas.get(filepath)
+    if particionada is not None:
+        particionada.escribir_todo(data, durable=durable)
+        return
+    nombre = _nombres_colecciones.get(filepath)
+    # Con el lock tomado la versión anterior es la última y no la de la instantánea del request
+    with bloqueo_escritura(filepath):
+        anterior = obtener_coleccion(filepath) if nombre is not None else None
+        nueva = _escribir(filepath, data, durable)
+        if nombre is not None:
+            _publicar(nombre, diferencias(anterior.por_id, nueva.por_id))
+
+def _escribir(filepath: str, data: List[Any], durable: bool = False) -> Coleccion:
+    """Escritura atómica de un archivo (temporal + rename) y reemplazo de su colección en la caché.
+
+    Con durable=True se hace fsync del archivo antes del rename y del directorio
+    después, así lo escrito sobrevive a un corte de luz.
+    """
+    directorio = os.path.dirname(filepath)
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(filepath) + '.', suffix='.tmp', dir=directorio)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        if os.path.exists(filepath):
+            os.chmod(tmp_path, os.stat(filepath).st_mode & 0o777)
+        os.replace(tmp_path, filepath)
+        if durable:
+            fd_directorio = os.open(directorio, os.O_RDONLY)
+            try:
+                os.fsync(fd_directorio)
+            finally:
+                os.close(fd_directorio)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+    version = versiones_compartidas.incrementar(filepath) if MULTIPROCESO else 0
+    anterior = _sin_publicar.get(filepath) or _cache.get(filepath)
+    nueva = anterior.derivar(data, _firma(filepath), version) if anterior is not None else Coleccion(_copiar(data), _firma(filepath), version)
+    _reemplazar(filepath, nueva)
+    return nueva
+
+def _reemplazar(filepath: str, coleccion: Optional[Coleccion]):
+    """Pone `coleccion` como la versión vigente del archivo (None lo saca de la caché).
+
+    Con un bloqueo_escritura tomado queda en _sin_publicar hasta que el thread
+    suelte el último: así las escrituras de una misma operación se ven juntas.
+    """
+    if _escribiendo():
+        with _cache_lock:
+            _sin_publicar[filepath] = coleccion
+        _tomados.__dict__.setdefault('por_publicar', []).append(filepath)
+        return
+    with _cache_lock:
+        if coleccion is None:
+            _cache.pop(filepath, None)
+        else:
+            _cache[filepath] = coleccion
+    fijada = _instantanea.get()
+    if fijada is not None:
+        fijada.actualizar({filepath: coleccion})
+
+def _publicar_pendientes():
+    """Hace visibles de una vez las versiones que el thread escribió mientras tenía locks."""
+    rutas = _tomados.__dict__.pop('por_publicar', [])
+    escritas: Dict[str, Optional[Coleccion]] = {}
+    with _cache_lock:
+        for filepath in rutas:
+            if filepath not in _sin_publicar:
+                continue # ya la publicó otro thread que escribió el mismo archivo después
+            coleccion = escritas[filepath] = _sin_publicar.pop(filepath)
+            if coleccion is None:
+                _cache.pop(filepath, None)
+            else:
+                _cache[filepath] = coleccion
+    fijada = _instantanea.get()
+    if fijada is not None and escritas:
+        fijada.actualizar(escritas)
+
+def agregar_registros(filepath: str, registros: List[Dict[str, Any]], durable: bool = False):
+    """Agrega registros al final de una colección (en una particionada, solo toca las particiones de sus fechas)."""
+    with bloqueo_escritura(filepath):
+        particionada = _particionadas.get(filepath) or _remotas.get(filepath)
+        if particionada is not None:
+            particionada.agregar(registros, durable=durable)
+        else:
+            write_json_file(filepath, list(obtener_coleccion(filepath).registros) + list(registros), durable=durable)
+
+def actualizar_registro(filepath: str, registro_id: Any, cambios: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Aplica `cambios` al registro con ese id. Devuelve el registro actualizado o None si no existe."""
+    with bloqueo_escritura(filepath):
+        particionada = _particionadas.get(filepath) or _remotas.get(filepath)
+        if particionada is not None:
+            return particionada.actualizar(registro_id, cambios)
+        registros = read_json_file(filepath)
+        registro = next((r for r in registros if isinstance(r, dict) and r.get('id') == registro_id), None)
+        if registro is None:
+            return None
+        registro.update(cambios)
+        write_json_file(filepath, registros)
+        return registro
+
+def eliminar_registro(filepath: str, registro_id: Any) -> bool:
+    """Borra el registro con ese id. False si no existía."""
+    with bloqueo_escritura(filepath):
+        particionada = _particionadas.get(filepath) or _remotas.get(filepath)
+        if particionada is not None:
+            return particionada.eliminar(registro_id)
+        registros = obtener_coleccion(filepath).registros
+        restantes = [r for r in registros if not (isinstance(r, dict) and r.get('id') == registro_id)]
+        if len(restantes) == len(registros):
+            return False
+        write_json_file(filepath, restantes)
+        return True
+
+# --- Colecciones particionadas por mes ---
+
+class ColeccionParticionada:
+    """Una colección guardada como un archivo por mes más un índice resumen.
+
+    Cada partición es un archivo JSON común (misma caché, firmas y versiones que
+    el resto). El índice guarda por partición la cantidad de registros, el rango
+    de fechas y la última fecha de cada alumno, así que las consultas por alumno
+    o por período cargan solo las particiones que pueden tener algo.
+    Los métodos que escriben se llaman con bloqueo_escritura(path) tomado.
+    """
+
+    def __init__(self, nombre: str, path: str, campos: Tuple[str, ...]):
+        self.nombre = nombre
+        self.path = path # archivo único de antes; se migra la primera vez que se usa
+        self.campos = campos
+        self.directorio = os.path.splitext(path)[0]
+        self.indice_path = os.path.join(self.directorio, '_indice.json')
+        self._lock = threading.Lock()
+        self._indice: Tuple[Optional[Coleccion], Dict[str, Dict[str, Any]]] = (None, {})
+        self._completa: Tuple[List[Coleccion], Optional[Coleccion]] = ([], None)
+
+    def ruta(self, particion: str) -> str:
+        return os.path.join(self.directorio, particion + '.json')
+
+    def clave(self, registro: Dict[str, Any]) -> str:
+        fecha = _fecha(registro, self.campos)
+        return fecha[:7] if len(fecha) >= 7 and fecha[4] == '-' else SIN_FECHA
+
+    def indice(self) -> Dict[str, Dict[str, Any]]:
+        coleccion = obtener_coleccion(self.indice_path)
+        if coleccion.firma is None and os.path.exists(self.path):
+            self.migrar()
+            coleccion = obtener_coleccion(self.indice_path)
+        cacheada, indice = self._indice
+        if cacheada is not coleccion:
+            indice = {e['particion']: e for e in coleccion.registros if isinstance(e, dict) and 'particion' in e}
+            self._indice = (coleccion, indice)
+        return indice
+
+    def particiones(self, desde: Optional[str] = None, hasta: Optional[str] = None) -> List[str]:
+        """Particiones en orden cronológico ('sin-fecha' primero); con desde/hasta, solo las que se superponen."""
+        indice = self.indice()
+        claves = sorted(indice, key=lambda p: (p != SIN_FECHA, p))
+        if desde or hasta:
+            claves = [p for p in claves if p != SIN_FECHA
+                      and (not desde or indice[p].get('hasta', '') >= desde[:10])
+                      and (not hasta or indice[p].get('desde', '') <= hasta[:10])]
+        return claves
+
+    def coleccion(self, particion: str) -> Coleccion:
+        return obtener_coleccion(self.ruta(particion))
+
+    def completa(self) -> Coleccion:
+        """Todas las particiones juntas; se vuelve a armar solo si cambió alguna."""
+        partes = [self.coleccion(p) for p in self.particiones()]
+        with self._lock:
+            anteriores, completa = self._completa
+            if completa is None or len(anteriores) != len(partes) or any(a is not b for a, b in zip(anteriores, partes)):
+                indice = obtener_coleccion(self.indice_path)
+                completa = Coleccion([r for parte in partes for r in parte.registros], indice.firma, indice.version)
+                self._completa = (partes, completa)
+        return completa
+
+    def buscar_por_id(self, registro_id: Any) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """(partición, registro) buscando de la partición más nueva a la más vieja."""
+        for particion in reversed(self.particiones()):
+            registro = self.coleccion(particion).por_id.get(registro_id)
+            if registro is not None:
+                return particion, registro
+        return None, None
+
+    def por_alumno(self, alumno_id: Any) -> List[Dict[str, Any]]:
+        indice = self.indice()
+        return [r for p in self.particiones() if alumno_id in indice[p].get('alumnos', {})
+                for r in self.coleccion(p).por_alumno.get(alumno_id, [])]
+
+    def ultimo_por_alumno(self, alumno_id: Any) -> Optional[Dict[str, Any]]:
+        indice = self.indice()
+        for particion in reversed(self.particiones()):
+            if alumno_id in indice[particion].get('alumnos', {}):
+                registros = self.coleccion(particion).por_alumno.get(alumno_id, [])
+                if registros:
+                    return max(registros, key=lambda r: _fecha(r, self.campos))
+        return None
+
+    def _resumir(self, particion: str, registros: List[Any]) -> Dict[str, Any]:
+        fechas = []
+        alumnos: Dict[str, str] = {}
+        for r in registros:
+            if not isinstance(r, dict):
+                continue
+            fecha = _fecha(r, self.campos)
+            if fecha:
+                fechas.append(fecha)
+            if 'alumno_id' in r:
+                alumnos[r['alumno_id']] = max(alumnos.get(r['alumno_id'], ''), fecha)
+        return {"particion": particion, "registros": len(registros), "desde": min(fechas, default=''),
+                "hasta": max(fechas, default=''), "alumnos": alumnos}
+
+    def _guardar(self, grupos: Dict[str, List[Any]], indice: Optional[Dict[str, Dict[str, Any]]] = None, durable: bool = False):
+        """Reescribe las particiones de `grupos` (una lista vacía borra la partición) y después el índice."""
+        os.makedirs(self.directorio, exist_ok=True)
+        indice = dict(self.indice() if indice is None else indice)
+        for particion, registros in grupos.items():
+            if registros:
+                _escribir(self.ruta(particion), registros, durable)
+                indice[particion] = self._resumir(particion, registros)
+            else:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(self.ruta(particion))
+                _reemplazar(self.ruta(particion), None)
+                indice.pop(particion, None)
+        _escribir(self.indice_path, [indice[p] for p in sorted(indice)], durable)
+
+    def _agrupar(self, registros: List[Any]) -> Dict[str, List[Any]]:
+        grupos: Dict[str, List[Any]] = {}
+        for registro in registros:
+            grupos.setdefault(self.clave(registro) if isinstance(registro, dict) else SIN_FECHA, []).append(registro)
+        return grupos
+
+    def agregar(self, registros: List[Dict[str, Any]], durable: bool = False):
+        grupos = self._agrupar(registros)
+        existentes = self.indice()
+        for particion, nuevos in grupos.items():
+            if particion in existentes:
+                grupos[particion] = list(self.coleccion(particion).registros) + nuevos
+        self._guardar(grupos, durable=durable)
+        _publicar(self.nombre, [('insert', r['id'], r, None) for r in registros if isinstance(r, dict) and 'id' in r])
+
+    def actualizar(self, registro_id: Any, cambios: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        particion, actual = self.buscar_por_id(registro_id)
+        if actual is None:
+            return None
+        nuevo = {**actual, **cambios}
+        destino = self.clave(nuevo)
+        registros = self.coleccion(particion).registros
+        es_este = lambda r: isinstance(r, dict) and r.get('id') == registro_id
+        if destino == particion:
+            grupos = {particion: [nuevo if es_este(r) else r for r in registros]}
+        else:
+            # Cambió de mes: sale de una partición y entra en otra
+            grupos = {particion: [r for r in registros if not es_este(r)]}
+            grupos[destino] = (list(self.coleccion(destino).registros) if destino in self.indice() else []) + [nuevo]
+        self._guardar(grupos)
+        _publicar(self.nombre, [('update', registro_id, nuevo, actual)])
+        return dict(nuevo)
+
+    def eliminar(self, registro_id: Any) -> bool:
+        particion, actual = self.buscar_por_id(registro_id)
+        if actual is None:
+            return False
+        restantes = [r for r in self.coleccion(particion).registros if not (isinstance(r, dict) and r.get('id') == registro_id)]
+        self._guardar({particion: restantes})
+        _publicar(self.nombre, [('delete', registro_id, None, actual)])
+        return True
+
+    def escribir_todo(self, registros: List[Any], durable: bool = False):
+        """Reemplaza la colección completa, reescribiendo solo las particiones que cambiaron."""
+        with bloqueo_escritura(self.path):
+            anterior = self.completa()
+            grupos = self._agrupar(registros)
+            for particion in self.particiones():
+                grupos.setdefault(particion, [])
+            existentes = self.indice()
+            grupos = {p: regs for p, regs in grupos.items()
+                      if tuple(regs) != (self.coleccion(p).registros if p in existentes else ())}
+            if grupos:
+                self._guardar(grupos, durable=durable)
+            nuevos = {r['id']: r for r in registros if isinstance(r, dict) and 'id' in r}
+            _publicar(self.nombre, diferencias(anterior.por_id, nuevos))
+
+    def migrar(self):
+        """Pasa el archivo único de antes (p. ej. pagos.json) a particiones; queda como .migrado."""
+        with bloqueo_escritura(self.path):
+            if os.path.exists(self.indice_path) or not os.path.exists(self.path):
+                return
+            try:
+                legado = _parsear(self.path)
+            except json.JSONDecodeError:
+                print(f"No se pudo migrar {self.path}: JSON mal formado")
+                return
+            registros = legado.registros if legado is not None else []
+            self._guardar(self._agrupar(registros), indice={})
+            os.replace(self.path, self.path + '.migrado')
+            print(f"{self.nombre}: {len(registros)} registros migrados a {self.directorio}")
+
+    def precargar(self) -> int:
+        """Carga el índice y las particiones más recientes. Devuelve la cantidad total de registros."""
+        indice = self.indice()
+        for particion in self.particiones()[-PARTICIONES_CALIENTES:]:
+            self.coleccion(particion)
+        return sum(e.get('registros', 0) for e in indice.values())
+
+    def recargar(self):
+        """Para el vigilante: recarga el índice y las particiones que ya estaban en memoria."""
+        recargar(self.indice_path)
+        prefijo = self.directorio + os.sep
+        for ruta in [r for r in list(_cache) if r.startswith(prefijo) and r != self.indice_path]:
+            recargar(ruta)
+
+# --- Colecciones remotas (PostgREST / Supabase) ---
+
+class ColeccionRemota:
+    """Una colección guardada en una tabla PostgREST, con la misma interfaz que ColeccionParticionada.
+
+    Las lecturas pasan por la caché y los lotes de ClientePostgrest; las escrituras
+    van a la API y se publican en el log de cambios como las de los archivos. El
+    contador de versión compartido avisa a los demás workers que descarten su caché.
+    """
+
+    def __init__(self, nombre: str, path: str, cliente: 'ClientePostgrest'):
+        self.nombre = nombre
+        self.path = path
+        self.cliente = cliente
+        self.version = 0
+        self._lock = threading.Lock()
+        self._completa: Tuple[Optional[List[Any]], Optional[Coleccion]] = (None, None)
+        self._version_vista = 0
+
+    def _sincronizar(self):
+        version = _version_compartida(self.path)
+        if version != self._version_vista:
+            self._version_vista = version
+            self.cliente.invalidar(self.nombre)
+
+    def _escrito(self):
+        self.version += 1
+        if MULTIPROCESO:
+            self._version_vista = versiones_compartidas.incrementar(self.path)
+        fijada = _instantanea.get()
+        if fijada is not None:
+            fijada.actualizar({})
+
+    def etiqueta(self) -> str:
+        """Para el ETag: cambia con cada escritura (de cualquier worker) y cada vez que vence la caché."""
+        return f"{self.version}:{_version_compartida(self.path)}:{int(time.time() // max(self.cliente.ttl, 1))}"
+
+    def completa(self) -> Coleccion:
+        """La tabla entera; la misma Coleccion mientras el contenido no cambie."""
+        self._sincronizar()
+        filas = self.cliente.todos(self.nombre)
+        with self._lock:
+            anteriores, completa = self._completa
+            if filas is not anteriores:
+                if completa is None or tuple(filas) != completa.registros:
+                    completa = Coleccion(filas, None, self.version)
+                self._completa = (filas, completa)
+        return completa
+
+    def buscar_por_id(self, registro_id: Any) -> Optional[Dict[str, Any]]:
+        self._sincronizar()
+        filas = self.cliente.cargar(self.nombre, 'id', registro_id)
+        return filas[0] if filas else None
+
+    def por_alumno(self, alumno_id: Any) -> List[Dict[str, Any]]:
+        self._sincronizar()
+        return self.cliente.cargar(self.nombre, 'alumno_id', alumno_id)
+
+    def ids_existentes(self, ids: Iterable[Any]) -> Set[Any]:
+        ids = list(ids)
+        encontrados = {str(f.get('id')) for f in self.cliente.por_valores(self.nombre, 'id', ids, select='id')}
+        return {registro_id for registro_id in ids if str(registro_id) in encontrados}
+
+    def agregar(self, registros: List[Dict[str, Any]], durable: bool = False):
+        # Lo que confirma la API ya está commiteado en la base: `durable` no cambia nada
+        filas = self.cliente.insertar(self.nombre, [r for r in registros if isinstance(r, dict)])
+        self._escrito()
+        _publicar(self.nombre, [('insert', f['id'], f, None) for f in filas if 'id' in f])
+
+    def actualizar(self, registro_id: Any, cambios: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        actual = self.buscar_por_id(registro_id)
+        if actual is None:
+            return None
+        if not cambios:
+            return dict(actual)
+        filas = self.cliente.actualizar(self.nombre, [(registro_id, cambios)])
+        self._escrito()
+        if not filas:
+            return None
+        _publicar(self.nombre, [('update', registro_id, filas[0], actual)] if filas[0] != actual else [])
+        return dict(filas[0])
+
+    def eliminar(self, registro_id: Any) -> bool:
+        borradas = self.cliente.borrar(self.nombre, [registro_id])
+        self._escrito()
+        _publicar(self.nombre, [('delete', f['id'], None, f) for f in borradas if 'id' in f])
+        return bool(borradas)
+
+    def escribir_todo(self, registros: List[Any], durable: bool = False):
+        """Reemplaza la colección: solo viajan los inserts, los campos cambiados de cada update y los deletes."""
+        with bloqueo_escritura(self.path):
+            self.cliente.invalidar(self.nombre)
+            anterior = self.completa()
+            nuevos = {r['id']: r for r in registros if isinstance(r, dict) and 'id' in r}
+            cambios = diferencias(anterior.por_id, nuevos)
+            self.cliente.insertar(self.nombre, [r for op, _, r, _ in cambios if op == 'insert'])
+            self.cliente.actualizar(self.nombre, [
+                (registro_id, {k: r.get(k) for k in set(r) | set(a) if r.get(k) != a.get(k)})
+                for op, registro_id, r, a in cambios if op == 'update'])
+            self.cliente.borrar(self.nombre, [registro_id for op, registro_id, _, _ in cambios if op == 'delete'])
+            if cambios:
+                self._escrito()
+            _publicar(self.nombre, cambios)
+
+    def precargar(self) -> int:
+        from .remoto import ErrorRemoto
+        try:
+            return len(self.completa().registros)
+        except ErrorRemoto as e:
+            print(f"No se pudo precargar {self.nombre} desde {self.cliente.url}: {e}")
+            return 0
+
+cliente_remoto: Optional['ClientePostgrest'] = None
+if COLECCIONES_REMOTAS:
+    from . import remoto
+    cliente_remoto = remoto.ClientePostgrest.desde_entorno()
+_remotas: Dict[str, ColeccionRemota] = {
+    COLECCIONES[nombre]: ColeccionRemota(nombre, COLECCIONES[nombre], cliente_remoto) for nombre in COLECCIONES_REMOTAS if nombre in COLECCIONES
+}
+
+# Una colección remota no se particiona: de eso se encargan la tabla y sus índices
+_particionadas: Dict[str, ColeccionParticionada] = {
+    COLECCIONES[nombre]: ColeccionParticionada(nombre, COLECCIONES[nombre], campos) for nombre, campos in PARTICIONADAS.items()
+    if COLECCIONES[nombre] not in _remotas
+}
+
+async def read_json_file_async(filepath: str) -> List[Dict[str, Any]]:
+    """Versión async de read_json_file: el I/O corre en un thread y no bloquea el event loop."""
+    return await asyncio.to_thread(read_json_file, filepath)
+
+async def write_json_file_async(filepath: str, data: List[Dict[str, Any]]):
+    """Versión async de write_json_file."""
+    await asyncio.to_thread(write_json_file, filepath, data)
+
+def bloqueo(filepath: str) -> threading.RLock:
+    """Devuelve el lock de escritura asociado a un archivo."""
+    with _cache_lock:
+        return _bloqueos.setdefault(filepath, threading.RLock())
+
+# Archivos cuyo flock ya tiene el thread actual (bloqueo_escritura es reentrante)
+_tomados = threading.local()
+
+@contextlib.contextmanager
+def bloqueo_escritura(filepath: str) -> Iterator[None]:
+    """Lock de escritura del archivo: entre threads siempre y, en modo multiproceso, también entre workers.
+
+    Lo que se escribe con el lock tomado se hace visible a los lectores al soltar
+    el último lock del thread (ver _reemplazar), antes de que otro pueda tomarlo.
+    """
+    with bloqueo(filepath):
+        estado = _tomados.__dict__
+        estado['profundidad'] = estado.get('profundidad', 0) + 1
+        try:
+            tomados = estado.setdefault('rutas', set())
+            if not MULTIPROCESO or filepath in tomados:
+                yield
+                return
+            # Primero el lock del thread: así cada proceso tiene a lo sumo un thread esperando el flock
+            with open(filepath + '.lock', 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                tomados.add(filepath)
+                try:
+                    yield
+                finally:
+                    tomados.discard(filepath)
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        finally:
+            estado['profundidad'] -= 1
+            if not estado['profundidad']:
+                _publicar_pendientes()
+
+def serializar_escrituras(filepath: str, lecturas: Tuple[str, ...] = ('read',)) -> Callable:
+    """Decorador para las tools crud_*: las acciones que no están en `lecturas` toman el lock de escritura del archivo.
+
+    Conserva nombre, firma y docstring de la función (ADK arma la declaración de la tool con eso).
+    """
+    def decorador(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def envoltura(action: str, data: Dict[str, Any]) -> Dict[str, Any]:
+            if action in lecturas:
+                return fn(action=action, data=data)
+            with bloqueo_escritura(filepath):
+                return fn(action=action, data=data)
+        return envoltura
+    return decorador
+
+def precargar() -> Dict[str, int]:
+    """Carga las colecciones (con sus índices) para dejar la caché caliente. Devuelve cuántos registros tiene cada una.
+
+    De las colecciones particionadas solo se cargan el índice y los meses más recientes.
+    """
+    return {nombre: (_particionadas.get(path) or _remotas[path]).precargar() if path in _particionadas or path in _remotas
+            else len(obtener_coleccion(path).registros)
+            for nombre, path in COLECCIONES.items()}
+
+def iniciar_vigilancia():
+    """Arranca el vigilante sobre las colecciones y sudo-users.json (y cualquier archivo extra ya registrado en `vigilante`)."""
+    global vigilancia_activa
+    archivos = [path for path in COLECCIONES.values() if path not in _particionadas and path not in _remotas] + [SUDO_USERS_PATH]
+    for path in archivos:
+        vigilante.agregar(path, lambda _ruta, path=path: recargar(path))
+    # De las particionadas se vigila el índice, que se reescribe con cada escritura
+    for particionada in _particionadas.values():
+        vigilante.agregar(particionada.indice_path, lambda _ruta, p=particionada: p.recargar())
+        # Y cada partición existente, por si se edita a mano sin tocar el índice
+        for particion in particionada.particiones():
+            ruta = particionada.ruta(particion)
+            vigilante.agregar(ruta, lambda _ruta, ruta=ruta: recargar(ruta))
+    # Cambios registrados por otros workers: despierta a quien espera cambios nuevos
+    vigilante.agregar(CAMBIOS_PATH, lambda _ruta: registro_cambios.notificar())
+    vigilante.iniciar()
+    vigilancia_activa = True
+    # Cubrir cambios ocurridos entre la precarga y el arranque del vigilante
+    for path in archivos:
+        recargar(path)
+    for particionada in _particionadas.values():
+        particionada.recargar()
+    print(f"Vigilando {BASE_DATA_PATH} ({vigilante.modo})")
+
+def cerrar_remoto():
+    """Cierra las conexiones del cliente remoto (al apagar el servidor)."""
+    if cliente_remoto is not None:
+        cliente_remoto.cerrar()
+
+def detener_vigilancia():
+    global vigilancia_activa
+    vigilancia_activa = False
+    vigilante.detener()
@@ -0,0 +1,130 @@
+import re
+import threading
+from collections import Counter
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional, Tuple, Union
+
+# Modelo local determinístico para correr el agente sin llamar a Gemini.
+# Se activa con AGENTE_LLM=stub (ver index.py) y reproduce secuencias fijas de
+# llamadas a tools a través del Runner de ADK, así se puede medir el endpoint
+# /agente_ia/ de punta a punta sin red ni costo.
+
+try:
+    from google.adk.models.base_llm import BaseLlm
+    from google.adk.models.llm_request import LlmRequest
+    from google.adk.models.llm_response import LlmResponse
+    from google.genai import types
+    from pydantic import PrivateAttr
+    google_adk_available = True
+except ImportError:
+    google_adk_available = False
+    BaseLlm = object
+    PrivateAttr = lambda **kwargs: None
+
+# Un paso recibe el match del prompt y las respuestas previas de tools
+# (en orden) y devuelve (nombre_tool, args), una lista de llamadas que el
+# modelo pide juntas en el mismo turno, o None para cerrar el turno.
+Llamada = Tuple[str, Dict[str, Any]]
+Paso = Callable[[re.Match, List[Dict[str, Any]]], Union[None, Llamada, List[Llamada]]]
+
+def _id_alumno(respuestas: List[Dict[str, Any]]) -> Optional[str]:
+    """Saca el id del alumno de la primera respuesta (un crud_alumnos read)."""
+    if not respuestas:
+        return None
+    data = respuestas[0].get('data')
+    return data.get('id') if isinstance(data, dict) else None
+
+def _nombre(m: re.Match) -> Dict[str, Any]:
+    return {'nombre': m.group('nombre'), 'apellido': m.group('apellido')}
+
+_NOMBRE = r"(?P<nombre>[A-Za-zÁÉÍÓÚáéíóúÑñ]+)\s+(?P<apellido>[A-Za-zÁÉÍÓÚáéíóúÑñ]+)"
+
+# Guiones: patrón del prompt -> lista de pasos. El primero que matchea gana.
+GUIONES: List[Tuple[re.Pattern, List[Paso]]] = [
+    (re.compile(r"\b(hola|buen[oa]s)\b", re.I), [
+        lambda m, r: ('saludo_alerta', {}),
+    ]),
+    (re.compile(r"\blist(ar|a|ado)\b.*\balumnos\b", re.I), [
+        lambda m, r: ('listar_nombres_alumnos', {}),
+    ]),
+    (re.compile(r"\b[uú]ltimo pago de " + _NOMBRE, re.I), [
+        lambda m, r: ('ultimo_pago_alumno', _nombre(m)),
+    ]),
+    (re.compile(r"\bresumen de " + _NOMBRE, re.I), [
+        lambda m, r: ('crud_alumnos', {'action': 'read', 'data': _nombre(m)}),
+        lambda m, r: ('resumen_alumno', {'alumno_id': _id_alumno(r)}) if _id_alumno(r) else None,
+    ]),
+    (re.compile(r"\bhistorial de " + _NOMBRE, re.I), [
+        lambda m, r: ('crud_alumnos', {'action': 'read', 'data': _nombre(m)}),
+        lambda m, r: [(f"crud_{c}", {'action': 'read', 'data': {'alumno_id': _id_alumno(r)}})
+                      for c in ('pagos', 'notas', 'asistencias')] if _id_alumno(r) else None,
+    ]),
+    (re.compile(r"\bnotas (?:con|sobre) (?P<consulta>.+?)[?.!]*$", re.I), [
+        lambda m, r: ('buscar_notas', {'consulta': m.group('consulta')}),
+    ]),
+    (re.compile(r"\b(pagos|notas|asistencias) de " + _NOMBRE, re.I), [
+        lambda m, r: ('crud_alumnos', {'action': 'read', 'data': _nombre(m)}),
+        lambda m, r: (f"crud_{m.group(1).lower()}", {'action': 'read', 'data': {'alumno_id': _id_alumno(r)}}) if _id_alumno(r) else None,
+    ]),
+]
+
+class StubLlm(BaseLlm):
+    """LLM falso que decide las llamadas a tools con expresiones regulares."""
+
+    model: str = "stub-local"
+    # Contadores por tool, compartidos entre sesiones y requests concurrentes
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _llamadas: Counter = PrivateAttr(default_factory=Counter)
+
+    @classmethod
+    def supported_models(cls) -> List[str]:
+        return [r"stub-.*"]
+
+    def estadisticas(self) -> Dict[str, int]:
+        """Devuelve cuántas veces se pidió cada tool desde que arrancó el proceso."""
+        with self._lock:
+            return dict(self._llamadas)
+
+    async def generate_content_async(self, llm_request: "LlmRequest", stream: bool = False) -> AsyncGenerator["LlmResponse", None]:
+        prompt, respuestas, pasos_hechos = self._turno_actual(llm_request.contents or [])
+        llamadas = self._siguiente_llamada(prompt, respuestas, pasos_hechos)
+        if llamadas:
+            with self._lock:
+                for nombre, _ in llamadas:
+                    self._llamadas[nombre] += 1
+            partes = [types.Part.from_function_call(name=nombre, args=args) for nombre, args in llamadas]
+        else:
+            partes = [types.Part.from_text(text=self._texto_final(prompt, respuestas))]
+        yield LlmResponse(content=types.Content(role="model", parts=partes))
+
+    @staticmethod
+    def _turno_actual(contents: List[Any]) -> Tuple[str, List[Dict[str, Any]], int]:
+        """Busca el último mensaje de texto del usuario, las respuestas de tools posteriores y cuántos pasos ya se pidieron."""
+        respuestas: List[Dict[str, Any]] = []
+        pasos_hechos = 0
+        for content in reversed(contents):
+            parts = content.parts or []
+            textos = [p.text for p in parts if p.text and content.role == "user"]
+            if textos:
+                return " ".join(textos), respuestas, pasos_hechos
+            respuestas[:0] = [p.function_response.response or {} for p in parts if p.function_response]
+            pasos_hechos += any(p.function_call for p in parts)
+        return "", respuestas, pasos_hechos
+
+    @staticmethod
+    def _siguiente_llamada(prompt: str, respuestas: List[Dict[str, Any]], pasos_hechos: int) -> List[Llamada]:
+        for patron, pasos in GUIONES:
+            m = patron.search(prompt)
+            if not m:
+                continue
+            if pasos_hechos >= len(pasos):
+                return []
+            llamadas = pasos[pasos_hechos](m, respuestas)
+            return [llamadas] if isinstance(llamadas, tuple) else llamadas or []
+        return []
+
+    @staticmethod
+    def _texto_final(prompt: str, respuestas: List[Dict[str, Any]]) -> str:
+        if not respuestas:
+            return "No tengo una herramienta para eso, ¿podés reformular la consulta?"
+        ultima = respuestas[-1]
+        return str(ultima.get('message') or ultima.get('resumen') or ultima.get('alerta') or ultima)
@@ -0,0 +1,178 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+import threading
+import uuid
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+# API PostgREST local y en memoria para probar el almacén remoto (remoto.py)
+# sin una base de Supabase. Implementa lo que usa el backend: GET con filtros
+# (eq, neq, gt, gte, lt, lte, in, is), order, limit y offset; POST (con
+# Prefer: resolution=merge-duplicates), PATCH y DELETE con filtros, y
+# Prefer: return=representation. Las tablas se crean al primer uso.
+#
+#     PYTHONPATH=. python -m src.agent.agent.stub_postgrest --semilla --puerto 3000
+#     AGENTE_ALMACEN=postgrest AGENTE_REMOTO_URL=http://localhost:3000 uvicorn index:app
+#
+# Con --latencia-ms cada pedido tarda eso de más, para ver el efecto de los lotes y la caché.
+
+RESERVADOS = {'select', 'order', 'limit', 'offset', 'columns', 'on_conflict'}
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
+
+app = FastAPI()
+tablas: Dict[str, List[Dict[str, Any]]] = {}
+_lock = threading.Lock()
+pedidos: Counter = Counter()
+latencia_segundos = float(os.environ.get("STUB_POSTGREST_LATENCIA_MS", "0")) / 1000
+
+def sembrar(directorio: str = DATA_PATH):
+    """Carga cada colección de data/ (archivo único o particionada por mes) como una tabla."""
+    for nombre in ('alumnos', 'pagos', 'notas', 'asistencias', 'citas'):
+        archivos = sorted(p for p in glob.glob(os.path.join(directorio, nombre, '*.json')) if not p.endswith('_indice.json'))
+        if not archivos and os.path.exists(os.path.join(directorio, f'{nombre}.json')):
+            archivos = [os.path.join(directorio, f'{nombre}.json')]
+        filas = []
+        for archivo in archivos:
+            with open(archivo, encoding='utf-8') as f:
+                filas.extend(r for r in json.load(f) if isinstance(r, dict))
+        tablas[nombre] = filas
+
+def _lista_en(argumento: str) -> List[str]:
+    """Valores de in.(a,"b,c",d)."""
+    valores, actual, entre_comillas, escape, citado = [], '', False, False, False
+    for c in argumento.strip()[1:-1]:
+        if escape:
+            actual, escape = actual + c, False
+        elif c == '\\' and entre_comillas:
+            escape = True
+        elif c == '"':
+            entre_comillas, citado = not entre_comillas, True
+        elif c == ',' and not entre_comillas:
+            valores.append(actual if citado else actual.strip())
+            actual, citado = '', False
+        else:
+            actual += c
+    if actual or citado:
+        valores.append(actual if citado else actual.strip())
+    return valores
+
+def _comparable(valor: Any, argumento: str) -> Tuple[Any, Any]:
+    try:
+        return float(valor), float(argumento)
+    except (TypeError, ValueError):
+        return str(valor), argumento
+
+def _cumple(fila: Dict[str, Any], columna: str, condicion: str) -> bool:
+    operador, _, argumento = condicion.partition('.')
+    valor = fila.get(columna)
+    if operador == 'is':
+        return valor is None if argumento == 'null' else str(valor).lower() == argumento
+    if operador == 'in':
+        return valor is not None and str(valor) in _lista_en(argumento)
+    if operador in ('eq', 'neq'):
+        igual = valor is not None and (str(valor) == argumento or (isinstance(valor, bool) and str(valor).lower() == argumento))
+        return igual if operador == 'eq' else not igual
+    if valor is None:
+        return False
+    a, b = _comparable(valor, argumento)
+    return {'gt': a > b, 'gte': a >= b, 'lt': a < b, 'lte': a <= b}.get(operador, False)
+
+def _filtrar(filas: List[Dict[str, Any]], request: Request) -> List[Dict[str, Any]]:
+    condiciones = [(k, v) for k, v in request.query_params.multi_items() if k not in RESERVADOS]
+    return [f for f in filas if all(_cumple(f, k, v) for k, v in condiciones)]
+
+def _prefer(request: Request) -> set:
+    return {p.strip() for p in request.headers.get('prefer', '').split(',') if p.strip()}
+
+def _responder(filas: List[Dict[str, Any]], request: Request, status: int) -> Response:
+    if 'return=representation' in _prefer(request):
+        return JSONResponse(filas, status_code=status)
+    return Response(status_code=204)
+
+@app.middleware("http")
+async def contar(request: Request, call_next):
+    pedidos[request.method] += 1
+    if latencia_segundos:
+        await asyncio.sleep(latencia_segundos)
+    return await call_next(request)
+
+@app.get("/_estadisticas")
+async def estadisticas():
+    return {"pedidos": dict(pedidos), "tablas": {nombre: len(filas) for nombre, filas in tablas.items()}}
+
+@app.get("/{tabla}")
+async def leer(tabla: str, request: Request):
+    with _lock:
+        filas = _filtrar(tablas.setdefault(tabla, []), request)
+    for orden in reversed([o for o in request.query_params.get('order', '').split(',') if o]):
+        columna, _, sentido = orden.partition('.')
+        filas = sorted(filas, key=lambda f: (f.get(columna) is None, str(f.get(columna))), reverse=sentido.startswith('desc'))
+    desde = int(request.query_params.get('offset') or 0)
+    limite: Optional[int] = int(request.query_params['limit']) if request.query_params.get('limit') else None
+    filas = filas[desde:desde + limite if limite is not None else None]
+    select = request.query_params.get('select', '*')
+    if select != '*':
+        columnas = [c.strip() for c in select.split(',')]
+        filas = [{c: f.get(c) for c in columnas} for f in filas]
+    return JSONResponse(filas)
+
+@app.post("/{tabla}")
+async def insertar(tabla: str, request: Request):
+    cuerpo = await request.json()
+    nuevas = [dict(f) for f in (cuerpo if isinstance(cuerpo, list) else [cuerpo])]
+    fusionar = 'resolution=merge-duplicates' in _prefer(request)
+    with _lock:
+        filas = tablas.setdefault(tabla, [])
+        por_id = {str(f.get('id')): f for f in filas}
+        for fila in nuevas:
+            fila.setdefault('id', str(uuid.uuid4()))
+            existente = por_id.get(str(fila['id']))
+            if existente is not None and not fusionar:
+                return JSONResponse({"code": "23505", "message": f"duplicate key value (id)=({fila['id']})"}, status_code=409)
+        for fila in nuevas:
+            existente = por_id.get(str(fila['id']))
+            if existente is not None:
+                existente.update(fila)
+            else:
+                filas.append(fila)
+                por_id[str(fila['id'])] = fila
+        resultado = [dict(por_id[str(f['id'])]) for f in nuevas]
+    return _responder(resultado, request, 201)
+
+@app.patch("/{tabla}")
+async def actualizar(tabla: str, request: Request):
+    cambios = await request.json()
+    with _lock:
+        filas = _filtrar(tablas.setdefault(tabla, []), request)
+        for fila in filas:
+            fila.update(cambios)
+        resultado = [dict(f) for f in filas]
+    return _responder(resultado, request, 200)
+
+@app.delete("/{tabla}")
+async def borrar(tabla: str, request: Request):
+    with _lock:
+        borradas = _filtrar(tablas.setdefault(tabla, []), request)
+        ids = {id(f) for f in borradas}
+        tablas[tabla] = [f for f in tablas[tabla] if id(f) not in ids]
+    return _responder([dict(f) for f in borradas], request, 200)
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="API PostgREST local en memoria.")
+    parser.add_argument("--puerto", type=int, default=3000)
+    parser.add_argument("--semilla", action="store_true", help="cargar las colecciones de src/agent/data")
+    parser.add_argument("--latencia-ms", type=float, default=None, help="demora agregada a cada pedido")
+    args = parser.parse_args()
+    if args.semilla:
+        sembrar()
+    if args.latencia_ms is not None:
+        latencia_segundos = args.latencia_ms / 1000
+    uvicorn.run(app, host="127.0.0.1", port=args.puerto, log_level="warning")
@@ -0,0 +1,390 @@
+import contextlib
+import datetime
+import fcntl
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from . import facturacion, reportes
+from .permisos import bits_de_accion, verificar_permiso
+from .store import BASE_DATA_PATH, registro_cambios
+
+# Trabajos en segundo plano: lo que tarda (alertas, reportes, facturación,
+# mantenimiento) no corre dentro de un request. Se lanza un trabajo, se recibe
+# su id y se consulta el estado hasta que termina. Los cálculos pesados van a un
+# pool de procesos (no compiten por el GIL con el servidor); los que escriben
+# corren en un thread de este proceso, así pasan por los locks, la caché y el log
+# de cambios del store. El estado de cada trabajo queda en data/trabajos/<id>.json:
+# cualquier worker puede responder por un trabajo lanzado en otro.
+# Además hay trabajos programados con expresiones tipo cron; con varios workers
+# solo los lanza el que tiene el lock del programador.
+
+PROCESOS_TRABAJOS = int(os.environ.get("AGENTE_PROCESOS_TRABAJOS", "2"))
+HILOS_TRABAJOS = int(os.environ.get("AGENTE_HILOS_TRABAJOS", "4"))
+# Cuántos trabajos terminados se conservan en data/trabajos
+RETENER_TRABAJOS = int(os.environ.get("AGENTE_TRABAJOS_RETENER", "200"))
+# "tipo=minuto hora día mes día_semana" separados por ';' (vacío desactiva el programador)
+PROGRAMA_DEFAULT = "alertas=*/15 * * * *;mantenimiento=30 4 * * *"
+PROGRAMA = os.environ.get("AGENTE_TRABAJOS_PROGRAMADOS", PROGRAMA_DEFAULT)
+
+TRABAJOS_PATH = os.path.join(BASE_DATA_PATH, 'trabajos')
+PROGRAMADOR_LOCK_PATH = os.path.join(BASE_DATA_PATH, '.programador.lock')
+
+PENDIENTE, CORRIENDO, TERMINADO, ERROR = 'pendiente', 'corriendo', 'terminado', 'error'
+
+def _facturar_mes(mes: Optional[int] = None, anio: Optional[int] = None, monto: Optional[float] = None,
+                  simular: bool = False) -> Dict[str, Any]:
+    # Programado sin parámetros: factura el mes en curso
+    hoy = datetime.date.today()
+    return facturacion.facturar(mes or hoy.month, anio or hoy.year, monto, bool(simular))
+
+def _mantenimiento() -> Dict[str, Any]:
+    return {"cambios_en_log": registro_cambios.compactar(), "trabajos_descartados": _podar()}
+
+class TipoTrabajo:
+    """Un trabajo que se puede lanzar: la función, dónde corre y qué permisos pide."""
+
+    def __init__(self, fn: Callable[..., Any], en_proceso: bool, permisos: Tuple[Tuple[str, str], ...], descripcion: str):
+        self.fn = fn
+        self.en_proceso = en_proceso # CPU pesado y sin escrituras: pool de procesos
+        self.permisos = permisos # (recurso, acción) que necesita quien lo lanza
+        self.descripcion = descripcion
+
+TIPOS: Dict[str, TipoTrabajo] = {
+    'alertas': TipoTrabajo(reportes.alertas, True, (('alertas', 'read'),),
+                           "Alumnos que no asisten hace días o deben la cuota. Parámetros: dias_sin_asistir."),
+    'reporte_mensual': TipoTrabajo(reportes.reporte_mensual, True, (('pagos', 'read'), ('asistencias', 'read')),
+                                   "Pagos y asistencias por mes. Parámetros: desde, hasta (YYYY-MM-DD)."),
+    'facturar_mes': TipoTrabajo(_facturar_mes, False, (('pagos', 'create'), ('alumnos', 'update')),
+                                "Genera las cuotas pendientes del mes. Parámetros: mes, anio, monto, simular."),
+    'mantenimiento': TipoTrabajo(_mantenimiento, False, (('alumnos', 'update'),),
+                                 "Compacta el log de cambios y descarta trabajos viejos."),
+}
+
+class Cron:
+    """Expresión cron de 5 campos (minuto hora día mes día_semana) con *, */n, a-b, a-b/n y listas."""
+
+    RANGOS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+
+    def __init__(self, expresion: str):
+        campos = expresion.split()
+        if len(campos) != 5:
+            raise ValueError(f"expresión cron inválida: {expresion!r}")
+        self.expresion = expresion
+        self.minutos, self.horas, self.dias, self.meses, self.dias_semana = (
+            self._campo(c, *r) for c, r in zip(campos, self.RANGOS))
+        # Como en cron: si se restringen día y día de la semana, alcanza con que coincida uno
+        self._dia_o_semana = campos[2] != '*' and campos[4] != '*'
+
+    @staticmethod
+    def _campo(campo: str, minimo: int, maximo: int) -> Set[int]:
+        valores: Set[int] = set()
+        for parte in campo.split(','):
+            rango, _, paso = parte.partition('/')
+            if rango == '*':
+                desde, hasta = minimo, maximo
+            elif '-' in rango:
+                desde, hasta = (int(v) for v in rango.split('-', 1))
+            else:
+                desde = hasta = int(rango)
+            if desde < minimo or hasta > maximo or desde > hasta:
+                raise ValueError(f"valor fuera de rango en {campo!r}")
+            valores.update(range(desde, hasta + 1, int(paso) if paso else 1))
+        return valores
+
+    def coincide(self, momento: datetime.datetime) -> bool:
+        if momento.minute not in self.minutos or momento.hour not in self.horas or momento.month not in self.meses:
+            return False
+        dia = momento.day in self.dias
+        semana = (momento.isoweekday() % 7) in self.dias_semana # 0 = domingo
+        return (dia or semana) if self._dia_o_semana else (dia and semana)
+
+def programa(texto: str = PROGRAMA) -> List[Tuple[str, Cron]]:
+    """(tipo, cron) de cada trabajo programado; los mal escritos se informan y se ignoran."""
+    resultado = []
+    for entrada in filter(None, (e.strip() for e in texto.split(';'))):
+        tipo, _, expresion = entrada.partition('=')
+        try:
+            if tipo.strip() not in TIPOS:
+                raise ValueError(f"tipo de trabajo desconocido: {tipo.strip()!r}")
+            resultado.append((tipo.strip(), Cron(expresion)))
+        except ValueError as e:
+            print(f"Trabajo programado ignorado ({entrada}): {e}")
+    return resultado
+
+_trabajos: Dict[str, Dict[str, Any]] = {}
+_trabajos_lock = threading.Lock()
+_hilos: Optional[ThreadPoolExecutor] = None
+_procesos: Optional[ProcessPoolExecutor] = None
+_pools_lock = threading.Lock()
+
+def _pool_hilos() -> ThreadPoolExecutor:
+    global _hilos
+    with _pools_lock:
+        if _hilos is None:
+            _hilos = ThreadPoolExecutor(max_workers=HILOS_TRABAJOS, thread_name_prefix="trabajos")
+        return _hilos
+
+def _pool_procesos() -> ProcessPoolExecutor:
+    global _procesos
+    with _pools_lock:
+        if _procesos is None:
+            # spawn: el servidor tiene threads (vigilante, pools) y fork los copiaría a medias
+            _procesos = ProcessPoolExecutor(max_workers=PROCESOS_TRABAJOS, mp_context=multiprocessing.get_context('spawn'))
+        return _procesos
+
+def _ahora() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+def _ruta(trabajo_id: str) -> str:
+    return os.path.join(TRABAJOS_PATH, f"{trabajo_id}.json")
+
+def _guardar(trabajo: Dict[str, Any]):
+    os.makedirs(TRABAJOS_PATH, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.trabajo.', suffix='.tmp', dir=TRABAJOS_PATH)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(trabajo, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, _ruta(trabajo['id']))
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+
+def _actualizar(trabajo_id: str, **campos: Any) -> Dict[str, Any]:
+    with _trabajos_lock:
+        trabajo = _trabajos[trabajo_id]
+        trabajo.update(campos)
+        copia = dict(trabajo)
+        if trabajo['estado'] in (TERMINADO, ERROR):
+            # Los terminados se leen de su archivo: la memoria solo guarda los que están en curso
+            del _trabajos[trabajo_id]
+    _guardar(copia)
+    return copia
+
+def _correr(trabajo_id: str, tipo: TipoTrabajo, parametros: Dict[str, Any]):
+    inicio = time.perf_counter()
+    _actualizar(trabajo_id, estado=CORRIENDO, iniciado=_ahora())
+    try:
+        if tipo.en_proceso:
+            try:
+                resultado = _pool_procesos().submit(tipo.fn, **parametros).result()
+            except BrokenProcessPool:
+                # Un proceso murió (p. ej. sin memoria): se arma un pool nuevo para los próximos
+                global _procesos
+                with _pools_lock:
+                    _procesos = None
+                raise
+        else:
+            resultado = tipo.fn(**parametros)
+    except Exception as e:
+        _actualizar(trabajo_id, estado=ERROR, error=f"{type(e).__name__}: {e}", terminado=_ahora(),
+                    duracion_ms=round((time.perf_counter() - inicio) * 1000, 1))
+        print(f"Trabajo {trabajo_id} con error: {e}")
+        return
+    trabajo = _actualizar(trabajo_id, estado=TERMINADO, resultado=resultado, terminado=_ahora(),
+                          duracion_ms=round((time.perf_counter() - inicio) * 1000, 1))
+    # Puntero al último resultado de cada tipo (p. ej. las alertas del saludo)
+    puntero = os.path.join(TRABAJOS_PATH, f"ultimo_{trabajo['tipo']}")
+    with open(puntero + '.tmp', 'w', encoding='utf-8') as f:
+        f.write(trabajo_id)
+    os.replace(puntero + '.tmp', puntero)
+
+def sin_permiso(tipo: str) -> Optional[str]:
+    """None si el usuario actual puede lanzar (y ver) trabajos de ese tipo; si no, el motivo."""
+    for recurso, accion in TIPOS[tipo].permisos:
+        motivo = verificar_permiso(recurso, bits_de_accion(accion))
+        if motivo is not None:
+            return motivo
+    return None
+
+def lanzar(tipo: str, parametros: Optional[Dict[str, Any]] = None, origen: str = 'api') -> Dict[str, Any]:
+    """Encola un trabajo y devuelve su registro (con el id para consultarlo). No espera a que termine.
+
+    Los permisos se chequean acá, con el usuario actual; ValueError si el tipo no existe.
+    """
+    definicion = TIPOS.get(tipo)
+    if definicion is None:
+        raise ValueError(f"Tipo de trabajo desconocido: {tipo}. Disponibles: {', '.join(TIPOS)}")
+    motivo = sin_permiso(tipo) if origen != 'programado' else None
+    if motivo is not None:
+        raise PermissionError(motivo)
+    parametros = dict(parametros or {})
+    trabajo = {"id": uuid.uuid4().hex, "tipo": tipo, "parametros": parametros, "origen": origen,
+               "estado": PENDIENTE, "creado": _ahora(), "iniciado": None, "terminado": None,
+               "duracion_ms": None, "resultado": None, "error": None}
+    with _trabajos_lock:
+        _trabajos[trabajo["id"]] = trabajo
+    _guardar(trabajo)
+    _pool_hilos().submit(_correr, trabajo["id"], definicion, parametros)
+    return dict(trabajo)
+
+def estado(trabajo_id: str) -> Optional[Dict[str, Any]]:
+    """El registro del trabajo (lanzado en este u otro worker), o None si no existe o ya se descartó."""
+    with _trabajos_lock:
+        if trabajo_id in _trabajos:
+            return dict(_trabajos[trabajo_id])
+    if not trabajo_id or os.path.basename(trabajo_id) != trabajo_id:
+        return None
+    try:
+        with open(_ruta(trabajo_id), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def listar(limite: int = 50) -> List[Dict[str, Any]]:
+    """Los trabajos más recientes (sin el resultado), del más nuevo al más viejo."""
+    try:
+        nombres = [n for n in os.listdir(TRABAJOS_PATH) if n.endswith('.json')]
+    except FileNotFoundError:
+        return []
+    rutas = sorted((os.path.join(TRABAJOS_PATH, n) for n in nombres), key=_mtime, reverse=True)[:limite]
+    trabajos = [estado(os.path.basename(r)[:-len('.json')]) for r in rutas]
+    return [{k: v for k, v in t.items() if k != 'resultado'} for t in trabajos if t is not None]
+
+def en_curso() -> Dict[str, int]:
+    """Cuántos trabajos de cada tipo están pendientes o corriendo en este proceso."""
+    with _trabajos_lock:
+        return dict(Counter(t['tipo'] for t in _trabajos.values()))
+
+def ultimo_terminado(tipo: str) -> Optional[Dict[str, Any]]:
+    """El último trabajo de ese tipo que terminó bien (en cualquier worker), o None."""
+    try:
+        with open(os.path.join(TRABAJOS_PATH, f"ultimo_{tipo}"), encoding='utf-8') as f:
+            return estado(f.read().strip())
+    except FileNotFoundError:
+        return None
+
+def ultimo_resultado(tipo: str) -> Optional[Any]:
+    trabajo = ultimo_terminado(tipo)
+    return trabajo['resultado'] if trabajo is not None else None
+
+def _mtime(ruta: str) -> float:
+    try:
+        return os.stat(ruta).st_mtime
+    except FileNotFoundError:
+        return 0.0
+
+def _podar() -> int:
+    """Descarta los trabajos terminados más viejos que excedan RETENER_TRABAJOS."""
+    terminados = [t for t in listar(limite=10 ** 6) if t['estado'] in (TERMINADO, ERROR)]
+    descartados = 0
+    for trabajo in terminados[RETENER_TRABAJOS:]:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(_ruta(trabajo['id']))
+        descartados += 1
+    return descartados
+
+class Programador:
+    """Thread que cada minuto lanza los trabajos programados que coinciden con la hora."""
+
+    def __init__(self, entradas: List[Tuple[str, Cron]]):
+        self.entradas = entradas
+        self._detener = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock_file = None
+        self._en_curso: Dict[str, str] = {} # tipo -> id del último lanzado
+
+    def _es_lider(self) -> bool:
+        # Con varios workers, solo el que tiene el lock lanza los programados (se reintenta cada minuto)
+        if self._lock_file is not None:
+            return True
+        lock_file = open(PROGRAMADOR_LOCK_PATH, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def tick(self, momento: datetime.datetime):
+        for tipo, cron in self.entradas:
+            if not cron.coincide(momento):
+                continue
+            anterior = estado(self._en_curso.get(tipo, ''))
+            if anterior is not None and anterior['estado'] in (PENDIENTE, CORRIENDO):
+                print(f"Trabajo programado {tipo} salteado: el anterior sigue corriendo")
+                continue
+            self._en_curso[tipo] = lanzar(tipo, origen='programado')['id']
+
+    def _bucle(self):
+        while not self._detener.is_set():
+            ahora = datetime.datetime.now()
+            if self._es_lider():
+                try:
+                    self.tick(ahora)
+                except Exception as e:
+                    print(f"Error en el programador de trabajos: {e}")
+            proximo = ahora.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+            self._detener.wait(max(0.0, (proximo - datetime.datetime.now()).total_seconds()))
+
+    def iniciar(self):
+        if self._thread is None and self.entradas:
+            self._thread = threading.Thread(target=self._bucle, name="programador", daemon=True)
+            self._thread.start()
+
+    def detener(self):
+        self._detener.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+programador = Programador(programa())
+
+def iniciar():
+    """Arranca el programador (si hay trabajos programados)."""
+    programador.iniciar()
+    if programador.entradas:
+        print(f"Trabajos programados: {', '.join(f'{t} ({c.expresion})' for t, c in programador.entradas)}")
+
+def detener():
+    """Detiene el programador y libera los pools (al apagar el servidor)."""
+    global _hilos, _procesos
+    programador.detener()
+    with _pools_lock:
+        hilos, procesos, _hilos, _procesos = _hilos, _procesos, None, None
+    if hilos is not None:
+        hilos.shutdown(wait=False)
+    if procesos is not None:
+        procesos.shutdown(wait=False, cancel_futures=True)
+
+def iniciar_trabajo(tipo: str, parametros: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Lanza en segundo plano un trabajo largo y devuelve su id, sin esperar a que termine.
+
+    Tipos: 'alertas' (alumnos que no asisten o deben), 'reporte_mensual' (pagos y
+    asistencias por mes; parámetros 'desde'/'hasta' YYYY-MM-DD), 'facturar_mes'
+    (cuotas del mes; 'mes', 'anio', 'simular'), 'mantenimiento'.
+    Después consultar con estado_trabajo(trabajo_id).
+
+    Ejemplo: "armá el reporte de 2025" -> tipo='reporte_mensual', parametros={'desde': '2025-01-01', 'hasta': '2025-12-31'}
+    """
+    print(f"Ejecutando tool: iniciar_trabajo {tipo} con {parametros}")
+    try:
+        trabajo = lanzar(tipo, parametros)
+    except (ValueError, PermissionError) as e:
+        mensaje = f"Permiso denegado: {e}" if isinstance(e, PermissionError) else str(e)
+        return {"status": "error", "message": mensaje, "data": None}
+    return {"status": "success", "message": f"Trabajo {tipo} lanzado con id {trabajo['id']}.", "data": trabajo}
+
+def estado_trabajo(trabajo_id: str) -> Dict[str, Any]:
+    """Estado de un trabajo lanzado con iniciar_trabajo: 'pendiente', 'corriendo', 'terminado' (con 'resultado') o 'error'."""
+    print(f"Ejecutando tool: estado_trabajo {trabajo_id}")
+    trabajo = estado(trabajo_id)
+    if trabajo is None:
+        return {"status": "error", "message": f"No existe el trabajo {trabajo_id}.", "data": None}
+    motivo = sin_permiso(trabajo['tipo']) if trabajo['tipo'] in TIPOS else None
+    if motivo is not None:
+        return {"status": "error", "message": f"Permiso denegado: {motivo}", "data": None}
+    return {"status": "success", "message": f"Trabajo {trabajo['tipo']}: {trabajo['estado']}.", "data": trabajo}
@@ -0,0 +1,169 @@
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from .busqueda import plegar
+from .permisos import requiere_permiso
+from .store import ALUMNOS_PATH, bloqueo_escritura, obtener_coleccion, registro_cambios
+
+# Índices únicos de alumnos: email y teléfono normalizados (y, si se activa,
+# nombre + apellido + sede) -> ids. Con ellos el alta detecta un duplicado con
+# una búsqueda en un dict en lugar de recorrer la colección, y los reintentos
+# del agente no crean dos veces el mismo alumno. El índice se arma una vez y
+# después sigue el log de cambios (cambios.py): cada escritura de alumnos, de
+# este worker o de otro, saca y vuelve a poner solo los alumnos que tocó.
+
+# Campos únicos: 'email', 'telefono' y 'nombre' (nombre + apellido + sede)
+CLAVES = [c.strip() for c in os.environ.get("AGENTE_ALUMNOS_UNICOS", "email,telefono").split(',') if c.strip()]
+# Qué hace el alta con un alumno que ya existe: 'rechazar' (error con el existente) o 'unir' (actualiza el existente)
+DUPLICADOS = os.environ.get("AGENTE_ALUMNOS_DUPLICADOS", "rechazar").lower()
+# Dígitos que se comparan de un teléfono: sin prefijo de país ni de larga distancia
+DIGITOS_TELEFONO = 10
+
+ETIQUETAS = {'email': 'email', 'telefono': 'teléfono', 'nombre': 'nombre, apellido y sede'}
+
+_NO_DIGITOS = re.compile(r"\D+")
+
+def normalizar_email(valor: Any) -> Optional[str]:
+    texto = str(valor or '').strip().lower()
+    return texto if '@' in texto else None
+
+def normalizar_telefono(valor: Any) -> Optional[str]:
+    digitos = _NO_DIGITOS.sub('', str(valor or ''))
+    return digitos[-DIGITOS_TELEFONO:] if len(digitos) >= 6 else None
+
+def normalizar_nombre(alumno: Dict[str, Any]) -> Optional[str]:
+    partes = [' '.join(plegar(alumno.get(c) or '').split()) for c in ('nombre', 'apellido', 'sede')]
+    return '|'.join(partes) if partes[0] and partes[1] else None
+
+NORMALIZADORES: Dict[str, Callable[[Dict[str, Any]], Optional[str]]] = {
+    'email': lambda a: normalizar_email(a.get('email')),
+    'telefono': lambda a: normalizar_telefono(a.get('telefono')),
+    'nombre': normalizar_nombre,
+}
+
+def claves(alumno: Dict[str, Any], campos: Optional[List[str]] = None) -> Dict[str, str]:
+    """Valores normalizados de los campos únicos que el alumno tiene cargados."""
+    resultado = {}
+    for campo in CLAVES if campos is None else campos:
+        valor = NORMALIZADORES[campo](alumno) if campo in NORMALIZADORES else None
+        if valor:
+            resultado[campo] = valor
+    return resultado
+
+class IndiceUnico:
+    """Valor normalizado -> ids de alumnos por cada campo único, al día con el log de cambios.
+
+    Guarda todos los ids de cada valor (no solo uno), así los duplicados que ya
+    estaban en los datos siguen a la vista para el reporte.
+    """
+
+    def __init__(self, campos: List[str]):
+        self._lock = threading.RLock()
+        self.cursor: Optional[int] = None # último seq del log aplicado; None = hay que armarlo
+        self.campos = [c for c in campos if c in NORMALIZADORES]
+        self.alumnos: Dict[Any, Dict[str, Any]] = {}
+        self._claves: Dict[Any, Dict[str, str]] = {}
+        self._por_valor: Dict[str, Dict[str, Set[Any]]] = {campo: {} for campo in self.campos}
+
+    def _sacar(self, alumno_id: Any):
+        self.alumnos.pop(alumno_id, None)
+        for campo, valor in self._claves.pop(alumno_id, {}).items():
+            ids = self._por_valor[campo][valor]
+            ids.discard(alumno_id)
+            if not ids:
+                del self._por_valor[campo][valor]
+
+    def _poner(self, alumno: Dict[str, Any]):
+        self.alumnos[alumno['id']] = alumno
+        self._claves[alumno['id']] = valores = claves(alumno, self.campos)
+        for campo, valor in valores.items():
+            self._por_valor[campo].setdefault(valor, set()).add(alumno['id'])
+
+    def _aplicar(self, entrada: Dict[str, Any]):
+        self._sacar(entrada['id'])
+        if entrada['op'] != 'delete' and isinstance(entrada['registro'], dict):
+            self._poner(entrada['registro'])
+
+    def _reconstruir(self):
+        """Arma el índice desde la colección (con el lock de escritura: todo lo anotado hasta el cursor está en ella)."""
+        self.cursor = registro_cambios.actual()
+        self.alumnos, self._claves = {}, {}
+        self._por_valor = {campo: {} for campo in self.campos}
+        for alumno in obtener_coleccion(ALUMNOS_PATH).registros:
+            if isinstance(alumno, dict) and 'id' in alumno:
+                self._poner(alumno)
+
+    def sincronizar(self):
+        """Aplica los cambios de alumnos anotados en el log desde la última vez."""
+        with self._lock:
+            if self.cursor is not None:
+                self.cursor = registro_cambios.aplicar_desde(self.cursor, 'alumnos', self._aplicar)
+                if self.cursor is not None:
+                    return
+        # Primero el lock de alumnos y después el del índice, en el mismo orden que un alta
+        with bloqueo_escritura(ALUMNOS_PATH), self._lock:
+            if self.cursor is None:
+                self._reconstruir()
+            self.cursor = registro_cambios.aplicar_desde(self.cursor, 'alumnos', self._aplicar)
+
+    def conflictos(self, alumno: Dict[str, Any], excluir: Any = None, anterior: Optional[Dict[str, Any]] = None,
+                   campos: Optional[List[str]] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        """(campo, alumno existente) por cada campo único en el que `alumno` choca con otro.
+
+        Con `anterior` (una modificación) solo cuentan los campos cuyo valor cambia:
+        un duplicado que ya estaba en los datos no impide editar otra cosa.
+        """
+        self.sincronizar()
+        campos = [c for c in (self.campos if campos is None else campos) if c in self.campos]
+        sin_cambio = claves(anterior, campos) if anterior is not None else {}
+        encontrados = []
+        with self._lock:
+            for campo, valor in claves(alumno, campos).items():
+                if sin_cambio.get(campo) == valor:
+                    continue
+                for alumno_id in sorted(self._por_valor[campo].get(valor, ()), key=str):
+                    if alumno_id != excluir:
+                        encontrados.append((campo, self.alumnos[alumno_id]))
+                        break
+        return encontrados
+
+    def duplicados(self, campos: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Grupos de alumnos que comparten el valor normalizado de alguno de `campos` (por defecto, todos)."""
+        self.sincronizar()
+        with self._lock:
+            return [{"campo": campo, "valor": valor, "alumnos": [dict(self.alumnos[i]) for i in sorted(ids, key=str)]}
+                    for campo in self.campos if campos is None or campo in campos
+                    for valor, ids in sorted(self._por_valor[campo].items()) if len(ids) > 1]
+
+# Indexa todos los campos (el reporte puede pedir cualquiera); las altas solo chequean CLAVES
+_indice = IndiceUnico(list(NORMALIZADORES))
+
+def alumno_duplicado(alumno: Dict[str, Any], excluir: Any = None,
+                     anterior: Optional[Dict[str, Any]] = None) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """Primer (campo, alumno existente) con el que `alumno` choca, o None. Una búsqueda por campo."""
+    conflictos = _indice.conflictos(alumno, excluir, anterior, CLAVES)
+    return (conflictos[0][0], dict(conflictos[0][1])) if conflictos else None
+
+def es_reintento(alumno: Dict[str, Any], existente: Dict[str, Any]) -> bool:
+    """Si el alta trae los mismos datos que el alumno existente (p. ej. el agente repitió la llamada)."""
+    return all(existente.get(campo) == valor for campo, valor in alumno.items() if campo != 'id')
+
+def reporte_duplicados(campos: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Alumnos ya cargados que comparten email, teléfono o nombre+apellido+sede (normalizados)."""
+    campos = [c for c in (CLAVES if campos is None else campos) if c in NORMALIZADORES]
+    grupos = _indice.duplicados(campos)
+    afectados = {a['id'] for grupo in grupos for a in grupo['alumnos']}
+    return {"campos": campos, "grupos": grupos, "alumnos_afectados": len(afectados)}
+
+@requiere_permiso('alumnos', accion='read')
+def duplicados_alumnos() -> Dict[str, Any]:
+    """Reporte de alumnos posiblemente duplicados: mismo email, teléfono o nombre+apellido+sede."""
+    print("Ejecutando tool: duplicados_alumnos")
+    reporte = reporte_duplicados(list(NORMALIZADORES))
+    if not reporte["grupos"]:
+        return {"status": "success", "message": "No hay alumnos duplicados.", "data": reporte}
+    return {"status": "success",
+            "message": f"{len(reporte['grupos'])} grupos de posibles duplicados ({reporte['alumnos_afectados']} alumnos).",
+            "data": reporte}
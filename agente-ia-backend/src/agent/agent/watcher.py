@@ -0,0 +1,151 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+# Vigilante de archivos en segundo plano. Usa inotify (Linux) y, si no está
+# disponible, revisa mtime/tamaño cada cierto intervalo. Cuando un archivo
+# registrado cambia llama a su callback desde el thread del vigilante, así el
+# trabajo de recarga nunca cae en un request.
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+_MASCARA = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENTO = struct.Struct('iIII')
+
+# Tiempo que se espera a que se calme una ráfaga de eventos antes de recargar
+DEBOUNCE_SEGUNDOS = 0.05
+
+class _Inotify:
+    """Envoltura mínima de inotify vía ctypes (sin dependencias externas)."""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._libc = libc
+        self.fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 falló')
+        self.directorios: Dict[int, str] = {}
+
+    def vigilar(self, directorio: str):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directorio), _MASCARA)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f'inotify_add_watch falló para {directorio}')
+        self.directorios[wd] = directorio
+
+    def leer(self, timeout: float) -> Tuple[List[str], bool]:
+        """Devuelve las rutas que tuvieron eventos y si hubo desborde de la cola."""
+        listos, _, _ = select.select([self.fd], [], [], timeout)
+        if not listos:
+            return [], False
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return [], False
+        rutas, desborde, i = [], False, 0
+        while i + _EVENTO.size <= len(buffer):
+            wd, mascara, _, largo = _EVENTO.unpack_from(buffer, i)
+            nombre = buffer[i + _EVENTO.size:i + _EVENTO.size + largo].rstrip(b'\0')
+            i += _EVENTO.size + largo
+            if mascara & IN_Q_OVERFLOW:
+                desborde = True
+            elif wd in self.directorios and nombre:
+                rutas.append(os.path.join(self.directorios[wd], os.fsdecode(nombre)))
+        return rutas, desborde
+
+    def cerrar(self):
+        os.close(self.fd)
+
+class Vigilante:
+    """Llama a un callback cuando cambia alguno de los archivos registrados."""
+
+    def __init__(self, intervalo_polling: float = 1.0):
+        self.intervalo_polling = intervalo_polling
+        self._callbacks: Dict[str, List[Callable[[str], None]]] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._detener = threading.Event()
+        self.modo: Optional[str] = None
+
+    def agregar(self, filepath: str, callback: Callable[[str], None]):
+        """Registra un archivo (puede no existir todavía). Hay que llamarlo antes de iniciar()."""
+        self._callbacks.setdefault(os.path.abspath(filepath), []).append(callback)
+
+    def iniciar(self):
+        if self._thread is not None:
+            return
+        self._detener.clear()
+        try:
+            inotify = _Inotify()
+            for directorio in {os.path.dirname(p) for p in self._callbacks}:
+                if os.path.isdir(directorio):
+                    inotify.vigilar(directorio)
+            self.modo = 'inotify'
+            objetivo = lambda: self._bucle_inotify(inotify)
+        except (OSError, AttributeError) as e:
+            # Sin inotify (macOS, algunos contenedores): polling de mtime/tamaño
+            print(f"inotify no disponible ({e}), vigilando datos por polling cada {self.intervalo_polling}s")
+            self.modo = 'polling'
+            # Las firmas iniciales se toman acá y no en el thread, para no perder cambios del arranque
+            firmas = {ruta: self._firma(ruta) for ruta in self._callbacks}
+            objetivo = lambda: self._bucle_polling(firmas)
+        self._thread = threading.Thread(target=objetivo, name='vigilante-datos', daemon=True)
+        self._thread.start()
+
+    def detener(self):
+        self._detener.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _notificar(self, rutas: Set[str]):
+        for ruta in rutas:
+            for callback in self._callbacks.get(ruta, []):
+                try:
+                    callback(ruta)
+                except Exception as e:
+                    print(f"Error recargando {ruta}: {e}")
+
+    def _bucle_inotify(self, inotify: _Inotify):
+        try:
+            while not self._detener.is_set():
+                rutas, desborde = inotify.leer(timeout=0.5)
+                if not rutas and not desborde:
+                    continue
+                pendientes = set(rutas)
+                # Juntar el resto de la ráfaga (un editor puede generar varios eventos)
+                while True:
+                    mas, mas_desborde = inotify.leer(timeout=DEBOUNCE_SEGUNDOS)
+                    if not mas and not mas_desborde:
+                        break
+                    pendientes.update(mas)
+                    desborde = desborde or mas_desborde
+                if desborde:
+                    # Se perdieron eventos: revisar todos los archivos
+                    pendientes = set(self._callbacks)
+                self._notificar(pendientes & set(self._callbacks))
+        finally:
+            inotify.cerrar()
+
+    def _bucle_polling(self, firmas: Dict[str, Optional[Tuple[int, int]]]):
+        while not self._detener.wait(self.intervalo_polling):
+            cambiados = set()
+            for ruta in self._callbacks:
+                firma = self._firma(ruta)
+                if firma != firmas[ruta]:
+                    firmas[ruta] = firma
+                    cambiados.add(ruta)
+            self._notificar(cambiados)
+
+    @staticmethod
+    def _firma(ruta: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(ruta)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)